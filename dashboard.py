@@ -2,7 +2,19 @@ import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
-from utils.data_manager import carregar_dados_base, formatar_valor_reais
+from utils.aquecimento import exibir_estado_aquecimento, iniciar_aquecimento
+from utils.data_manager import (
+    formatar_valor_reais,
+    get_agregacoes_principais,
+    figura_em_cache,
+    get_arvore_funcoes,
+    get_dados_anuais,
+    get_dados_entidade,
+    get_resumo_distribuicao
+)
+from utils.distribuicao import figura_resumos
+from utils.hierarquia import figura_treemap
+from utils.municipios import nome_exibicao
 
 st.set_page_config(
     page_title="Dashboard - Repasses Cotia",
@@ -12,28 +24,28 @@ st.set_page_config(
 
 def main():
     st.title("📊 Dashboard - Análise de Repasses Governamentais de Cotia")
+
+    # Prepara, em segundo plano, os caches que as páginas usam (uma vez por processo)
+    iniciar_aquecimento()
+    exibir_estado_aquecimento()
     
     try:
-        # Carregar dados uma única vez e salvar na sessão
-        if 'df_cotia' not in st.session_state:
-            df_cotia = carregar_dados_base('cotia')
-            if df_cotia is None or df_cotia.empty:
-                st.error("Erro ao carregar os dados. Verifique se o arquivo de dados existe e está acessível.")
-                return
-            st.session_state['df_cotia'] = df_cotia
-        else:
-            df_cotia = st.session_state['df_cotia']
+        # Agregações pré-calculadas de Cotia (mediana exata: é o número em destaque)
+        totais = get_agregacoes_principais('cotia', exato=True)
+        if totais['contagem_total'] == 0:
+            st.error("Erro ao carregar os dados. Verifique se o arquivo de dados existe e está acessível.")
+            return
         
         # Métricas Principais
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total de Repasses", formatar_valor_reais(df_cotia['vl_pago'].sum()))
+            st.metric("Total de Repasses", formatar_valor_reais(totais['total_geral']))
         with col2:
-            st.metric("Número de Entidades", f"{df_cotia['razao_social'].nunique():,}")
+            st.metric("Número de Entidades", f"{totais['entidades_unicas']:,}")
         with col3:
-            st.metric("Total de Operações", f"{len(df_cotia):,}")
+            st.metric("Total de Operações", f"{totais['contagem_total']:,}")
         with col4:
-            st.metric("Média por Repasse", formatar_valor_reais(df_cotia['vl_pago'].mean()))
+            st.metric("Média por Repasse", formatar_valor_reais(totais['media_geral']))
 
         # Tabs para diferentes visualizações
         tab1, tab2, tab3, tab4 = st.tabs(["Evolução Temporal", "Distribuição por Função", "Top Entidades", "Estatísticas"])
@@ -41,58 +53,60 @@ def main():
         with tab1:
             st.subheader("Evolução dos Repasses ao Longo do Tempo")
             
-            # Análise Temporal
-            df_anual = df_cotia.groupby('exercicio').agg({
-                'vl_pago': ['sum', 'mean']
-            }).round(2)
-            
-            # Gráfico de evolução
-            fig_temporal = go.Figure()
-            fig_temporal.add_trace(go.Bar(
-                x=df_anual.index,
-                y=df_anual[('vl_pago', 'sum')],
-                name='Total Anual',
-                hovertemplate="Ano: %{x}<br>Total: " + "R$ %{y:,.2f}<extra></extra>"
-            ))
-            fig_temporal.add_trace(go.Scatter(
-                x=df_anual.index,
-                y=df_anual[('vl_pago', 'mean')],
-                name='Média por Repasse',
-                yaxis='y2',
-                hovertemplate="Ano: %{x}<br>Média: " + "R$ %{y:,.2f}<extra></extra>"
-            ))
-            fig_temporal.update_layout(
-                title='Evolução dos Repasses ao Longo dos Anos',
-                yaxis=dict(
-                    title='Total de Repasses (R$)',
-                    tickformat=',.2f',
-                    tickprefix='R$ '
-                ),
-                yaxis2=dict(
-                    title='Média por Repasse (R$)',
-                    overlaying='y',
-                    side='right',
-                    tickformat=',.2f',
-                    tickprefix='R$ '
+            # Gráfico de evolução (os dados só são lidos quando a figura não está no cache)
+            def grafico_temporal():
+                df_anual = get_dados_anuais('cotia')
+                fig_temporal = go.Figure()
+                fig_temporal.add_trace(go.Bar(
+                    x=df_anual.index,
+                    y=df_anual['soma'],
+                    name='Total Anual',
+                    hovertemplate="Ano: %{x}<br>Total: " + "R$ %{y:,.2f}<extra></extra>"
+                ))
+                fig_temporal.add_trace(go.Scatter(
+                    x=df_anual.index,
+                    y=df_anual['media'],
+                    name='Média por Repasse',
+                    yaxis='y2',
+                    hovertemplate="Ano: %{x}<br>Média: " + "R$ %{y:,.2f}<extra></extra>"
+                ))
+                fig_temporal.update_layout(
+                    title='Evolução dos Repasses ao Longo dos Anos',
+                    yaxis=dict(
+                        title='Total de Repasses (R$)',
+                        tickformat=',.2f',
+                        tickprefix='R$ '
+                    ),
+                    yaxis2=dict(
+                        title='Média por Repasse (R$)',
+                        overlaying='y',
+                        side='right',
+                        tickformat=',.2f',
+                        tickprefix='R$ '
+                    )
                 )
-            )
-            st.plotly_chart(fig_temporal, use_container_width=True)
+                return fig_temporal
+
+            st.plotly_chart(figura_em_cache('dashboard.temporal', grafico_temporal), use_container_width=True)
 
         with tab2:
             st.subheader("Distribuição por Função de Governo")
             
-            # Gráfico de distribuição por função
-            fig_funcao = px.treemap(
-                df_cotia,
-                path=['funcao_de_governo'],
-                values='vl_pago',
-                title='Distribuição dos Repasses por Função de Governo'
-            )
-            fig_funcao.update_traces(
-                textinfo="label+value",
-                texttemplate="%{label}<br>R$ %{value:,.2f}"
+            # Treemap a partir dos totais por função; as entidades só são agregadas nas funções abertas
+            abertas = st.multiselect(
+                "Detalhar por entidade:",
+                totais['funcoes_unicas'],
+                help="As entidades de cada função selecionada aparecem dentro do seu retângulo"
             )
-            st.plotly_chart(fig_funcao, use_container_width=True)
+
+            def grafico_funcao():
+                return figura_treemap(
+                    get_arvore_funcoes('cotia', abertas),
+                    nome_exibicao('cotia'),
+                    'Distribuição dos Repasses por Função de Governo'
+                )
+
+            st.plotly_chart(figura_em_cache('dashboard.funcao', grafico_funcao, abertas=sorted(abertas)), use_container_width=True)
 
         with tab3:
             st.subheader("Top Entidades Beneficiadas")
@@ -100,47 +114,36 @@ def main():
             # Análise das Entidades
             n_top = st.slider("Número de entidades:", 5, 20, 10)
             
-            df_entidades = df_cotia.groupby('razao_social').agg({
-                'vl_pago': 'sum',
-                'funcao_de_governo': lambda x: ', '.join(set(x))
-            }).sort_values('vl_pago', ascending=False).head(n_top)
-            
-            # Gráfico das top entidades
-            fig_entidades = px.bar(
-                df_entidades.reset_index(),
-                x='razao_social',
-                y='vl_pago',
-                title=f'Top {n_top} Entidades por Valor Total de Repasses',
-                labels={'razao_social': 'Entidade', 'vl_pago': 'Valor Total (R$)'}
-            )
-            fig_entidades.update_traces(
-                hovertemplate="Entidade: %{x}<br>Total: R$ %{y:,.2f}<extra></extra>"
-            )
-            fig_entidades.update_layout(
-                xaxis_tickangle=45,
-                yaxis=dict(tickformat=',.2f', tickprefix='R$ ')
-            )
-            st.plotly_chart(fig_entidades, use_container_width=True)
+            def grafico_entidades():
+                df_entidades = get_dados_entidade('cotia', top_n=n_top)
+
+                # Gráfico das top entidades
+                fig_entidades = px.bar(
+                    df_entidades.reset_index(),
+                    x='entidade',
+                    y='soma',
+                    title=f'Top {n_top} Entidades por Valor Total de Repasses',
+                    labels={'entidade': 'Entidade', 'soma': 'Valor Total (R$)'}
+                )
+                fig_entidades.update_traces(
+                    hovertemplate="Entidade: %{x}<br>Total: R$ %{y:,.2f}<extra></extra>"
+                )
+                fig_entidades.update_layout(
+                    xaxis_tickangle=45,
+                    yaxis=dict(tickformat=',.2f', tickprefix='R$ ')
+                )
+                return fig_entidades
+
+            st.plotly_chart(figura_em_cache('dashboard.entidades', grafico_entidades, n_top=n_top), use_container_width=True)
 
         with tab4:
             st.subheader("Estatísticas e Distribuição")
             
-            # Box plot
-            fig_dist = go.Figure()
-            fig_dist.add_trace(go.Box(
-                y=df_cotia['vl_pago'],
-                name='Distribuição dos Valores',
-                boxpoints='outliers',
-                hovertemplate="Valor: R$ %{y:,.2f}<extra></extra>"
+            # Box plot a partir dos quartis e atípicos calculados no servidor
+            fig_dist = figura_em_cache('dashboard.distribuicao', lambda: figura_resumos(
+                {'Distribuição dos Valores': get_resumo_distribuicao('cotia')},
+                'Distribuição dos Valores dos Repasses'
             ))
-            fig_dist.update_layout(
-                title='Distribuição dos Valores dos Repasses',
-                yaxis=dict(
-                    title='Valor (R$)',
-                    tickformat=',.2f',
-                    tickprefix='R$ '
-                )
-            )
             st.plotly_chart(fig_dist, use_container_width=True)
 
             # Estatísticas detalhadas
@@ -156,14 +159,14 @@ def main():
                     'Número de Operações'
                 ],
                 'Valor': [
-                    df_cotia['vl_pago'].sum(),
-                    df_cotia['vl_pago'].mean(),
-                    df_cotia['vl_pago'].median(),
-                    df_cotia['vl_pago'].std(),
-                    df_cotia['vl_pago'].min(),
-                    df_cotia['vl_pago'].max(),
-                    df_cotia['razao_social'].nunique(),
-                    len(df_cotia)
+                    totais['total_geral'],
+                    totais['media_geral'],
+                    totais['mediana_geral'],
+                    totais['desvio_padrao'],
+                    totais['minimo'],
+                    totais['maximo'],
+                    totais['entidades_unicas'],
+                    totais['contagem_total']
                 ]
             })
             
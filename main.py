@@ -1,4 +1,6 @@
-from scripts.cotia import repasses_cotia
+import sys
+
+from scripts.relatorio import main
 
 if __name__ == '__main__':
-    repasses_cotia()
\ No newline at end of file
+    sys.exit(main())
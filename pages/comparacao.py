@@ -1,8 +1,17 @@
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
-import pandas as pd
-from utils.data_manager import carregar_dados_comparacao, formatar_valor_reais
+from utils.aquecimento import exibir_estado_aquecimento, iniciar_aquecimento
+from utils.cubo import agregar_cubo, top_n_por_grupo
+from utils.data_manager import (
+    carregar_cubo,
+    figura_em_cache,
+    formatar_colunas_reais,
+    formatar_valor_reais,
+    get_ano_base_ipca,
+    get_municipios
+)
+from utils.municipios import MUNICIPIOS_COMPARACAO, cor_municipio, mapa_cores, nome_exibicao
 
 st.set_page_config(
     page_title="Comparação - Municípios SP",
@@ -10,86 +19,101 @@ st.set_page_config(
     layout="wide"
 )
 
+# Modo de normalização -> soma do cubo usada no lugar da soma nominal
+NORMALIZACOES = {
+    "Valores nominais": 'soma',
+    "Valores reais (IPCA)": 'soma_real',
+    "Por habitante": 'soma_per_capita',
+    "Reais por habitante": 'soma_real_per_capita'
+}
+
+def normalizar(resultado, medida):
+    """Substitui soma e média pelos valores da normalização escolhida."""
+    soma = resultado[medida]
+    return resultado.assign(soma=soma, media=soma / resultado['contagem'])
+
+def em_grade(itens, por_linha=5):
+    """Distribui os itens em linhas de até `por_linha` colunas, retornando (coluna, item)."""
+    for inicio in range(0, len(itens), por_linha):
+        linha = itens[inicio:inicio + por_linha]
+        for coluna, item in zip(st.columns(min(por_linha, len(itens))), linha):
+            yield coluna, item
+
+def figura_temporal(matriz, medida):
+    """
+    Uma linha por município a partir da matriz ano x município.
+    Args:
+        matriz (DataFrame): Anos no índice, municípios nas colunas
+        medida (str): Nome da medida exibido na legenda e no hover ('Total', 'Média')
+    Returns:
+        Figure: Todas as linhas, criadas de uma vez
+    """
+    anos = matriz.index.to_numpy()
+    return go.Figure(data=[
+        go.Scatter(
+            x=anos,
+            y=matriz[cidade].to_numpy(),
+            name=f'{nome_exibicao(cidade)} - {medida}',
+            mode='lines+markers',
+            marker_color=cor_municipio(cidade),
+            line_color=cor_municipio(cidade),
+            hovertemplate=f"{nome_exibicao(cidade)}<br>Ano: %{{x}}<br>{medida}: %{{y:,.2f}}<extra></extra>"
+        )
+        for cidade in matriz.columns
+    ])
+
 def main():
-    st.title(" Comparação: Cotia, Itapevi, Barueri, Jandira e Taboão da Serra")
+    st.title(" Comparação entre Municípios")
+
+    # Prepara, em segundo plano, os caches que as páginas usam (uma vez por processo)
+    iniciar_aquecimento()
+    exibir_estado_aquecimento()
     
     try:
-        # Carregar dados de comparação
-        df = carregar_dados_comparacao()
-        
-        if df is None or df.empty:
-            st.error("Erro ao carregar os dados para comparação. Verifique se o arquivo de dados existe e está acessível.")
-            return
-        
-        # Verificar se temos dados para todos os municípios
-        municipios = df['municipio'].unique()
-        municipios_esperados = ['cotia', 'itapevi', 'barueri', 'jandira', 'taboão da serra']
-        municipios_faltando = [m for m in municipios_esperados if m not in municipios]
+        disponiveis = get_municipios()
         
+        # Verificar se temos dados para todos os municípios da seleção padrão
+        municipios_faltando = [m for m in MUNICIPIOS_COMPARACAO if m not in disponiveis]
         if municipios_faltando:
             st.warning(f"Dados incompletos: não foram encontrados dados para {', '.join(municipios_faltando)}.")
         
-        # Métricas Gerais por Município
-        st.header("Métricas Gerais")
-        
-        # Calcular métricas por município
-        metricas = df.groupby('municipio').agg({
-            'vl_pago': ['sum', 'mean', 'count'],
-            'razao_social': 'nunique'
-        }).round(2)
-        
-        # Organizar métricas em colunas
-        col1, col2, col3, col4, col5 = st.columns(5)
+        municipios = st.multiselect(
+            "Municípios comparados:",
+            disponiveis,
+            default=[m for m in MUNICIPIOS_COMPARACAO if m in disponiveis],
+            format_func=nome_exibicao
+        )
+        if not municipios:
+            st.info("Selecione ao menos um município para comparar.")
+            return
         
-        with col1:
-            st.subheader("Cotia")
-            if 'cotia' in municipios:
-                st.metric("Total de Repasses", formatar_valor_reais(metricas.loc['cotia', ('vl_pago', 'sum')]))
-                st.metric("Média por Repasse", formatar_valor_reais(metricas.loc['cotia', ('vl_pago', 'mean')]))
-                st.metric("Número de Operações", f"{metricas.loc['cotia', ('vl_pago', 'count')]:,}")
-                st.metric("Número de Entidades", f"{metricas.loc['cotia', ('razao_social', 'nunique')]:,}")
-            else:
-                st.info("Dados não disponíveis para Cotia")
+        cubo = carregar_cubo(municipios)
+        if cubo.empty:
+            st.error("Erro ao carregar os dados para comparação. Verifique se o arquivo de dados existe e está acessível.")
+            return
         
-        with col2:
-            st.subheader("Itapevi")
-            if 'itapevi' in municipios:
-                st.metric("Total de Repasses", formatar_valor_reais(metricas.loc['itapevi', ('vl_pago', 'sum')]))
-                st.metric("Média por Repasse", formatar_valor_reais(metricas.loc['itapevi', ('vl_pago', 'mean')]))
-                st.metric("Número de Operações", f"{metricas.loc['itapevi', ('vl_pago', 'count')]:,}")
-                st.metric("Número de Entidades", f"{metricas.loc['itapevi', ('razao_social', 'nunique')]:,}")
-            else:
-                st.info("Dados não disponíveis para Itapevi")
+        # Normalização: as somas reais e por habitante já estão no cubo
+        modos = [modo for modo, medida in NORMALIZACOES.items() if medida in cubo]
+        modo = st.radio("Valores:", modos, horizontal=True)
+        medida = NORMALIZACOES[modo]
+        if medida in ('soma_real', 'soma_real_per_capita'):
+            st.caption(f"Valores corrigidos pelo IPCA para preços de dezembro de {get_ano_base_ipca()}.")
+        if medida in ('soma_per_capita', 'soma_real_per_capita'):
+            st.caption("Valores divididos pela população do município no ano (Censos IBGE 2010 e 2022, interpolados).")
         
-        with col3:
-            st.subheader("Barueri")
-            if 'barueri' in municipios:
-                st.metric("Total de Repasses", formatar_valor_reais(metricas.loc['barueri', ('vl_pago', 'sum')]))
-                st.metric("Média por Repasse", formatar_valor_reais(metricas.loc['barueri', ('vl_pago', 'mean')]))
-                st.metric("Número de Operações", f"{metricas.loc['barueri', ('vl_pago', 'count')]:,}")
-                st.metric("Número de Entidades", f"{metricas.loc['barueri', ('razao_social', 'nunique')]:,}")
-            else:
-                st.info("Dados não disponíveis para Barueri")
+        # Métricas Gerais por Município
+        st.header("Métricas Gerais")
         
-        with col4:
-            st.subheader("Jandira")
-            if 'jandira' in municipios:
-                st.metric("Total de Repasses", formatar_valor_reais(metricas.loc['jandira', ('vl_pago', 'sum')]))
-                st.metric("Média por Repasse", formatar_valor_reais(metricas.loc['jandira', ('vl_pago', 'mean')]))
-                st.metric("Número de Operações", f"{metricas.loc['jandira', ('vl_pago', 'count')]:,}")
-                st.metric("Número de Entidades", f"{metricas.loc['jandira', ('razao_social', 'nunique')]:,}")
-            else:
-                st.info("Dados não disponíveis para Jandira")
+        # Calcular métricas de todos os municípios de uma vez, na ordem da seleção
+        metricas = normalizar(agregar_cubo(cubo, ['municipio']), medida).round(2).loc[municipios]
         
-        with col5:
-            st.subheader("Taboão da Serra")
-            if 'taboão da serra' in municipios:
-                st.metric("Total de Repasses", formatar_valor_reais(metricas.loc['taboão da serra', ('vl_pago', 'sum')]))
-                st.metric("Média por Repasse", formatar_valor_reais(metricas.loc['taboão da serra', ('vl_pago', 'mean')]))
-                st.metric("Número de Operações", f"{metricas.loc['taboão da serra', ('vl_pago', 'count')]:,}")
-                st.metric("Número de Entidades", f"{metricas.loc['taboão da serra', ('razao_social', 'nunique')]:,}")
-            else:
-                st.info("Dados não disponíveis para Taboão da Serra")
+        for coluna, linha in em_grade(list(metricas.itertuples())):
+            with coluna:
+                st.subheader(nome_exibicao(linha.Index))
+                st.metric("Total de Repasses", formatar_valor_reais(linha.soma))
+                st.metric("Média por Repasse", formatar_valor_reais(linha.media))
+                st.metric("Número de Operações", f"{linha.contagem:,}")
+                st.metric("Número de Entidades", f"{linha.entidades:,}")
         
         # Análises Comparativas
         st.header("Análises Comparativas")
@@ -101,121 +125,76 @@ def main():
         ])
         
         with tab1:
-            # Evolução temporal dos repasses
-            df_temporal = df.groupby(['municipio', 'exercicio'])['vl_pago'].agg(['sum', 'mean']).reset_index()
-            
-            # Gráfico de linha para total anual
-            fig_temporal = go.Figure()
-            
-            cores = {
-                'cotia': 'blue',
-                'itapevi': 'red',
-                'barueri': 'yellow',
-                'jandira': 'green',
-                'taboão da serra': 'purple'
-            }
-            
-            for cidade in municipios:
-                dados_cidade = df_temporal[df_temporal['municipio'] == cidade]
-                nome_cidade = 'Taboão da Serra' if cidade == 'taboão da serra' else cidade.title()
-                
-                fig_temporal.add_trace(go.Scatter(
-                    x=dados_cidade['exercicio'],
-                    y=dados_cidade['sum'],
-                    name=f'{nome_cidade} - Total',
-                    mode='lines+markers',
-                    marker_color=cores.get(cidade, 'purple'),
-                    hovertemplate=f"{nome_cidade}<br>Ano: %{{x}}<br>Total: %{{y:,.2f}}<extra></extra>"
-                ))
-            
-            fig_temporal.update_layout(
-                title='Evolução dos Repasses ao Longo dos Anos',
-                xaxis_title='Ano',
-                yaxis=dict(
-                    title='Total de Repasses (R$)',
-                    tickformat=',.2f',
-                    tickprefix='R$ '
-                ),
-                hovermode='x unified',
-                legend_title="Município"
-            )
-            st.plotly_chart(fig_temporal, use_container_width=True)
-            
-            # Gráfico de linha para média anual
-            fig_media = go.Figure()
-            
-            for cidade in municipios:
-                dados_cidade = df_temporal[df_temporal['municipio'] == cidade]
-                nome_cidade = 'Taboão da Serra' if cidade == 'taboão da serra' else cidade.title()
-                
-                fig_media.add_trace(go.Scatter(
-                    x=dados_cidade['exercicio'],
-                    y=dados_cidade['mean'],
-                    name=f'{nome_cidade} - Média',
-                    mode='lines+markers',
-                    marker_color=cores.get(cidade, 'purple'),
-                    hovertemplate=f"{nome_cidade}<br>Ano: %{{x}}<br>Média: %{{y:,.2f}}<extra></extra>"
-                ))
-            
-            fig_media.update_layout(
-                title='Evolução da Média de Repasses ao Longo dos Anos',
-                xaxis_title='Ano',
-                yaxis=dict(
-                    title='Média de Repasses (R$)',
-                    tickformat=',.2f',
-                    tickprefix='R$ '
-                ),
-                hovermode='x unified',
-                legend_title="Município"
-            )
-            st.plotly_chart(fig_media, use_container_width=True)
+            # Evolução temporal: matriz ano x município, com um único agrupamento
+            matriz = normalizar(agregar_cubo(cubo, ['exercicio', 'municipio']), medida)[['soma', 'media']].unstack('municipio')
+            
+            def grafico_temporal():
+                fig_temporal = figura_temporal(matriz['soma'].reindex(columns=municipios), 'Total')
+                fig_temporal.update_layout(
+                    title='Evolução dos Repasses ao Longo dos Anos',
+                    xaxis_title='Ano',
+                    yaxis=dict(
+                        title='Total de Repasses (R$)',
+                        tickformat=',.2f',
+                        tickprefix='R$ '
+                    ),
+                    hovermode='x unified',
+                    legend_title="Município"
+                )
+                return fig_temporal
+
+            st.plotly_chart(figura_em_cache('comparacao.temporal', grafico_temporal, municipios=municipios, medida=medida), use_container_width=True)
+            
+            def grafico_media():
+                fig_media = figura_temporal(matriz['media'].reindex(columns=municipios), 'Média')
+                fig_media.update_layout(
+                    title='Evolução da Média de Repasses ao Longo dos Anos',
+                    xaxis_title='Ano',
+                    yaxis=dict(
+                        title='Média de Repasses (R$)',
+                        tickformat=',.2f',
+                        tickprefix='R$ '
+                    ),
+                    hovermode='x unified',
+                    legend_title="Município"
+                )
+                return fig_media
+
+            st.plotly_chart(figura_em_cache('comparacao.media', grafico_media, municipios=municipios, medida=medida), use_container_width=True)
         
         with tab2:
             # Comparação por função de governo
-            df_funcao = df.groupby(['municipio', 'funcao_de_governo'])['vl_pago'].sum().reset_index()
-            
-            # Mapa de nomes de município para exibição
-            nomes_municipios = {
-                'cotia': 'Cotia',
-                'itapevi': 'Itapevi',
-                'taboão da serra': 'Taboão da Serra',
-                'jandira': 'Jandira',
-                'barueri': 'Barueri'
-            }
+            df_funcao = agregar_cubo(cubo, ['municipio', 'funcao_de_governo'])[medida].rename('vl_pago').reset_index()
             
-            df_funcao['municipio_exibicao'] = df_funcao['municipio'].map(nomes_municipios)
+            df_funcao['municipio_exibicao'] = df_funcao['municipio'].map(nome_exibicao)
             
             # Gráfico de barras lado a lado
-            fig_funcao = px.bar(
-                df_funcao[df_funcao['municipio'].isin(municipios)],
-                x='funcao_de_governo',
-                y='vl_pago',
-                color='municipio_exibicao',
-                barmode='group',
-                title='Distribuição dos Repasses por Função de Governo',
-                labels={
-                    'funcao_de_governo': 'Função de Governo',
-                    'vl_pago': 'Total de Repasses (R$)',
-                    'municipio_exibicao': 'Município'
-                },
-                color_discrete_map={
-                    'Cotia': 'blue',
-                    'Itapevi': 'red',
-                    'Taboão da Serra': 'green',
-                    'Jandira': 'yellow',
-                    'Barueri': 'purple'
-                }
-            )
-            fig_funcao.update_layout(
-                xaxis_tickangle=45,
-                yaxis=dict(tickformat=',.2f', tickprefix='R$ '),
-                legend_title="Município"
-            )
-            fig_funcao.update_traces(
-                hovertemplate="Município: %{customdata}<br>Função: %{x}<br>Total: R$ %{y:,.2f}<extra></extra>",
-                customdata=df_funcao['municipio_exibicao']
-            )
-            st.plotly_chart(fig_funcao, use_container_width=True)
+            def grafico_funcao():
+                fig_funcao = px.bar(
+                    df_funcao,
+                    x='funcao_de_governo',
+                    y='vl_pago',
+                    color='municipio_exibicao',
+                    barmode='group',
+                    title='Distribuição dos Repasses por Função de Governo',
+                    labels={
+                        'funcao_de_governo': 'Função de Governo',
+                        'vl_pago': 'Total de Repasses (R$)',
+                        'municipio_exibicao': 'Município'
+                    },
+                    color_discrete_map=mapa_cores(municipios)
+                )
+                fig_funcao.update_layout(
+                    xaxis_tickangle=45,
+                    yaxis=dict(tickformat=',.2f', tickprefix='R$ '),
+                    legend_title="Município"
+                )
+                fig_funcao.update_traces(
+                    hovertemplate="Município: %{fullData.name}<br>Função: %{x}<br>Total: R$ %{y:,.2f}<extra></extra>"
+                )
+                return fig_funcao
+
+            st.plotly_chart(figura_em_cache('comparacao.funcao', grafico_funcao, municipios=municipios, medida=medida), use_container_width=True)
             
             # Tabela comparativa
             st.subheader("Tabela Comparativa por Função")
@@ -226,82 +205,26 @@ def main():
             ).round(2)
             
             # Renomear colunas para exibição
-            st.dataframe(
-                df_funcao_pivot.style.format({
-                    col: lambda x: formatar_valor_reais(x) if pd.notna(x) else "-" 
-                    for col in df_funcao_pivot.columns
-                })
-            )
+            st.dataframe(formatar_colunas_reais(df_funcao_pivot, df_funcao_pivot.columns, nulo="-"))
         
         with tab3:
             # Top entidades por município
             st.subheader("Top 10 Entidades por Município")
             
-            # Calcular top entidades para cada município
-            df_entidades = df.groupby(['municipio', 'razao_social'])['vl_pago'].sum().reset_index()
-            
-            # Criar quatro colunas para mostrar os tops lado a lado
-            col1, col2, col3, col4, col5 = st.columns(5)
-            
-            with col1:
-                st.subheader("Cotia")
-                if 'cotia' in municipios:
-                    top_cotia = df_entidades[df_entidades['municipio'] == 'cotia'].nlargest(10, 'vl_pago')
-                    st.dataframe(
-                        top_cotia[['razao_social', 'vl_pago']].style.format({
-                            'vl_pago': lambda x: formatar_valor_reais(x)
-                        })
-                    )
-                else:
-                    st.info("Dados não disponíveis para Cotia")
-            
-            with col2:
-                st.subheader("Itapevi")
-                if 'itapevi' in municipios:
-                    top_itapevi = df_entidades[df_entidades['municipio'] == 'itapevi'].nlargest(10, 'vl_pago')
-                    st.dataframe(
-                        top_itapevi[['razao_social', 'vl_pago']].style.format({
-                            'vl_pago': lambda x: formatar_valor_reais(x)
-                        })
-                    )
-                else:
-                    st.info("Dados não disponíveis para Itapevi")
-            
-            with col3:
-                st.subheader("Taboão da Serra")
-                if 'taboão da serra' in municipios:
-                    top_taboao = df_entidades[df_entidades['municipio'] == 'taboão da serra'].nlargest(10, 'vl_pago')
-                    st.dataframe(
-                        top_taboao[['razao_social', 'vl_pago']].style.format({
-                            'vl_pago': lambda x: formatar_valor_reais(x)
-                        })
-                    )
-                else:
-                    st.info("Dados não disponíveis para Taboão da Serra")
-            
-            with col4:
-                st.subheader("Jandira")
-                if 'jandira' in municipios:
-                    top_jandira = df_entidades[df_entidades['municipio'] == 'jandira'].nlargest(10, 'vl_pago')
-                    st.dataframe(
-                        top_jandira[['razao_social', 'vl_pago']].style.format({
-                            'vl_pago': lambda x: formatar_valor_reais(x)
-                        })
-                    )
-                else:
-                    st.info("Dados não disponíveis para Jandira")
-            
-            with col5:
-                st.subheader("Barueri")
-                if 'barueri' in municipios:
-                    top_barueri = df_entidades[df_entidades['municipio'] == 'barueri'].nlargest(10, 'vl_pago')
-                    st.dataframe(
-                        top_barueri[['razao_social', 'vl_pago']].style.format({
-                            'vl_pago': lambda x: formatar_valor_reais(x)
-                        })
-                    )
-                else:
-                    st.info("Dados não disponíveis para Barueri")
+            # Top 10 de todos os municípios em uma única ordenação
+            df_entidades = agregar_cubo(cubo, ['municipio', 'entidade'])[medida].rename('vl_pago').reset_index()
+            top_entidades = top_n_por_grupo(df_entidades, 'municipio', 'vl_pago', 10)
+            tops = dict(tuple(top_entidades.groupby('municipio', observed=True, sort=False)))
+            
+            for coluna, municipio in em_grade(municipios):
+                with coluna:
+                    st.subheader(nome_exibicao(municipio))
+                    if municipio in tops:
+                        st.dataframe(
+                            formatar_colunas_reais(tops[municipio][['entidade', 'vl_pago']], ['vl_pago'])
+                        )
+                    else:
+                        st.info(f"Dados não disponíveis para {nome_exibicao(municipio)}")
 
     except Exception as e:
         st.error(f"Erro ao processar os dados: {str(e)}")
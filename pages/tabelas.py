@@ -1,7 +1,27 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from utils.data_manager import formatar_valor_reais as fvr
+from utils.data_manager import (
+    consultar_linhas,
+    figura_em_cache,
+    formatar_colunas_reais,
+    formatar_valor_reais as fvr,
+    get_agregacoes_principais,
+    get_atipicos,
+    get_caixas,
+    get_colunas_repasses,
+    get_concentracao,
+    get_dados_anuais,
+    get_dados_entidade,
+    get_dados_funcao,
+    get_estatisticas,
+    get_resumo_distribuicao
+)
+from utils.anomalias import COLUNAS_ANOMALIA, FATOR_IQR, LIMIAR_Z
+from utils.aquecimento import exibir_estado_aquecimento, iniciar_aquecimento
+from utils.distribuicao import figura_caixas, figura_histograma, figura_resumos
+from utils.grade import total_paginas
+from utils.referencia import COLUNAS_ENRIQUECIDAS
 
 st.set_page_config(
     page_title="Tabelas - Repasses Cotia",
@@ -11,13 +31,17 @@ st.set_page_config(
 
 def main():
     st.title("Visualização Detalhada das Tabelas")
+
+    # Prepara, em segundo plano, os caches que as páginas usam (uma vez por processo)
+    iniciar_aquecimento()
+    exibir_estado_aquecimento()
     
     try:
-        # Carregar dados do dashboard principal
-        df_cotia = st.session_state['df_cotia'] if 'df_cotia' in st.session_state else None
+        # Agregações pré-calculadas de Cotia (anos, funções e faixa de valores dos filtros)
+        totais = get_agregacoes_principais('cotia', exato=True)
         
-        if df_cotia is None:
-            st.error("Por favor, acesse primeiro a página principal do dashboard.")
+        if totais['contagem_total'] == 0:
+            st.error("Erro ao carregar os dados. Verifique se o arquivo de dados existe e está acessível.")
             return
         
         # Seletor de visualização
@@ -32,16 +56,16 @@ def main():
             # Filtros
             col1, col2, col3 = st.columns(3)
             with col1:
-                anos = sorted(df_cotia['exercicio'].unique())
+                anos = totais['anos_unicos']
                 ano_selecionado = st.multiselect("Filtrar por Ano:", anos, default=anos)
             
             with col2:
-                funcoes = sorted(df_cotia['funcao_de_governo'].unique())
+                funcoes = totais['funcoes_unicas']
                 funcao_selecionada = st.multiselect("Filtrar por Função:", funcoes, default=funcoes)
             
             with col3:
-                valor_min = float(df_cotia['vl_pago'].min())
-                valor_max = float(df_cotia['vl_pago'].max())
+                valor_min = float(totais['minimo'])
+                valor_max = float(totais['maximo'])
                 faixa_valor = st.slider(
                     "Faixa de Valor (R$):",
                     valor_min,
@@ -50,104 +74,115 @@ def main():
                     format="R$ %.2f"
                 )
             
-            # Aplicar filtros
-            df_filtrado = df_cotia[
-                (df_cotia['exercicio'].isin(ano_selecionado)) &
-                (df_cotia['funcao_de_governo'].isin(funcao_selecionada)) &
-                (df_cotia['vl_pago'].between(faixa_valor[0], faixa_valor[1]))
-            ]
+            # Busca, ordenação e paginação no servidor
+            col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+            with col1:
+                termo_busca = st.text_input("Buscar (entidade, CNPJ, função ou descrição):")
+            with col2:
+                colunas_brutas = [c for c in get_colunas_repasses() if c not in COLUNAS_ENRIQUECIDAS + COLUNAS_ANOMALIA]
+                coluna_ordem = st.selectbox("Ordenar por:", colunas_brutas, index=colunas_brutas.index('vl_pago'))
+            with col3:
+                decrescente = st.checkbox("Decrescente", value=True)
+            with col4:
+                tamanho_pagina = st.selectbox("Linhas por página:", [50, 100, 250, 500], index=1)
+            
+            # Só a página visível é lida (no backend SQL), formatada e enviada ao navegador
+            filtros = dict(
+                anos=ano_selecionado,
+                funcoes=funcao_selecionada,
+                valor_min=faixa_valor[0],
+                valor_max=faixa_valor[1],
+                busca=termo_busca
+            )
+            _, total_linhas, valor_total = consultar_linhas('cotia', limite=0, **filtros)
+            n_paginas = total_paginas(total_linhas, tamanho_pagina)
+            numero_pagina = st.number_input(f"Página (de {n_paginas:,}):", min_value=1, max_value=n_paginas, value=1)
             
-            # Mostrar dados filtrados
+            df_pagina = consultar_linhas(
+                'cotia',
+                ordem=coluna_ordem,
+                ascendente=not decrescente,
+                limite=tamanho_pagina,
+                deslocamento=(numero_pagina - 1) * tamanho_pagina,
+                **filtros
+            )[0]
             st.dataframe(
-                df_filtrado.style.format({
-                    'vl_pago': lambda x: fvr(x)
-                }),
-                height=400
+                formatar_colunas_reais(df_pagina[colunas_brutas], ['vl_pago']),
+                height=400,
+                hide_index=True
             )
             
             # Estatísticas básicas dos dados filtrados
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Total de Registros", f"{len(df_filtrado):,}")
+                st.metric("Total de Registros", f"{total_linhas:,}")
             with col2:
-                st.metric("Valor Total", fvr(df_filtrado['vl_pago'].sum()))
+                st.metric("Valor Total", fvr(valor_total))
             with col3:
-                st.metric("Média por Repasse", fvr(df_filtrado['vl_pago'].mean()))
+                st.metric("Média por Repasse", fvr(valor_total / total_linhas if total_linhas else None))
         
         elif visualizacao == "Por Ano":
             st.subheader("Análise Anual dos Repasses")
             
             # Agregação por ano
-            df_anual = df_cotia.groupby('exercicio').agg({
-                'vl_pago': ['count', 'sum', 'mean', 'std'],
-                'razao_social': 'nunique'
-            }).round(2)
+            df_anual = get_dados_anuais('cotia')[
+                ['contagem', 'soma', 'media', 'desvio_padrao', 'entidades']
+            ]
             
             # Renomear colunas
             df_anual.columns = ['Quantidade', 'Total', 'Média', 'Desvio Padrão', 'Entidades']
             
             # Gráfico de evolução
-            fig = px.line(
-                df_anual.reset_index(),
-                x='exercicio',
-                y=['Total', 'Média'],
-                title='Evolução Anual dos Repasses'
-            )
-            fig.update_layout(
-                yaxis=dict(tickformat=',.2f', tickprefix='R$ '),
-                hovermode='x unified'
-            )
-            fig.update_traces(
-                hovertemplate="Ano: %{x}<br>Valor: R$ %{y:,.2f}<extra></extra>"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            def grafico_anual():
+                fig = px.line(
+                    df_anual.reset_index(),
+                    x='exercicio',
+                    y=['Total', 'Média'],
+                    title='Evolução Anual dos Repasses'
+                )
+                fig.update_layout(
+                    yaxis=dict(tickformat=',.2f', tickprefix='R$ '),
+                    hovermode='x unified'
+                )
+                fig.update_traces(
+                    hovertemplate="Ano: %{x}<br>Valor: R$ %{y:,.2f}<extra></extra>"
+                )
+                return fig
+
+            st.plotly_chart(figura_em_cache('tabelas.anual', grafico_anual), use_container_width=True)
             
             # Tabela detalhada
-            st.dataframe(
-                df_anual.style.format({
-                    'Total': lambda x: fvr(x),
-                    'Média': lambda x: fvr(x),
-                    'Desvio Padrão': lambda x: fvr(x),
-                    'Quantidade': '{:,}',
-                    'Entidades': '{:,}'
-                })
-            )
+            st.dataframe(formatar_colunas_reais(df_anual, ['Total', 'Média', 'Desvio Padrão']))
         
         elif visualizacao == "Por Função":
             st.subheader("Análise por Função de Governo")
             
             # Agregação por função
-            df_funcao = df_cotia.groupby('funcao_de_governo').agg({
-                'vl_pago': ['count', 'sum', 'mean', 'std'],
-                'razao_social': 'nunique'
-            }).round(2)
+            df_funcao = get_dados_funcao('cotia')[
+                ['contagem', 'soma', 'media', 'desvio_padrao', 'entidades']
+            ]
             
             # Renomear colunas
             df_funcao.columns = ['Quantidade', 'Total', 'Média', 'Desvio Padrão', 'Entidades']
             
             # Gráfico de pizza
-            fig = px.pie(
-                df_funcao.reset_index(),
-                values='Total',
-                names='funcao_de_governo',
-                title='Distribuição dos Repasses por Função'
-            )
-            fig.update_traces(
-                texttemplate="%{label}<br>R$ %{value:,.2f}",
-                hovertemplate="Função: %{label}<br>Total: R$ %{value:,.2f}<extra></extra>"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            def grafico_funcao():
+                fig = px.pie(
+                    df_funcao.reset_index(),
+                    values='Total',
+                    names='funcao_de_governo',
+                    title='Distribuição dos Repasses por Função'
+                )
+                fig.update_traces(
+                    texttemplate="%{label}<br>R$ %{value:,.2f}",
+                    hovertemplate="Função: %{label}<br>Total: R$ %{value:,.2f}<extra></extra>"
+                )
+                return fig
+
+            st.plotly_chart(figura_em_cache('tabelas.funcao', grafico_funcao), use_container_width=True)
             
             # Tabela detalhada
-            st.dataframe(
-                df_funcao.style.format({
-                    'Total': lambda x: fvr(x),
-                    'Média': lambda x: fvr(x),
-                    'Desvio Padrão': lambda x: fvr(x),
-                    'Quantidade': '{:,}',
-                    'Entidades': '{:,}'
-                })
-            )
+            st.dataframe(formatar_colunas_reais(df_funcao, ['Total', 'Média', 'Desvio Padrão']))
         
         elif visualizacao == "Por Entidade":
             st.subheader("Análise por Entidade")
@@ -156,62 +191,60 @@ def main():
             n_entidades = st.slider("Número de entidades:", 5, 50, 10)
             
             # Agregação por entidade
-            df_entidade = df_cotia.groupby('razao_social').agg({
-                'vl_pago': ['count', 'sum', 'mean'],
-                'funcao_de_governo': lambda x: ', '.join(set(x))
-            }).round(2)
+            df_entidade = get_dados_entidade('cotia', top_n=n_entidades)[
+                ['contagem', 'soma', 'media', 'funcoes']
+            ]
             
             # Renomear colunas
             df_entidade.columns = ['Quantidade', 'Total', 'Média', 'Áreas']
-            df_entidade = df_entidade.sort_values('Total', ascending=False).head(n_entidades)
             
             # Gráfico de barras
-            fig = px.bar(
-                df_entidade.reset_index(),
-                x='razao_social',
-                y='Total',
-                title=f'Top {n_entidades} Entidades por Valor Total'
-            )
-            fig.update_layout(
-                xaxis_tickangle=45,
-                yaxis=dict(tickformat=',.2f', tickprefix='R$ ')
-            )
-            fig.update_traces(
-                hovertemplate="Entidade: %{x}<br>Total: R$ %{y:,.2f}<extra></extra>"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            def grafico_entidades():
+                fig = px.bar(
+                    df_entidade.reset_index(),
+                    x='entidade',
+                    y='Total',
+                    title=f'Top {n_entidades} Entidades por Valor Total'
+                )
+                fig.update_layout(
+                    xaxis_tickangle=45,
+                    yaxis=dict(tickformat=',.2f', tickprefix='R$ ')
+                )
+                fig.update_traces(
+                    hovertemplate="Entidade: %{x}<br>Total: R$ %{y:,.2f}<extra></extra>"
+                )
+                return fig
+
+            st.plotly_chart(figura_em_cache('tabelas.entidades', grafico_entidades, n_entidades=n_entidades), use_container_width=True)
             
             # Tabela detalhada
-            st.dataframe(
-                df_entidade.style.format({
-                    'Total': lambda x: fvr(x),
-                    'Média': lambda x: fvr(x),
-                    'Quantidade': '{:,}'
-                })
-            )
+            st.dataframe(formatar_colunas_reais(df_entidade, ['Total', 'Média']))
         
         else:  # Estatísticas Avançadas
             st.subheader("Estatísticas Avançadas")
             
-            # Box plot
-            fig = px.box(
-                df_cotia,
-                y='vl_pago',
-                title='Distribuição dos Valores dos Repasses'
-            )
-            fig.update_layout(
-                yaxis=dict(
-                    title='Valor (R$)',
-                    tickformat=',.2f',
-                    tickprefix='R$ '
+            # Box plot e histograma a partir do resumo calculado no servidor
+            resumo = get_resumo_distribuicao('cotia')
+            col1, col2 = st.columns(2)
+            with col1:
+                fig = figura_em_cache(
+                    'tabelas.caixa',
+                    lambda: figura_resumos({'Repasses': resumo}, 'Distribuição dos Valores dos Repasses')
                 )
-            )
-            fig.update_traces(
-                hovertemplate="Valor: R$ %{y:,.2f}<extra></extra>"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(fig, use_container_width=True)
+            with col2:
+                fig = figura_em_cache(
+                    'tabelas.histograma',
+                    lambda: figura_histograma(resumo, 'Histograma dos Valores (classes logarítmicas)')
+                )
+                st.plotly_chart(fig, use_container_width=True)
             
-            # Estatísticas detalhadas
+            # Estatísticas detalhadas: por padrão, mescladas dos esboços de cada partição
+            exato = st.checkbox(
+                "Valores exatos (auditoria)",
+                help="Recalcula mediana e número de entidades linha a linha, em vez de usar as estimativas"
+            )
+            estatisticas = get_estatisticas('cotia', exato=exato)
             stats = pd.DataFrame({
                 'Estatística': [
                     'Total de Repasses',
@@ -226,16 +259,16 @@ def main():
                     'Número de Operações'
                 ],
                 'Valor': [
-                    df_cotia['vl_pago'].sum(),
-                    df_cotia['vl_pago'].mean(),
-                    df_cotia['vl_pago'].median(),
-                    df_cotia['vl_pago'].std(),
-                    df_cotia['vl_pago'].min(),
-                    df_cotia['vl_pago'].max(),
-                    df_cotia['vl_pago'].skew(),
-                    df_cotia['vl_pago'].kurtosis(),
-                    df_cotia['razao_social'].nunique(),
-                    len(df_cotia)
+                    estatisticas['soma'],
+                    estatisticas['media'],
+                    estatisticas['mediana'],
+                    estatisticas['desvio_padrao'],
+                    estatisticas['minimo'],
+                    estatisticas['maximo'],
+                    estatisticas['assimetria'],
+                    estatisticas['curtose'],
+                    int(estatisticas['entidades']),
+                    int(estatisticas['contagem'])
                 ]
             })
             
@@ -245,6 +278,53 @@ def main():
                 })
             )
 
+            # Repasses atípicos dentro de cada (exercício, função de governo), pontuados na carga
+            st.subheader("Repasses Atípicos")
+            caixas = get_caixas('cotia')
+            col1, col2 = st.columns(2)
+            with col1:
+                ano = st.selectbox("Exercício:", sorted(caixas.index.get_level_values('exercicio').unique(), reverse=True))
+            with col2:
+                criterio = st.radio(
+                    "Critério:",
+                    ['z', 'iqr'],
+                    format_func=lambda c: f"Z robusto (|z| > {LIMIAR_Z})" if c == 'z' else f"Fora de {FATOR_IQR} × IQR",
+                    horizontal=True
+                )
+
+            caixas_ano = caixas.xs(ano, level='exercicio')
+            atipicos = get_atipicos('cotia', anos=[ano], criterio=criterio)
+
+            # Caixas a partir dos quartis já calculados, mais só os pontos marcados
+            def grafico_atipicos():
+                pontos = pd.DataFrame({
+                    'rotulo': atipicos['funcao_de_governo'],
+                    'valor': atipicos['vl_pago'],
+                    'texto': atipicos['entidade'].astype(str) + '<br>z robusto: ' + atipicos['z_robusto'].round(1).astype(str)
+                })
+                fig_atipicos = figura_caixas(caixas_ano, pontos, f'Distribuição por Função de Governo - {ano}', log=True)
+                return fig_atipicos
+
+            st.plotly_chart(figura_em_cache('tabelas.atipicos', grafico_atipicos, ano=ano, criterio=criterio), use_container_width=True)
+
+            st.write(f"{len(atipicos)} repasses atípicos em {ano}")
+            st.dataframe(
+                formatar_colunas_reais(
+                    atipicos[['exercicio', 'funcao_de_governo', 'entidade', 'vl_pago', 'z_robusto']].round({'z_robusto': 2}),
+                    ['vl_pago']
+                )
+            )
+
+            # Concentração dos recursos entre as entidades
+            st.subheader("Concentração por Entidade")
+            concentracao = get_concentracao('cotia')
+            concentracao.columns = ['Entidades', 'HHI', 'Gini', 'Maior Participação']
+            st.dataframe(concentracao.style.format({'HHI': '{:.3f}', 'Gini': '{:.3f}', 'Maior Participação': '{:.1%}'}))
+            st.caption(
+                "HHI: soma dos quadrados das participações de cada entidade no total do ano "
+                "(1 = uma única entidade). Gini: 0 = valores iguais entre as entidades, 1 = concentração máxima."
+            )
+
     except Exception as e:
         st.error(f"Erro ao carregar os dados: {str(e)}")
         st.exception(e)
@@ -0,0 +1,62 @@
+"""
+Compara o formatador monetário escalar (formatar_valor_reais, chamado célula a
+célula como nos Stylers, com `format()` do Python) com o vetorizado
+(formatar_valores_reais), e confere que os dois dão o mesmo texto também em
+valores limítrofes (meio centavo).
+
+Uso: python -m scripts.benchmark_formatador [quantidade]
+"""
+import sys
+import time
+
+import numpy as np
+
+from utils.data_manager import formatar_valor_reais, formatar_valores_reais
+
+
+def medir(funcao, repeticoes=3):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+
+def valores_limitrofes():
+    """Meios centavos em todas as faixas, inclusive perto das trocas de sufixo."""
+    meios = np.arange(0, 100_000) + 0.005
+    return np.concatenate([
+        meios / 100, meios, meios * 10 + 0.5,
+        np.arange(1_000_000, 3_000_000, 5, dtype=np.float64),
+        np.arange(1_000_000_000, 1_100_000_000, 5_000, dtype=np.float64),
+        [999_999.995, 999_999_999.995, 1_055_000, 12_345, 12.345, 2.675, 0.125, -0.005, -0.004]
+    ])
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    quantidade = int(argv[0]) if argv else 100_000
+
+    # Distribuição parecida com a de vl_pago: de centavos a centenas de milhões
+    rng = np.random.default_rng(42)
+    valores = np.round(rng.lognormal(mean=10.8, sigma=2.5, size=quantidade), 2)
+
+    t_escalar, r_escalar = medir(lambda: [formatar_valor_reais(v) for v in valores])
+    t_vetor, r_vetor = medir(lambda: formatar_valores_reais(valores))
+
+    divergencias = sum(a != b for a, b in zip(r_escalar, r_vetor))
+    print(f"Valores: {quantidade:,}")
+    print(f"Escalar (uma chamada por célula): {t_escalar * 1000:8.1f} ms")
+    print(f"Vetorizado (coluna inteira):      {t_vetor * 1000:8.1f} ms ({t_escalar / t_vetor:.1f}x)")
+    print(f"Divergências: {divergencias}")
+
+    limitrofes = valores_limitrofes()
+    erros = [(v, a) for v, a in zip(limitrofes, formatar_valores_reais(limitrofes)) if a != formatar_valor_reais(v)]
+    print(f"Valores limítrofes com texto diferente do escalar: {len(erros)} de {len(limitrofes):,}")
+    for valor, texto in erros[:5]:
+        print(f"  {valor!r}: {texto} (escalar: {formatar_valor_reais(valor)})")
+
+
+if __name__ == '__main__':
+    main()
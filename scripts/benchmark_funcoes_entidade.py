@@ -0,0 +1,66 @@
+"""
+Compara a lista de funções por entidade feita com lambda (`', '.join(set(x))`)
+com a versão vetorizada de utils.cubo.funcoes_por_grupo, em dados sintéticos.
+
+Uso: python -m scripts.benchmark_funcoes_entidade [linhas] [entidades]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.cubo import funcoes_por_grupo
+from utils.esquema import FUNCOES_DE_GOVERNO
+
+
+def gerar_dados(linhas, entidades, semente=42):
+    rng = np.random.default_rng(semente)
+    # Cada entidade atua em poucas funções, como nos dados reais
+    funcao_principal = rng.integers(0, len(FUNCOES_DE_GOVERNO), entidades)
+    entidade = rng.integers(0, entidades, linhas)
+    funcao = np.where(
+        rng.random(linhas) < 0.8,
+        funcao_principal[entidade],
+        rng.integers(0, len(FUNCOES_DE_GOVERNO), linhas)
+    )
+    return pd.DataFrame({
+        'razao_social': pd.Categorical.from_codes(entidade, [f"ENTIDADE {i:06d}" for i in range(entidades)]),
+        'funcao_de_governo': pd.Categorical.from_codes(funcao, FUNCOES_DE_GOVERNO)
+    })
+
+
+def medir(funcao, repeticoes=3):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    linhas = int(argv[0]) if len(argv) > 0 else 1_000_000
+    entidades = int(argv[1]) if len(argv) > 1 else 20_000
+
+    df = gerar_dados(linhas, entidades)
+    texto = df.assign(funcao_de_governo=df['funcao_de_governo'].astype(object))
+
+    t_lambda, r_lambda = medir(
+        lambda: texto.groupby('razao_social', observed=True)['funcao_de_governo'].agg(lambda x: ', '.join(set(x)))
+    )
+    t_vetor, r_vetor = medir(lambda: funcoes_por_grupo(df, ['razao_social']))
+
+    iguais = all(
+        set(a.split(', ')) == set(b.split(', '))
+        for a, b in zip(r_lambda.sort_index(), r_vetor.sort_index())
+    )
+    print(f"Linhas: {linhas:,} | Entidades: {entidades:,}")
+    print(f"Lambda ', '.join(set(x)): {t_lambda * 1000:9.1f} ms")
+    print(f"Vetorizado (máscara):     {t_vetor * 1000:9.1f} ms ({t_lambda / t_vetor:.1f}x)")
+    print(f"Mesmo conjunto de funções por entidade: {iguais}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Ingestão em fluxo de uma exportação de repasses (.xlsx ou .csv) para o cache colunar.
+
+A origem é lida em lotes, só com as linhas dos municípios/exercícios
+pedidos, e cada lote é gravado nas partições à medida que chega; o uso de
+memória não depende do tamanho do arquivo. Depois da ingestão, o painel e
+o relatório passam a usar esta origem.
+
+Com --delta, o arquivo (um exercício novo ou correções) é mesclado ao cache
+existente: só as partições que ele contém são regravadas. O delta passa
+pelos mesmos filtros da ingestão original, a menos que --municipios ou
+--exercicios sejam informados (por exemplo, para acrescentar um exercício
+novo a um cache restrito a exercícios).
+
+Uso:
+    python -m scripts.ingestao repasses_estado.csv --sep ';' --encoding latin-1 --decimal ','
+    python -m scripts.ingestao repasses_estado.csv --municipios cotia barueri --exercicios 2023 2024
+    python -m scripts.ingestao repasses_2025.xlsx --delta
+    python -m scripts.ingestao repasses_2025.xlsx --delta --exercicios 2025
+"""
+import argparse
+import sys
+import time
+
+from utils.armazenamento import DIRETORIO_CACHE, TAMANHO_LOTE, aplicar_delta, construir_cache
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingere uma exportação de repasses no cache colunar.")
+    parser.add_argument('arquivo', help="Planilha .xlsx ou exportação .csv")
+    parser.add_argument('--delta', action='store_true', help="Mescla o arquivo ao cache existente em vez de substituí-lo")
+    parser.add_argument('--municipios', nargs='+', default=None, help="Municípios a manter (padrão: todos; com --delta, os da ingestão original)")
+    parser.add_argument('--exercicios', nargs='+', type=int, default=None, help="Exercícios a manter (padrão: todos; com --delta, os da ingestão original)")
+    parser.add_argument('--tamanho-lote', type=int, default=TAMANHO_LOTE, help=f"Linhas por lote (padrão: {TAMANHO_LOTE})")
+    parser.add_argument('--cache', default=DIRETORIO_CACHE, help=f"Diretório do cache (padrão: {DIRETORIO_CACHE})")
+    parser.add_argument('--sep', default=None, help="Separador do CSV (padrão: ',')")
+    parser.add_argument('--encoding', default=None, help="Codificação do CSV (padrão: utf-8)")
+    parser.add_argument('--decimal', default=None, help="Separador decimal do CSV (padrão: '.')")
+    args = parser.parse_args(argv)
+
+    opcoes_csv = {
+        chave: valor
+        for chave, valor in (('sep', args.sep), ('encoding', args.encoding), ('decimal', args.decimal))
+        if valor is not None
+    }
+
+    inicio = time.perf_counter()
+    if args.delta:
+        manifesto = aplicar_delta(args.arquivo, args.cache, opcoes_csv, args.tamanho_lote,
+                                  municipios=args.municipios, exercicios=args.exercicios)
+        registro = manifesto['deltas'][-1]
+        alteradas = registro['particoes']
+        print(f"{len(alteradas)} partições atualizadas em {time.perf_counter() - inicio:.1f} s: {', '.join(alteradas)}")
+        if not alteradas:
+            print(
+                "Nenhuma linha do delta passou pelos filtros "
+                f"(municípios: {registro['municipios'] or 'todos'}, exercícios: {registro['exercicios'] or 'todos'}). "
+                "Para incluir um exercício ou município novo, informe --exercicios/--municipios.",
+                file=sys.stderr
+            )
+        return 0 if alteradas else 1
+
+    manifesto = construir_cache(
+        args.arquivo, args.cache,
+        municipios=args.municipios,
+        exercicios=args.exercicios,
+        tamanho_lote=args.tamanho_lote,
+        opcoes_csv=opcoes_csv
+    )
+    particoes = manifesto['particoes'].values()
+    linhas = sum(p['linhas'] for p in particoes)
+    arquivos = sum(len(p['arquivos']) for p in particoes)
+    print(f"{linhas:,} linhas em {len(particoes)} partições ({arquivos} arquivos) em {time.perf_counter() - inicio:.1f} s")
+    return 0 if linhas else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Relatório em lote dos repasses, sem interface gráfica.
+
+Lê os dados pelo cache colunar (utils.armazenamento) e grava, para cada
+município, as tabelas em CSV e os gráficos em HTML estático (e PNG, se o
+pacote `kaleido` estiver instalado). Vários municípios são processados em
+paralelo, um por processo.
+
+Uso:
+    python main.py cotia itapevi --saida relatorios
+    python main.py --todos --processos 4
+"""
+import argparse
+import importlib.util
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import plotly.express as px
+import plotly.graph_objects as go
+
+from utils.armazenamento import garantir_cache, ler_repasses, listar_municipios, slug_municipio
+from utils.cubo import agregar_cubo, construir_cubo
+from utils.distribuicao import figura_resumos, resumir_distribuicao
+from utils.entidades import aplicar_entidades
+from utils.hierarquia import figura_treemap
+from utils.municipios import nome_exibicao
+
+DIRETORIO_SAIDA = 'relatorios'
+
+
+def _salvar_figura(fig, caminho_base, png):
+    fig.write_html(f"{caminho_base}.html", include_plotlyjs='cdn')
+    if png:
+        try:
+            fig.write_image(f"{caminho_base}.png")
+        except (ImportError, ValueError, RuntimeError) as e:
+            print(f"PNG não gerado para {os.path.basename(caminho_base)}: {e}", file=sys.stderr)
+
+
+def gerar_relatorio(municipio, saida=DIRETORIO_SAIDA, png=True):
+    """
+    Gera tabelas e gráficos de um município.
+    Args:
+        municipio (str): Nome do município (como no cache, ex.: 'taboão da serra')
+        saida (str): Diretório base; os arquivos vão para `saida/<município>/`
+        png (bool): Tenta exportar os gráficos também em PNG
+    Returns:
+        str: Diretório com os arquivos gerados
+    """
+    df = ler_repasses(municipios=[municipio])
+    if df.empty:
+        raise ValueError(f"Nenhum dado encontrado para o município de {municipio}")
+
+    destino = os.path.join(saida, slug_municipio(municipio))
+    os.makedirs(destino, exist_ok=True)
+    cubo = construir_cubo(aplicar_entidades(df))
+    nome = nome_exibicao(municipio)
+
+    # 1. Análise Temporal
+    repasses_por_ano = agregar_cubo(cubo, ['exercicio'])[['soma', 'contagem', 'media']].round(2)
+    repasses_por_ano.columns = ['Total', 'Quantidade', 'Média']
+    repasses_por_ano.to_csv(os.path.join(destino, 'temporal.csv'))
+
+    fig_temporal = go.Figure()
+    fig_temporal.add_trace(go.Bar(
+        x=repasses_por_ano.index,
+        y=repasses_por_ano['Total'],
+        name='Total Anual'
+    ))
+    fig_temporal.add_trace(go.Scatter(
+        x=repasses_por_ano.index,
+        y=repasses_por_ano['Média'],
+        name='Média por Repasse',
+        yaxis='y2'
+    ))
+    fig_temporal.update_layout(
+        title=f'Evolução dos Repasses ao Longo dos Anos - {nome}',
+        yaxis=dict(title='Total de Repasses (R$)'),
+        yaxis2=dict(title='Média por Repasse (R$)', overlaying='y', side='right')
+    )
+    _salvar_figura(fig_temporal, os.path.join(destino, 'temporal'), png)
+
+    # 2. Análise por Função de Governo
+    analise_funcao = agregar_cubo(cubo, ['funcao_de_governo'])[
+        ['soma', 'contagem', 'media', 'desvio_padrao', 'entidades']
+    ].round(2)
+    analise_funcao.columns = ['Total', 'Quantidade', 'Média', 'Desvio Padrão', 'Entidades Únicas']
+    analise_funcao.to_csv(os.path.join(destino, 'funcoes.csv'))
+
+    # O HTML é estático: todas as funções já vêm abertas até as entidades
+    por_entidade = agregar_cubo(cubo, ['funcao_de_governo', 'entidade'])['soma']
+    filhos = {(): analise_funcao['Total']}
+    filhos.update({(funcao,): totais.droplevel(0) for funcao, totais in por_entidade.groupby(level=0, observed=True)})
+    fig_funcao = figura_treemap(filhos, nome, f'Distribuição dos Repasses por Função de Governo - {nome}')
+    _salvar_figura(fig_funcao, os.path.join(destino, 'funcoes'), png)
+
+    # 3. Análise das Entidades Beneficiadas
+    top_entidades = agregar_cubo(cubo, ['entidade'], com_funcoes=True).nlargest(10, 'soma')[['soma', 'funcoes']]
+    top_entidades.columns = ['Total Recebido', 'Áreas de Atuação']
+    top_entidades.to_csv(os.path.join(destino, 'entidades.csv'))
+
+    fig_entidades = px.bar(
+        top_entidades.reset_index(),
+        x='entidade',
+        y='Total Recebido',
+        title=f'Top 10 Entidades por Valor Total de Repasses - {nome}',
+        labels={'entidade': 'Entidade', 'Total Recebido': 'Valor Total (R$)'}
+    )
+    fig_entidades.update_layout(xaxis_tickangle=45)
+    _salvar_figura(fig_entidades, os.path.join(destino, 'entidades'), png)
+
+    # 4. Estatísticas Gerais
+    totais = agregar_cubo(cubo).iloc[0]
+    estatisticas = {
+        'Total de Repasses': totais['soma'],
+        'Média por Repasse': totais['media'],
+        'Mediana dos Repasses': df['vl_pago'].median(),
+        'Desvio Padrão': totais['desvio_padrao'],
+        'Menor Repasse': totais['minimo'],
+        'Maior Repasse': totais['maximo'],
+        'Total de Entidades Beneficiadas': totais['entidades'],
+        'Total de Repasses Realizados': totais['contagem']
+    }
+    with open(os.path.join(destino, 'estatisticas.csv'), 'w', encoding='utf-8') as arquivo:
+        arquivo.write('estatistica,valor\n')
+        for chave, valor in estatisticas.items():
+            arquivo.write(f"{chave},{valor}\n")
+
+    # 5. Análise de Distribuição dos Valores
+    # Quartis e atípicos pré-calculados: o HTML não carrega todos os valores
+    fig_dist = figura_resumos(
+        {'Distribuição dos Valores': resumir_distribuicao(df['vl_pago'].to_numpy())},
+        f'Distribuição dos Valores dos Repasses - {nome}'
+    )
+    _salvar_figura(fig_dist, os.path.join(destino, 'distribuicao'), png)
+
+    return destino
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera relatórios estáticos dos repasses por município.")
+    parser.add_argument('municipios', nargs='*', help="Municípios (ex.: cotia 'taboão da serra')")
+    parser.add_argument('--todos', action='store_true', help="Gera o relatório de todos os municípios do cache")
+    parser.add_argument('--saida', default=DIRETORIO_SAIDA, help="Diretório de saída (padrão: relatorios)")
+    parser.add_argument('--processos', type=int, default=None, help="Número de processos (padrão: núcleos da CPU)")
+    parser.add_argument('--sem-png', action='store_true', help="Não tenta exportar os gráficos em PNG")
+    args = parser.parse_args(argv)
+
+    # Constrói o cache uma vez antes de abrir os processos
+    garantir_cache()
+    disponiveis = listar_municipios()
+    municipios = disponiveis if args.todos else [m.lower() for m in args.municipios]
+    if not municipios:
+        parser.error(f"informe municípios ou --todos. Disponíveis: {', '.join(disponiveis)}")
+
+    desconhecidos = [m for m in municipios if m not in disponiveis]
+    if desconhecidos:
+        parser.error(f"municípios sem dados: {', '.join(desconhecidos)}")
+
+    png = not args.sem_png
+    if png and importlib.util.find_spec('kaleido') is None:
+        print("Pacote kaleido não instalado: gráficos exportados apenas em HTML.", file=sys.stderr)
+        png = False
+
+    falhas = 0
+    with ProcessPoolExecutor(max_workers=args.processos) as executor:
+        tarefas = {
+            executor.submit(gerar_relatorio, municipio, args.saida, png): municipio
+            for municipio in municipios
+        }
+        for tarefa in as_completed(tarefas):
+            municipio = tarefas[tarefa]
+            try:
+                print(f"{municipio}: {tarefa.result()}")
+            except Exception as e:
+                falhas += 1
+                print(f"{municipio}: erro ao gerar relatório: {e}", file=sys.stderr)
+    return 1 if falhas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
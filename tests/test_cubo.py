@@ -0,0 +1,35 @@
+"""Roll-up do cubo: média e desvio padrão iguais aos calculados linha a linha."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.cubo import agregar_cubo, construir_cubo
+
+
+@pytest.fixture
+def repasses():
+    # Valores perto de 1e8 com desvio de centavos: soma dos quadrados - soma²/n perderia tudo
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'municipio': 'cotia',
+        'exercicio': np.repeat([2021, 2022], 100),
+        'funcao_de_governo': pd.Categorical(np.tile(['Saúde', 'Educação'], 100)),
+        'entidade': pd.Categorical(np.tile(['A', 'B', 'C', 'D'], 50)),
+        'vl_pago': 1e8 + rng.normal(0, 0.01, 200)
+    })
+
+
+@pytest.mark.parametrize('por', [[], ['exercicio'], ['funcao_de_governo'], ['exercicio', 'entidade']])
+def test_desvio_padrao_sem_cancelamento(repasses, por):
+    resultado = agregar_cubo(construir_cubo(repasses), por)
+    if por:
+        esperado = repasses.groupby(por, observed=True)['vl_pago'].agg(['mean', 'std']).reindex(resultado.index)
+    else:
+        esperado = pd.DataFrame({'mean': [repasses['vl_pago'].mean()], 'std': [repasses['vl_pago'].std()]})
+    np.testing.assert_allclose(resultado['media'].to_numpy(), esperado['mean'].to_numpy(), rtol=1e-15)
+    np.testing.assert_allclose(resultado['desvio_padrao'].to_numpy(), esperado['std'].to_numpy(), rtol=1e-6)
+
+
+def test_grupo_de_uma_linha_sem_desvio(repasses):
+    resultado = agregar_cubo(construir_cubo(repasses.head(1)), ['exercicio'])
+    assert resultado['desvio_padrao'].isna().all()
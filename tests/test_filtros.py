@@ -0,0 +1,52 @@
+"""Seleções vazias de anos e funções não selecionam nada; None não filtra."""
+import pandas as pd
+import pytest
+
+from utils.data_manager import _chave_filtros, _chave_selecao
+from utils.filtros import MotorFiltros
+
+
+@pytest.fixture
+def repasses():
+    return pd.DataFrame({
+        'municipio': ['cotia'] * 4,
+        'exercicio': [2021, 2021, 2022, 2023],
+        'funcao_de_governo': pd.Categorical(['Saúde', 'Educação', 'Saúde', 'Cultura']),
+        'vl_pago': [10.0, 20.0, 30.0, 40.0]
+    })
+
+
+def test_chave_selecao_mantem_selecao_vazia():
+    assert _chave_selecao([], []) == ((), ())
+    assert _chave_selecao(None, None) == (None, None)
+    assert _chave_selecao([2022, '2021'], ['Saúde']) == ((2021, 2022), ('Saúde',))
+    # Nas agregações, vazio continua valendo "todos"
+    assert _chave_filtros([], []) == (None, None)
+
+
+@pytest.mark.parametrize('anos, funcoes', [([], None), (None, []), ((), ())])
+def test_motor_selecao_vazia_nao_seleciona_nada(repasses, anos, funcoes):
+    motor = MotorFiltros(repasses)
+    assert len(motor.linhas(anos, funcoes)) == 0
+    assert len(motor.linhas(anos, funcoes, valor_min=0, valor_max=25)) == 0
+
+
+def test_motor_sem_filtro_seleciona_tudo(repasses):
+    assert len(MotorFiltros(repasses).linhas(None, None)) == len(repasses)
+
+
+@pytest.mark.parametrize('anos, funcoes, esperado', [
+    ([], None, 0),
+    (None, [], 0),
+    (None, None, 4),
+    ([2021], ['Saúde', 'Cultura'], 1)
+])
+def test_condicoes_sql(repasses, anos, funcoes, esperado):
+    duckdb = pytest.importorskip('duckdb')
+    from utils.consultas import _condicoes
+
+    conexao = duckdb.connect()
+    conexao.register('tabela', repasses.assign(funcao_de_governo=repasses['funcao_de_governo'].astype(str)))
+    conexao.execute("CREATE TABLE repasses AS SELECT * FROM tabela")
+    onde, parametros = _condicoes('cotia', anos, funcoes)
+    assert conexao.execute(f"SELECT count(*) FROM repasses WHERE {onde}", parametros).fetchone()[0] == esperado
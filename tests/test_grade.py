@@ -0,0 +1,25 @@
+"""Ordenação da grade de dados brutos: a mesma do ORDER BY do backend SQL."""
+import numpy as np
+import pandas as pd
+
+from utils.grade import ordem_linhas
+
+
+def _valores(df, coluna, ascendente):
+    posicoes = ordem_linhas(df, np.arange(len(df)), coluna, ascendente)
+    return df[coluna].iloc[posicoes].astype(object).where(lambda s: s.notna(), None).tolist()
+
+
+def test_categorica_ordena_pelo_texto_e_nao_pela_categoria():
+    df = pd.DataFrame({'funcao_de_governo': pd.Categorical(
+        ['Saúde', 'Administração', None, 'Cultura'],
+        categories=['Legislativa', 'Saúde', 'Administração', 'Cultura']
+    )})
+    assert _valores(df, 'funcao_de_governo', True) == ['Administração', 'Cultura', 'Saúde', None]
+    assert _valores(df, 'funcao_de_governo', False) == ['Saúde', 'Cultura', 'Administração', None]
+
+
+def test_texto_com_nulos_por_ultimo_nos_dois_sentidos():
+    df = pd.DataFrame({'descricao': pd.array(['b', None, 'a', 'c'], dtype='string')})
+    assert _valores(df, 'descricao', True) == ['a', 'b', 'c', None]
+    assert _valores(df, 'descricao', False) == ['c', 'b', 'a', None]
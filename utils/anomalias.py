@@ -0,0 +1,128 @@
+"""
+Repasses atípicos e concentração dos recursos por entidade.
+
+Cada repasse é comparado aos demais do seu grupo (município, exercício,
+função de governo), em uma única passada vetorizada: os valores são
+ordenados uma vez por (grupo, valor) e os quartis, a mediana e o MAD de
+todos os grupos saem por indexação das posições.
+- z robusto: 0,6745 * (valor - mediana) / MAD; |z| > LIMIAR_Z é atípico
+  (Iglewicz e Hoaglin);
+- IQR: fora de [Q1 - FATOR_IQR * IQR, Q3 + FATOR_IQR * IQR] é atípico.
+Grupos com menos de MINIMO_GRUPO repasses não são pontuados.
+
+A concentração por (município, exercício) usa o total recebido por
+entidade: índice de Herfindahl-Hirschman (soma dos quadrados das
+participações, de 1/n a 1) e coeficiente de Gini.
+"""
+import numpy as np
+import pandas as pd
+
+GRUPOS_ANOMALIA = ['municipio', 'exercicio', 'funcao_de_governo']
+COLUNAS_ANOMALIA = ('z_robusto', 'atipico_z', 'atipico_iqr')
+
+LIMIAR_Z = 3.5
+FATOR_IQR = 1.5
+MINIMO_GRUPO = 5
+
+# MAD e desvio absoluto médio em unidades de desvio padrão (distribuição normal)
+_ESCALA_MAD = 0.6745
+_ESCALA_DESVIO_MEDIO = 1.2533
+
+
+def _quantis(ordenados, inicios, tamanhos, q):
+    """Quantil q de cada segmento de `ordenados` (interpolação linear, como no pandas)."""
+    posicao = q * np.maximum(tamanhos - 1, 0)
+    baixo = np.floor(posicao).astype(np.int64)
+    alto = np.ceil(posicao).astype(np.int64)
+    valores_baixo = ordenados[inicios + baixo]
+    valores_alto = ordenados[inicios + alto]
+    quantis = valores_baixo + (valores_alto - valores_baixo) * (posicao - baixo)
+    return np.where(tamanhos > 0, quantis, np.nan)
+
+
+def pontuar_anomalias(df):
+    """
+    Acrescenta COLUNAS_ANOMALIA e resume a distribuição de cada grupo.
+    Args:
+        df (DataFrame): Repasses com as colunas de GRUPOS_ANOMALIA e `vl_pago`
+    Returns:
+        tuple: (df com z_robusto, atipico_z e atipico_iqr; DataFrame por grupo
+        com n, q1, mediana, q3, mad, cercas, bigodes e quantidade de atípicos)
+    """
+    grupos = df.groupby(GRUPOS_ANOMALIA, observed=True, sort=True)
+    codigos = grupos.ngroup().to_numpy()
+    chaves = grupos.size()
+    valores = df['vl_pago'].to_numpy(dtype=np.float64)
+    validos = ~np.isnan(valores)
+
+    # Segmentos de cada grupo na ordem (grupo, valor); NaN fica no fim de cada segmento
+    inicios = np.concatenate([[0], np.cumsum(chaves.to_numpy())[:-1]]).astype(np.int64)
+    tamanhos = np.bincount(codigos[validos], minlength=len(chaves))
+    ordenados = valores[np.lexsort((valores, codigos))]
+
+    q1, mediana, q3 = (_quantis(ordenados, inicios, tamanhos, q) for q in (0.25, 0.5, 0.75))
+    desvios = np.abs(valores - mediana[codigos])
+    mad = _quantis(desvios[np.lexsort((desvios, codigos))], inicios, tamanhos, 0.5)
+    desvio_medio = np.bincount(codigos[validos], weights=desvios[validos], minlength=len(chaves)) / np.maximum(tamanhos, 1)
+
+    # MAD nulo (mais da metade dos valores iguais): recorre ao desvio absoluto médio
+    escala = np.where(mad > 0, mad / _ESCALA_MAD, desvio_medio * _ESCALA_DESVIO_MEDIO)
+    escala = np.where((escala > 0) & (tamanhos >= MINIMO_GRUPO), escala, np.nan)
+    z = (valores - mediana[codigos]) / escala[codigos]
+
+    iqr = q3 - q1
+    cerca_inferior = q1 - FATOR_IQR * iqr
+    cerca_superior = q3 + FATOR_IQR * iqr
+    dentro = (valores >= cerca_inferior[codigos]) & (valores <= cerca_superior[codigos])
+
+    df['z_robusto'] = z.astype(np.float32)
+    df['atipico_z'] = np.abs(z) > LIMIAR_Z
+    df['atipico_iqr'] = validos & ~dentro & (tamanhos[codigos] >= MINIMO_GRUPO)
+
+    caixas = pd.DataFrame({
+        'n': tamanhos,
+        'q1': q1,
+        'mediana': mediana,
+        'q3': q3,
+        'mad': mad,
+        'cerca_inferior': cerca_inferior,
+        'cerca_superior': cerca_superior,
+        # Bigodes: valores extremos dentro das cercas
+        'bigode_inferior': pd.Series(np.where(dentro, valores, np.inf)).groupby(codigos).min().to_numpy(),
+        'bigode_superior': pd.Series(np.where(dentro, valores, -np.inf)).groupby(codigos).max().to_numpy(),
+        'atipicos_z': np.bincount(codigos, weights=df['atipico_z'].to_numpy(), minlength=len(chaves)).astype(np.int64),
+        'atipicos_iqr': np.bincount(codigos, weights=df['atipico_iqr'].to_numpy(), minlength=len(chaves)).astype(np.int64)
+    }, index=chaves.index)
+    caixas[['bigode_inferior', 'bigode_superior']] = caixas[['bigode_inferior', 'bigode_superior']].replace([np.inf, -np.inf], np.nan)
+    return df, caixas
+
+
+def concentracao_entidades(df, por=('municipio', 'exercicio')):
+    """
+    Concentração dos valores recebidos entre as entidades de cada grupo.
+    Totais negativos (estornos) contam como zero.
+    Args:
+        df (DataFrame): Repasses com as colunas de `por`, `entidade` e `vl_pago`
+        por (tuple): Dimensões dos grupos
+    Returns:
+        DataFrame: entidades, hhi, gini e maior_participacao por grupo
+    """
+    por = list(por)
+    totais = df.groupby(por + ['entidade'], observed=True, sort=True)['vl_pago'].sum().clip(lower=0).reset_index()
+    totais = totais.sort_values(por + ['vl_pago'], kind='stable')
+    grupos = totais.groupby(por, observed=True, sort=True)['vl_pago']
+
+    soma = grupos.transform('sum').to_numpy()
+    n = grupos.transform('size').to_numpy()
+    participacao = np.divide(totais['vl_pago'].to_numpy(), soma, out=np.zeros(len(totais)), where=soma > 0)
+    # Gini com os totais em ordem crescente: soma((2i - n - 1) * x_i) / (n * soma(x))
+    posto = grupos.cumcount().to_numpy() + 1
+    termos = (2 * posto - n - 1) * participacao / n
+
+    resultado = pd.DataFrame({
+        'entidades': grupos.size(),
+        'hhi': pd.Series(participacao ** 2, index=totais.index).groupby([totais[c] for c in por], observed=True).sum(),
+        'gini': pd.Series(termos, index=totais.index).groupby([totais[c] for c in por], observed=True).sum(),
+        'maior_participacao': pd.Series(participacao, index=totais.index).groupby([totais[c] for c in por], observed=True).max()
+    })
+    return resultado
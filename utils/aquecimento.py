@@ -0,0 +1,172 @@
+"""
+Aquecimento dos caches em segundo plano.
+
+Sem ele, quem abre uma página logo depois de um deploy paga a conversão da
+planilha, a montagem da tabela mestre, do cubo e das agregações enquanto
+espera. `iniciar_aquecimento()` dispara, uma única vez por processo (e de
+novo só quando a versão dos dados muda), uma thread que chama as mesmas
+funções em cache do data_manager que as páginas chamam ao abrir: as
+agregações de Cotia (dashboard e tabelas) e o cubo de onde a comparação
+filtra os municípios de MUNICIPIOS_COMPARACAO. Como os caches do Streamlit
+são do processo, as sessões seguintes já os encontram prontos. Uma página
+que pede um valor ainda em cálculo espera por ele, sem calculá-lo de novo.
+
+Nada além disso é aquecido: os caches por município guardam no máximo 64
+entradas (contando as combinações de filtros), e o que as páginas não pedem
+só ocuparia memória. O restante é calculado sob demanda.
+
+O Streamlit só executa o código das páginas quando chega a primeira sessão,
+então o aquecimento começa com ela: esse primeiro visitante ainda espera pelos
+caches em memória. O que pode ser feito antes fica nos caches em disco (ver
+abaixo).
+
+Estados: pendente -> carregando -> pronto (ou erro).
+
+Antes de subir o servidor, `python -m utils.aquecimento` executa as mesmas
+etapas no próprio processo, deixando prontos os caches em disco (Parquet e
+tabela mestre em Arrow).
+"""
+import logging
+import threading
+import time
+
+import streamlit as st
+from utils import data_manager as dm
+
+logger = logging.getLogger(__name__)
+
+PENDENTE = 'pendente'
+CARREGANDO = 'carregando'
+PRONTO = 'pronto'
+ERRO = 'erro'
+
+_NOME_THREAD = 'aquecimento-caches'
+
+_trava = threading.Lock()
+_thread = None
+_estado = {
+    'estado': PENDENTE,
+    'versao': None,
+    'etapa': None,
+    'erro': None,
+    'segundos': None
+}
+
+
+class _SemAvisoDeContexto(logging.Filter):
+    """Descarta o aviso de "missing ScriptRunContext": a thread de aquecimento não pertence a nenhuma sessão."""
+
+    def filter(self, registro):
+        return registro.threadName != _NOME_THREAD
+
+
+logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context').addFilter(_SemAvisoDeContexto())
+
+
+def _atualizar(**campos):
+    with _trava:
+        _estado.update(campos)
+
+
+def _aquecer_cotia():
+    """Agregações que o dashboard e a página de tabelas pedem ao abrir."""
+    dm.get_agregacoes_principais('cotia', exato=True)
+    dm.get_dados_anuais('cotia')
+    dm.get_dados_funcao('cotia')
+    dm.get_dados_entidade('cotia', top_n=None)
+    dm.get_arvore_funcoes('cotia')
+    dm.get_estatisticas('cotia')
+    dm.get_resumo_distribuicao('cotia')
+    if not dm.usar_sql():
+        # Dados brutos: sem o backend SQL, as páginas de linhas saem do motor de filtros
+        dm.get_motor_filtros('cotia')
+
+
+def aquecer():
+    """
+    Preenche os caches, etapa por etapa, atualizando o estado.
+    Returns:
+        str: Versão dos dados aquecida
+    """
+    inicio = time.perf_counter()
+    _atualizar(estado=CARREGANDO, etapa='cache de dados', erro=None, segundos=None)
+    try:
+        versao = dm.versao_dados()
+        _atualizar(versao=versao, etapa='tabela mestre')
+        dm.carregar_tabela_mestre()
+
+        # Comparação: o cubo é um só, e a página filtra dele a sua seleção
+        _atualizar(etapa='cubo')
+        dm.carregar_cubo()
+        dm.get_ano_base_ipca()
+
+        if 'cotia' in dm.get_municipios():
+            _atualizar(etapa='agregações de Cotia')
+            _aquecer_cotia()
+    except Exception as e:
+        logger.exception("Falha no aquecimento dos caches")
+        _atualizar(estado=ERRO, erro=str(e), segundos=time.perf_counter() - inicio)
+        raise
+    segundos = time.perf_counter() - inicio
+    _atualizar(estado=PRONTO, etapa=None, segundos=segundos)
+    logger.info("Caches aquecidos em %.1f s (versão %s)", segundos, versao)
+    return versao
+
+
+def _executar():
+    try:
+        aquecer()
+    except Exception:
+        # Já registrado em `aquecer`; o estado fica em ERRO
+        pass
+
+
+def iniciar_aquecimento():
+    """
+    Inicia o aquecimento em segundo plano, se ainda não foi feito para a
+    versão atual dos dados. Chamadas repetidas (a cada execução das páginas)
+    não fazem nada enquanto ele roda ou depois que termina; um erro só é
+    tentado de novo quando os dados mudam.
+    Returns:
+        dict: Estado atual (ver `estado_aquecimento`)
+    """
+    global _thread
+    with _trava:
+        if _thread is not None and _thread.is_alive():
+            return dict(_estado)
+        concluido = _estado['estado'] in (PRONTO, ERRO)
+    # A primeira chamada não consulta a versão: quem converte a planilha é a thread
+    if concluido and _estado['versao'] == dm.versao_dados():
+        return estado_aquecimento()
+    with _trava:
+        if _thread is None or not _thread.is_alive():
+            _estado['estado'] = CARREGANDO
+            _thread = threading.Thread(target=_executar, name=_NOME_THREAD, daemon=True)
+            _thread.start()
+        return dict(_estado)
+
+
+def estado_aquecimento():
+    """
+    Estado do aquecimento.
+    Returns:
+        dict: estado (pendente, carregando, pronto ou erro), versao, etapa,
+        erro e segundos
+    """
+    with _trava:
+        return dict(_estado)
+
+
+def exibir_estado_aquecimento():
+    """Aviso discreto na página enquanto os caches ainda estão sendo preparados."""
+    estado = estado_aquecimento()
+    if estado['estado'] == CARREGANDO:
+        progresso = f" ({estado['etapa']})" if estado['etapa'] else ""
+        st.caption(f"Preparando os dados em segundo plano{progresso}; as primeiras consultas podem demorar um pouco.")
+    elif estado['estado'] == ERRO:
+        st.caption(f"A preparação antecipada dos dados falhou ({estado['erro']}); as consultas são calculadas sob demanda.")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    aquecer()
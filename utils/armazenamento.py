@@ -0,0 +1,654 @@
+"""
+Cache colunar (Parquet) dos repasses.
+
+A planilha de origem (ou uma exportação CSV) é lida em fluxo, lote a lote,
+e convertida uma única vez em arquivos Parquet particionados por município
+e exercício; cada partição pode ter vários arquivos. Um manifesto em JSON guarda a
+assinatura do arquivo de origem (mtime, tamanho e SHA-256) e a lista de
+partições; o cache só é reconstruído quando a origem muda de fato. Deltas
+(novos exercícios ou correções) regravam apenas as partições afetadas.
+A tabela mestre já tipada também é exportada em Arrow IPC, para ser aberta
+por mapeamento de memória por todos os processos.
+"""
+import hashlib
+import json
+import os
+import re
+import unicodedata
+import uuid
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from utils.esquema import TIPOS_NUMERICOS, aplicar_esquema, aplicar_tipos_numericos, uso_memoria
+
+ARQUIVO_FONTE = 'data/repasses.xlsx'
+DIRETORIO_CACHE = 'data/cache'
+VERSAO_CACHE = 3
+
+# Leitura em fluxo: linhas por lote e máximo de linhas aguardando gravação
+TAMANHO_LOTE = 50_000
+LIMITE_LINHAS_PENDENTES = 250_000
+
+_NOME_MANIFESTO = 'manifesto.json'
+_DIRETORIO_MESTRE = 'mestre'
+_BLOCO_HASH = 1024 * 1024
+
+
+def normalizar_repasses(df):
+    """
+    Padroniza nomes de município e tipos das colunas numéricas.
+    Args:
+        df (DataFrame): Dados brutos lidos da planilha
+    Returns:
+        DataFrame: Dados normalizados
+    """
+    df['municipio'] = df['municipio'].str.lower()
+
+    # Padronizar o nome de Vargem Grande Paulista (caso haja variações)
+    df.loc[df['municipio'].str.contains('vargem'), 'municipio'] = 'vargem_grande_paulista'
+
+    return aplicar_tipos_numericos(df)
+
+
+def slug_municipio(municipio):
+    """Converte o nome do município em um nome de diretório seguro."""
+    texto = unicodedata.normalize('NFKD', municipio).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '_', texto.lower()).strip('_')
+
+
+def _sha256(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(_BLOCO_HASH), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _caminho_manifesto(diretorio):
+    return os.path.join(diretorio, _NOME_MANIFESTO)
+
+
+def ler_manifesto(diretorio=DIRETORIO_CACHE):
+    """Retorna o manifesto do cache, ou None se ele não existir."""
+    try:
+        with open(_caminho_manifesto(diretorio), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _gravar_manifesto(manifesto, diretorio):
+    # Gravação atômica: leitores nunca enxergam um manifesto pela metade
+    temporario = f"{_caminho_manifesto(diretorio)}.{os.getpid()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=1)
+    os.replace(temporario, _caminho_manifesto(diretorio))
+
+
+def _remover_arquivos_orfaos(antigo, novo, diretorio):
+    """Apaga arquivos referenciados pelo manifesto antigo e não pelo novo."""
+    if not antigo:
+        return
+    em_uso = {a for p in novo['particoes'].values() for a in p['arquivos']}
+    for particao in antigo.get('particoes', {}).values():
+        for relativo in particao['arquivos']:
+            if relativo not in em_uso:
+                try:
+                    os.remove(os.path.join(diretorio, relativo))
+                except OSError:
+                    pass
+
+
+def _gravar_particao(df, municipio, exercicio, diretorio, esquema=None):
+    """Grava uma partição em um novo arquivo Parquet e retorna seu caminho relativo."""
+    relativo = os.path.join('repasses', slug_municipio(municipio), str(exercicio), f"{uuid.uuid4().hex}.parquet")
+    caminho = os.path.join(diretorio, relativo)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    tabela = pa.Table.from_pandas(df, schema=esquema, preserve_index=False)
+    pq.write_table(tabela, caminho, compression='zstd')
+    return relativo
+
+
+def _assinatura_fonte(caminho):
+    info = os.stat(caminho)
+    return {
+        'caminho': os.path.abspath(caminho),
+        'mtime_ns': info.st_mtime_ns,
+        'tamanho': info.st_size,
+        'sha256': _sha256(caminho)
+    }
+
+
+def normalizar_nome_municipio(nome):
+    """Versão escalar da padronização de nomes feita em `normalizar_repasses`."""
+    nome = str(nome).lower()
+    return 'vargem_grande_paulista' if 'vargem' in nome else nome
+
+
+def _esquema_arrow(colunas):
+    """Esquema fixo do cache: tipos do esquema para as numéricas, texto para as demais."""
+    return pa.schema([
+        (coluna, pa.from_numpy_dtype(np.dtype(TIPOS_NUMERICOS[coluna])) if coluna in TIPOS_NUMERICOS else pa.string())
+        for coluna in colunas
+    ])
+
+
+def _textos_como_string(df):
+    """Converte as colunas de texto para string (vazio vira nulo)."""
+    for coluna in df.columns.difference(list(TIPOS_NUMERICOS)):
+        serie = df[coluna].astype('string')
+        df[coluna] = serie.mask(serie == '')
+    return df
+
+
+def _preparar_lote(df):
+    return _textos_como_string(normalizar_repasses(df))
+
+
+def _predicado_linha(colunas, municipios, exercicios):
+    """
+    Filtro aplicado a cada linha da planilha antes de montar o DataFrame,
+    para que linhas de outros municípios/exercícios nem ocupem memória.
+    """
+    i_municipio, i_exercicio = colunas.index('municipio'), colunas.index('exercicio')
+
+    def aceita(linha):
+        municipio = linha[i_municipio]
+        if municipio is None:
+            return False
+        if municipios is not None and normalizar_nome_municipio(municipio) not in municipios:
+            return False
+        if exercicios is not None and (linha[i_exercicio] is None or int(linha[i_exercicio]) not in exercicios):
+            return False
+        return True
+
+    return aceita
+
+
+def _lotes_xlsx(caminho, tamanho_lote, municipios, exercicios):
+    livro = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        linhas = livro.worksheets[0].iter_rows(values_only=True)
+        colunas = [str(c) for c in next(linhas)]
+        aceita = _predicado_linha(colunas, municipios, exercicios)
+        lote = []
+        for linha in linhas:
+            if aceita(linha):
+                lote.append(linha)
+                if len(lote) >= tamanho_lote:
+                    yield pd.DataFrame.from_records(lote, columns=colunas)
+                    lote = []
+        if lote:
+            yield pd.DataFrame.from_records(lote, columns=colunas)
+    finally:
+        livro.close()
+
+
+def _lotes_csv(caminho, tamanho_lote, municipios, exercicios, opcoes_csv):
+    # Colunas de texto lidas sempre como texto (CNPJ com zeros à esquerda, lotes com tipos diferentes)
+    colunas = pd.read_csv(caminho, nrows=0, **opcoes_csv).columns
+    tipos = {coluna: str for coluna in colunas if coluna not in TIPOS_NUMERICOS}
+    for lote in pd.read_csv(caminho, chunksize=tamanho_lote, dtype=tipos, **opcoes_csv):
+        lote = lote[lote['municipio'].notna()]
+        if municipios is not None:
+            lote = lote[lote['municipio'].map(normalizar_nome_municipio).isin(municipios)]
+        if exercicios is not None:
+            lote = lote[lote['exercicio'].isin(exercicios)]
+        if len(lote):
+            yield lote
+
+
+def ler_em_lotes(caminho, tamanho_lote=TAMANHO_LOTE, municipios=None, exercicios=None, opcoes_csv=None,
+                 uso_bruto=None):
+    """
+    Lê a planilha (.xlsx) ou o CSV de origem em lotes, já filtrados e normalizados.
+    Args:
+        caminho (str): Arquivo .xlsx ou .csv
+        tamanho_lote (int): Linhas por lote
+        municipios (list): Municípios aceitos (None para todos)
+        exercicios (list): Exercícios aceitos (None para todos)
+        opcoes_csv (dict): Opções repassadas ao `pd.read_csv` (ex.: sep, encoding, decimal)
+        uso_bruto (dict): Se dado, acumula em 'linhas' e 'bytes' (por coluna,
+            ver utils.esquema.uso_memoria) o tamanho dos lotes como lidos,
+            antes de qualquer conversão de tipos
+    Yields:
+        DataFrame: Lotes de no máximo `tamanho_lote` linhas
+    """
+    if municipios is not None:
+        municipios = {normalizar_nome_municipio(m) for m in municipios}
+    if exercicios is not None:
+        exercicios = {int(e) for e in exercicios}
+
+    if caminho.lower().endswith('.csv'):
+        lotes = _lotes_csv(caminho, tamanho_lote, municipios, exercicios, opcoes_csv or {})
+    else:
+        lotes = _lotes_xlsx(caminho, tamanho_lote, municipios, exercicios)
+    for lote in lotes:
+        if uso_bruto is not None:
+            uso_bruto['linhas'] = uso_bruto.get('linhas', 0) + len(lote)
+            acumulado = uso_bruto.setdefault('bytes', {})
+            for coluna, tamanho in uso_memoria(lote).items():
+                acumulado[coluna] = acumulado.get(coluna, 0) + int(tamanho)
+        yield _preparar_lote(lote)
+
+
+def _compactar_particao(particao, diretorio):
+    """Junta os arquivos de uma partição em um único Parquet (na mesma ordem de linhas) e apaga os antigos."""
+    if len(particao['arquivos']) < 2:
+        return particao
+    tabela = pa.concat_tables([pq.read_table(os.path.join(diretorio, relativo)) for relativo in particao['arquivos']])
+    relativo = os.path.join('repasses', slug_municipio(particao['municipio']), str(particao['exercicio']),
+                            f"{uuid.uuid4().hex}.parquet")
+    pq.write_table(tabela, os.path.join(diretorio, relativo), compression='zstd')
+    for antigo in particao['arquivos']:
+        os.remove(os.path.join(diretorio, antigo))
+    return dict(particao, arquivos=[relativo])
+
+
+class _GravadorParticoes:
+    """
+    Acumula os lotes por partição e grava um novo arquivo Parquet quando a
+    partição junta `tamanho_lote` linhas. Se o total pendente passar de
+    `limite_linhas`, tudo é descarregado, limitando o uso de memória mesmo
+    quando a origem não está ordenada por município. Ao final, cada
+    partição gravada em vários pedaços é compactada em um único arquivo,
+    para que a quantidade de arquivos acompanhe a de partições, e não a de
+    descargas.
+    """
+
+    def __init__(self, diretorio, tamanho_lote=TAMANHO_LOTE, limite_linhas=LIMITE_LINHAS_PENDENTES):
+        self.diretorio = diretorio
+        self.tamanho_lote = tamanho_lote
+        self.limite_linhas = limite_linhas
+        self.particoes = {}
+        self._pendentes = {}
+        self._linhas_pendentes = 0
+        self._esquema = None
+
+    def adicionar(self, df):
+        if self._esquema is None:
+            self._esquema = _esquema_arrow(df.columns)
+        for (municipio, exercicio), grupo in df.groupby(['municipio', 'exercicio'], sort=False):
+            chave = (municipio, int(exercicio))
+            pendentes = self._pendentes.setdefault(chave, [])
+            pendentes.append(grupo)
+            self._linhas_pendentes += len(grupo)
+            if sum(len(g) for g in pendentes) >= self.tamanho_lote:
+                self._descarregar(chave)
+        if self._linhas_pendentes >= self.limite_linhas:
+            for chave in list(self._pendentes):
+                self._descarregar(chave)
+
+    def _descarregar(self, chave):
+        grupos = self._pendentes.pop(chave)
+        df = pd.concat(grupos) if len(grupos) > 1 else grupos[0]
+        municipio, exercicio = chave
+        particao = self.particoes.setdefault(f"{municipio}/{exercicio}", {
+            'municipio': municipio,
+            'exercicio': exercicio,
+            'arquivos': [],
+            'linhas': 0
+        })
+        particao['arquivos'].append(_gravar_particao(df, municipio, exercicio, self.diretorio, self._esquema))
+        particao['linhas'] += len(df)
+        self._linhas_pendentes -= len(df)
+
+    def finalizar(self):
+        """Grava o que restou pendente, compacta as partições e as devolve em ordem."""
+        for chave in list(self._pendentes):
+            self._descarregar(chave)
+        return {
+            chave: _compactar_particao(particao, self.diretorio)
+            for chave, particao in sorted(self.particoes.items())
+        }
+
+
+def construir_cache(caminho_fonte=ARQUIVO_FONTE, diretorio=DIRETORIO_CACHE, municipios=None, exercicios=None,
+                    tamanho_lote=TAMANHO_LOTE, opcoes_csv=None):
+    """
+    Lê a origem em fluxo e grava o cache colunar particionado.
+
+    A planilha (ou o CSV) é lida em lotes; cada lote é filtrado pelos
+    municípios/exercícios pedidos, normalizado e distribuído entre as
+    partições, sem que o arquivo inteiro fique em memória.
+    Args:
+        caminho_fonte (str): Planilha .xlsx ou exportação .csv
+        municipios (list): Restringe o cache a estes municípios (None para todos)
+        exercicios (list): Restringe o cache a estes exercícios (None para todos)
+        tamanho_lote (int): Linhas por lote de leitura e por arquivo de partição
+        opcoes_csv (dict): Opções do `pd.read_csv` para origens .csv
+    Returns:
+        dict: Manifesto do cache recém-construído
+    """
+    gravador = _GravadorParticoes(diretorio, tamanho_lote)
+    uso_bruto = {'linhas': 0, 'bytes': {}}
+    for lote in ler_em_lotes(caminho_fonte, tamanho_lote, municipios, exercicios, opcoes_csv, uso_bruto):
+        gravador.adicionar(lote)
+
+    fonte = _assinatura_fonte(caminho_fonte)
+    # Guardados para que a reconstrução automática repita a mesma ingestão
+    fonte['municipios'] = sorted({normalizar_nome_municipio(m) for m in municipios}) if municipios is not None else None
+    fonte['exercicios'] = sorted({int(e) for e in exercicios}) if exercicios is not None else None
+    fonte['opcoes_csv'] = opcoes_csv or {}
+
+    manifesto = {
+        'versao_cache': VERSAO_CACHE,
+        'fonte': fonte,
+        'particoes': gravador.finalizar(),
+        # Memória dos lotes como lidos da origem, base do relatório de memória da tabela mestre
+        'memoria_bruta': uso_bruto
+    }
+    antigo = ler_manifesto(diretorio)
+    _gravar_manifesto(manifesto, diretorio)
+    _remover_arquivos_orfaos(antigo, manifesto, diretorio)
+    return manifesto
+
+
+def _reconstruir(manifesto, caminho_fonte, diretorio):
+    """Reconstrói o cache com as opções da ingestão anterior e reaplica os deltas registrados."""
+    fonte = manifesto['fonte'] if manifesto else {}
+    novo = construir_cache(
+        caminho_fonte, diretorio,
+        municipios=fonte.get('municipios'),
+        exercicios=fonte.get('exercicios'),
+        opcoes_csv=fonte.get('opcoes_csv')
+    )
+    # A mesclagem é idempotente, então reaplicar um delta já contido na nova origem não duplica linhas
+    for delta in (manifesto or {}).get('deltas', []):
+        if os.path.exists(delta['caminho']):
+            novo = aplicar_delta(delta['caminho'], diretorio, delta.get('opcoes_csv'),
+                                 municipios=delta.get('municipios'), exercicios=delta.get('exercicios'))
+    return novo
+
+
+def garantir_cache(caminho_fonte=None, diretorio=DIRETORIO_CACHE):
+    """
+    Retorna o manifesto do cache, reconstruindo-o se a origem mudou.
+
+    Sem `caminho_fonte`, vale a origem registrada no manifesto (a planilha
+    padrão se ainda não houver cache). A verificação barata (mtime e
+    tamanho) é feita primeiro; o SHA-256 só é recalculado quando ela falha,
+    de modo que um simples `touch` na planilha não força a reconstrução.
+    """
+    manifesto = ler_manifesto(diretorio)
+    fonte = (manifesto or {}).get('fonte') or {}
+    if caminho_fonte is None:
+        caminho_fonte = fonte.get('caminho') or ARQUIVO_FONTE
+
+    if manifesto is None:
+        return _reconstruir(None, caminho_fonte, diretorio)
+
+    if os.path.abspath(caminho_fonte) != fonte.get('caminho'):
+        return _reconstruir(None, caminho_fonte, diretorio)
+    if manifesto.get('versao_cache') != VERSAO_CACHE:
+        # Formato antigo: reconstrói com os filtros da ingestão e reaplica os deltas registrados
+        return _reconstruir(manifesto, caminho_fonte, diretorio)
+    try:
+        info = os.stat(caminho_fonte)
+    except FileNotFoundError:
+        # Origem removida (ex.: exportação estadual apagada após a ingestão): o cache continua válido
+        return manifesto
+    if info.st_mtime_ns == fonte['mtime_ns'] and info.st_size == fonte['tamanho']:
+        return manifesto
+
+    if info.st_size == fonte['tamanho'] and _sha256(caminho_fonte) == fonte['sha256']:
+        fonte['mtime_ns'] = info.st_mtime_ns
+        _gravar_manifesto(manifesto, diretorio)
+        return manifesto
+
+    return _reconstruir(manifesto, caminho_fonte, diretorio)
+
+
+def marca_cache(manifesto, diretorio=DIRETORIO_CACHE):
+    """
+    mtime e tamanho do manifesto e da origem que ele registra (None para os
+    ausentes). Enquanto a marca não muda, `garantir_cache` devolveria o
+    mesmo manifesto, sem precisar relê-lo.
+    """
+    def marca(caminho):
+        try:
+            info = os.stat(caminho)
+        except FileNotFoundError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    fonte = ((manifesto or {}).get('fonte') or {}).get('caminho') or ARQUIVO_FONTE
+    return marca(_caminho_manifesto(diretorio)), marca(fonte)
+
+
+def _com_ordinal(df, chave):
+    """Numera as linhas repetidas de uma mesma chave (0, 1, 2...), na ordem em que aparecem."""
+    return df.assign(_ordinal=df.groupby(chave, dropna=False, sort=False).cumcount())
+
+
+def mesclar_delta(atual, delta):
+    """
+    Mescla linhas novas ou corrigidas nas linhas de uma partição.
+
+    A chave natural é formada por todas as colunas exceto `vl_pago`, mais o
+    ordinal da linha entre as de mesma chave: repasses idênticos legítimos
+    continuam distintos, e uma linha do delta substitui a linha de mesma
+    chave e ordinal (correção de valor) ou é acrescentada.
+    Args:
+        atual (DataFrame): Linhas já armazenadas na partição
+        delta (DataFrame): Linhas recebidas, com as mesmas colunas
+    Returns:
+        DataFrame: Linhas da partição após a mesclagem
+    """
+    chave = [coluna for coluna in atual.columns if coluna != 'vl_pago']
+    combinado = pd.concat([_com_ordinal(atual, chave), _com_ordinal(delta, chave)], ignore_index=True)
+    return (
+        combinado
+        .drop_duplicates(chave + ['_ordinal'], keep='last')
+        .drop(columns='_ordinal')
+        .reset_index(drop=True)
+    )
+
+
+def _ler_particao(particao, diretorio):
+    tabelas = [pq.read_table(os.path.join(diretorio, relativo)) for relativo in particao['arquivos']]
+    return _textos_como_string(pa.concat_tables(tabelas).to_pandas())
+
+
+def aplicar_delta(caminho_delta, diretorio=DIRETORIO_CACHE, opcoes_csv=None, tamanho_lote=TAMANHO_LOTE,
+                  municipios=None, exercicios=None):
+    """
+    Incorpora um arquivo de delta (um exercício novo ou correções) ao cache.
+
+    Só as partições (município, exercício) presentes no delta são lidas,
+    mescladas (ver `mesclar_delta`) e regravadas; as demais mantêm os
+    mesmos arquivos e, portanto, a mesma impressão digital. O delta fica
+    registrado no manifesto, com os filtros usados, e é reaplicado da mesma
+    forma se o cache for reconstruído.
+    Args:
+        caminho_delta (str): Arquivo .xlsx ou .csv com as mesmas colunas da origem
+        opcoes_csv (dict): Opções do `pd.read_csv` para deltas .csv
+        municipios (list): Municípios aceitos do delta (padrão: os da ingestão original)
+        exercicios (list): Exercícios aceitos do delta (padrão: os da ingestão original);
+            necessário para incluir um exercício novo em um cache restrito a exercícios
+    Returns:
+        dict: Manifesto atualizado
+    """
+    manifesto = garantir_cache(diretorio=diretorio)
+    fonte = manifesto['fonte']
+    if municipios is None:
+        municipios = fonte.get('municipios')
+    if exercicios is None:
+        exercicios = fonte.get('exercicios')
+
+    recebidos = {}
+    for lote in ler_em_lotes(caminho_delta, tamanho_lote, municipios, exercicios, opcoes_csv):
+        for (municipio, exercicio), grupo in lote.groupby(['municipio', 'exercicio'], sort=False):
+            recebidos.setdefault((municipio, int(exercicio)), []).append(grupo)
+
+    particoes = dict(manifesto['particoes'])
+    colunas = None
+    if particoes:
+        exemplo = next(iter(particoes.values()))['arquivos'][0]
+        colunas = pq.read_schema(os.path.join(diretorio, exemplo)).names
+
+    for (municipio, exercicio), grupos in sorted(recebidos.items()):
+        delta = pd.concat(grupos, ignore_index=True)
+        if colunas is not None:
+            if set(delta.columns) != set(colunas):
+                raise ValueError(f"As colunas do delta não correspondem às do cache: {sorted(set(delta.columns) ^ set(colunas))}")
+            delta = delta[colunas]
+
+        chave = f"{municipio}/{exercicio}"
+        if chave in particoes:
+            delta = mesclar_delta(_ler_particao(particoes[chave], diretorio), delta)
+        particoes[chave] = {
+            'municipio': municipio,
+            'exercicio': exercicio,
+            'arquivos': [_gravar_particao(delta, municipio, exercicio, diretorio, _esquema_arrow(delta.columns))],
+            'linhas': len(delta)
+        }
+
+    assinatura = _assinatura_fonte(caminho_delta)
+    registro = {
+        'caminho': assinatura['caminho'],
+        'sha256': assinatura['sha256'],
+        'opcoes_csv': opcoes_csv or {},
+        'municipios': sorted({normalizar_nome_municipio(m) for m in municipios}) if municipios is not None else None,
+        'exercicios': sorted({int(e) for e in exercicios}) if exercicios is not None else None,
+        'particoes': [f"{m}/{e}" for m, e in sorted(recebidos)]
+    }
+    deltas = [d for d in manifesto.get('deltas', []) if d['caminho'] != registro['caminho']]
+
+    novo = dict(manifesto, particoes=dict(sorted(particoes.items())), deltas=deltas + [registro])
+    _gravar_manifesto(novo, diretorio)
+    _remover_arquivos_orfaos(manifesto, novo, diretorio)
+    return novo
+
+
+def _selecionar_particoes(manifesto, municipios=None, exercicios=None):
+    particoes = sorted(
+        manifesto['particoes'].values(),
+        key=lambda p: (p['municipio'], p['exercicio'])
+    )
+    if municipios is not None:
+        municipios = {m.lower() for m in municipios}
+        particoes = [p for p in particoes if p['municipio'] in municipios]
+    if exercicios is not None:
+        exercicios = {int(e) for e in exercicios}
+        particoes = [p for p in particoes if p['exercicio'] in exercicios]
+    return particoes
+
+
+def listar_municipios(caminho_fonte=None, diretorio=DIRETORIO_CACHE):
+    """Retorna, em ordem alfabética, os municípios presentes no cache."""
+    manifesto = garantir_cache(caminho_fonte, diretorio)
+    return sorted({p['municipio'] for p in manifesto['particoes'].values()})
+
+
+def impressao_digital(manifesto, municipios=None, exercicios=None):
+    """
+    Identificador da versão dos dados de todos (ou de alguns) municípios e exercícios.
+    Muda sempre que alguma das partições selecionadas é regravada.
+    """
+    sha = hashlib.sha1()
+    for particao in _selecionar_particoes(manifesto, municipios, exercicios):
+        sha.update('|'.join(particao['arquivos']).encode('utf-8'))
+    return sha.hexdigest()[:16]
+
+
+def ler_repasses(municipios=None, exercicios=None, tipar=True, caminho_fonte=None, diretorio=DIRETORIO_CACHE):
+    """
+    Lê os repasses a partir do cache colunar, construindo-o se necessário.
+    Args:
+        municipios (list): Municípios desejados (None para todos)
+        exercicios (list): Exercícios desejados (None para todos)
+        tipar (bool): Aplica o esquema de tipos compactos (categóricos)
+    Returns:
+        DataFrame: Repasses ordenados por município e exercício
+    """
+    manifesto = garantir_cache(caminho_fonte, diretorio)
+    for tentativa in range(2):
+        try:
+            tabelas = [
+                pq.read_table(os.path.join(diretorio, relativo))
+                for particao in _selecionar_particoes(manifesto, municipios, exercicios)
+                for relativo in particao['arquivos']
+            ]
+            break
+        except FileNotFoundError:
+            # Outro processo reconstruiu o cache durante a leitura
+            if tentativa:
+                raise
+            manifesto = garantir_cache(caminho_fonte, diretorio)
+
+    if not tabelas:
+        return pd.DataFrame()
+
+    df = pa.concat_tables(tabelas).to_pandas()
+    return aplicar_esquema(df) if tipar else df
+
+
+def caminho_tabela_mestre(versao, diretorio=DIRETORIO_CACHE):
+    return os.path.join(diretorio, _DIRETORIO_MESTRE, f"{versao}.arrow")
+
+
+def exportar_tabela_mestre(df, versao, metadados=None, diretorio=DIRETORIO_CACHE):
+    """
+    Grava a tabela já tipada em Arrow IPC (Feather v2) sem compressão, para
+    que possa ser aberta por mapeamento de memória (sem cópia nas colunas
+    numéricas, ver `abrir_tabela_mestre`). Arquivos de versões anteriores
+    são apagados (processos que ainda os mapeiam mantêm o acesso até
+    fechá-los).
+    Args:
+        df (DataFrame): Tabela mestre com o esquema aplicado
+        versao (str): Impressão digital dos dados (nome do arquivo)
+        metadados (dict): Textos guardados nos metadados do esquema Arrow
+    Returns:
+        str: Caminho do arquivo gravado
+    """
+    caminho = caminho_tabela_mestre(versao, diretorio)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+    # Um único lote: com colunas em vários pedaços (as strings do pandas vêm
+    # assim), o arquivo teria vários lotes e to_pandas copiaria todas as colunas
+    tabela = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    if metadados:
+        tabela = tabela.replace_schema_metadata({**(tabela.schema.metadata or {}), **metadados})
+
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with pa.OSFile(temporario, 'wb') as arquivo, ipc.new_file(arquivo, tabela.schema) as escritor:
+        escritor.write_table(tabela)
+    os.replace(temporario, caminho)
+
+    for nome in os.listdir(os.path.dirname(caminho)):
+        if nome.endswith('.arrow') and nome != os.path.basename(caminho):
+            try:
+                os.remove(os.path.join(os.path.dirname(caminho), nome))
+            except OSError:
+                pass
+    return caminho
+
+
+def abrir_tabela_mestre(versao, diretorio=DIRETORIO_CACHE):
+    """
+    Abre a tabela mestre exportada por mapeamento de memória.
+
+    As colunas numéricas sem nulos apontam direto para as páginas do
+    arquivo, que o sistema operacional compartilha entre todos os processos
+    que o abrem. As demais (com nulos, booleanas, categóricas e de texto)
+    ainda são materializadas na memória do processo por `to_pandas`.
+    Returns:
+        tuple: (DataFrame, dict de metadados) ou None se o arquivo não existir
+    """
+    try:
+        mapa = pa.memory_map(caminho_tabela_mestre(versao, diretorio), 'r')
+    except FileNotFoundError:
+        return None
+    tabela = ipc.open_file(mapa).read_all()
+    metadados = {
+        chave.decode('utf-8'): valor.decode('utf-8')
+        for chave, valor in (tabela.schema.metadata or {}).items()
+        if chave != b'pandas'
+    }
+    return tabela.to_pandas(split_blocks=True), metadados
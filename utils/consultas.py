@@ -0,0 +1,277 @@
+"""
+Backend SQL opcional (DuckDB) sobre o cache colunar.
+
+As consultas rodam direto sobre os arquivos Parquet das partições, por uma
+visão `repasses`; nenhuma cópia dos dados fica no heap do processo, e o
+DuckDB lê só as colunas e partições necessárias, inclusive para bases
+maiores que a memória. Uma conexão é aberta por processo e cada thread
+(sessão do Streamlit) usa o seu próprio cursor. A visão traz também
+`id_entidade` e `entidade`, por junção com a pequena tabela `entidades`
+resolvida na abertura (ver utils.entidades).
+
+A visão traz ainda as colunas de COLUNAS_ENRIQUECIDAS (valores reais e por
+habitante), por junção com o fator do IPCA e a população de cada
+(código IBGE, exercício), como em utils.referencia.enriquecer.
+
+O backend é opcional e só é usado quando pedido (REPASSES_BACKEND=duckdb)
+e o pacote `duckdb` está instalado; do contrário, `disponivel()` retorna
+False e o painel usa o cubo em pandas.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.armazenamento import DIRETORIO_CACHE
+from utils.cubo import funcoes_por_grupo
+from utils.entidades import resolver_entidades
+from utils.esquema import aplicar_esquema
+from utils.grade import COLUNAS_BUSCA
+from utils.referencia import carregar_ipca, carregar_populacao, fatores_ipca, populacao_por_ano
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Somas das colunas enriquecidas, com os mesmos nomes de utils.cubo.SOMAS_ADICIONAIS
+_SOMAS_ENRIQUECIDAS = {
+    'soma_real': 'vl_pago_real',
+    'soma_per_capita': 'vl_pago_per_capita',
+    'soma_real_per_capita': 'vl_pago_real_per_capita'
+}
+
+
+def disponivel():
+    """Indica se o backend SQL foi pedido (REPASSES_BACKEND=duckdb) e pode ser usado (DuckDB instalado)."""
+    return duckdb is not None and os.environ.get('REPASSES_BACKEND', 'pandas').lower() == 'duckdb'
+
+
+class BancoConsultas:
+    """Conexão DuckDB com a visão `repasses` sobre as partições de um manifesto."""
+
+    def __init__(self, manifesto, diretorio=DIRETORIO_CACHE):
+        if duckdb is None:
+            raise ImportError("O backend SQL requer o pacote duckdb (pip install duckdb)")
+        arquivos = [
+            os.path.abspath(os.path.join(diretorio, relativo))
+            for particao in manifesto['particoes'].values()
+            for relativo in particao['arquivos']
+        ]
+        if not arquivos:
+            raise ValueError("O cache não tem partições para consultar")
+
+        self._conexao = duckdb.connect()
+        lista = ', '.join("'" + caminho.replace("'", "''") + "'" for caminho in sorted(arquivos))
+
+        # Entidades resolvidas como na tabela mestre, a partir dos mesmos pares distintos
+        pares = self._conexao.execute(
+            f"SELECT razao_social, cnpj, count(*) AS linhas FROM read_parquet([{lista}]) GROUP BY ALL"
+        ).df()
+        ids, nomes = resolver_entidades(pares)
+        self._conexao.register('pares_entidades', pares[['razao_social', 'cnpj']].assign(
+            id_entidade=ids, entidade=np.where(ids >= 0, nomes.to_numpy(dtype=object)[ids], None)
+        ))
+        self._conexao.execute("CREATE TABLE entidades AS SELECT * FROM pares_entidades")
+        self._conexao.unregister('pares_entidades')
+
+        enriquecidas, juncao = '', ''
+        if self._registrar_referencias(lista):
+            enriquecidas = (
+                "r.vl_pago * f.fator AS vl_pago_real, r.vl_pago / f.populacao AS vl_pago_per_capita, "
+                "r.vl_pago * f.fator / f.populacao AS vl_pago_real_per_capita, "
+            )
+            juncao = " LEFT JOIN referencias f ON r.codigo_ibge = f.codigo_ibge AND r.exercicio = f.exercicio"
+
+        # A junção não preserva a ordem de leitura: _arquivo e _linha a restauram em `linhas`
+        self._conexao.execute(
+            "CREATE VIEW repasses AS SELECT r.* EXCLUDE (filename, file_row_number), e.id_entidade, e.entidade, "
+            f"{enriquecidas}r.filename AS _arquivo, r.file_row_number AS _linha "
+            f"FROM read_parquet([{lista}], filename = true, file_row_number = true) r LEFT JOIN entidades e "
+            "ON r.razao_social IS NOT DISTINCT FROM e.razao_social AND r.cnpj IS NOT DISTINCT FROM e.cnpj"
+            f"{juncao}"
+        )
+        self.colunas = [
+            coluna for coluna in self._conexao.execute("SELECT * FROM repasses LIMIT 0").df().columns
+            if coluna not in ('_arquivo', '_linha')
+        ]
+        self._local = threading.local()
+
+    def _registrar_referencias(self, lista):
+        """Tabela `referencias` com o fator do IPCA e a população de cada (código IBGE, exercício) presente."""
+        try:
+            populacao, ipca = carregar_populacao(), carregar_ipca()
+        except FileNotFoundError:
+            return False
+        pares = self._conexao.execute(
+            f"SELECT DISTINCT codigo_ibge, exercicio FROM read_parquet([{lista}]) ORDER BY ALL"
+        ).df()
+        codigos = pares['codigo_ibge'].to_numpy().astype(np.int64)
+        anos = pares['exercicio'].to_numpy().astype(np.int64)
+        self._conexao.register('pares_referencias', pares.assign(
+            fator=fatores_ipca(ipca).reindex(anos).to_numpy(),
+            populacao=populacao_por_ano(populacao, anos).reindex(pd.MultiIndex.from_arrays([codigos, anos])).to_numpy()
+        ))
+        self._conexao.execute("CREATE TABLE referencias AS SELECT * FROM pares_referencias")
+        self._conexao.unregister('pares_referencias')
+        return True
+
+    def cursor(self):
+        """Cursor da thread atual (cursores DuckDB não devem ser compartilhados entre threads)."""
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self._conexao.cursor()
+        return cursor
+
+    def consultar(self, sql, parametros=None):
+        return self.cursor().execute(sql, parametros or []).df()
+
+
+def _condicoes(municipio, anos=None, funcoes=None, valor_min=None, valor_max=None, busca=None):
+    """
+    Cláusula WHERE parametrizada; `anos` e `funcoes` None não filtram e
+    listas vazias não selecionam nada (como utils.filtros.MotorFiltros).
+    `busca` mantém as linhas em que alguma coluna de COLUNAS_BUSCA contém o
+    termo, sem diferenciar maiúsculas (como utils.grade.buscar_texto).
+    """
+    clausulas, parametros = ['municipio = ?'], [municipio.lower()]
+    if anos is not None:
+        clausulas.append('list_contains(?, exercicio)')
+        parametros.append([int(a) for a in anos])
+    if funcoes is not None:
+        clausulas.append('list_contains(?, funcao_de_governo)')
+        parametros.append(list(funcoes))
+    if valor_min is not None:
+        clausulas.append('vl_pago >= ?')
+        parametros.append(float(valor_min))
+    if valor_max is not None:
+        clausulas.append('vl_pago <= ?')
+        parametros.append(float(valor_max))
+    termo = (busca or '').strip().lower()
+    if termo:
+        clausulas.append('(' + ' OR '.join(f"contains(lower(CAST({c} AS VARCHAR)), ?)" for c in COLUNAS_BUSCA) + ')')
+        parametros += [termo] * len(COLUNAS_BUSCA)
+    return ' AND '.join(clausulas), parametros
+
+
+def agregar(banco, municipio, por=(), anos=None, funcoes=None, com_funcoes=False, com_mediana=False, exato=False):
+    """
+    Mesmas medidas de `utils.cubo.agregar_cubo`, calculadas em SQL.
+    Args:
+        banco (BancoConsultas): Conexão com a visão `repasses`
+        municipio (str): Município consultado
+        por (tuple): Colunas do agrupamento (vazio para o total geral)
+        anos, funcoes (list): Filtros (None para todos; vazio para nenhum)
+        com_funcoes (bool): Inclui a lista de funções de governo de cada grupo
+        com_mediana (bool): Inclui a mediana de `vl_pago`
+        exato (bool): Sem efeito: em SQL a mediana é sempre exata (o t-digest
+            do DuckDB errava alguns por cento, bem acima de utils.esbocos.ALFA);
+            mantido pela assinatura comum com o cubo
+    Returns:
+        DataFrame: contagem, soma, media, desvio_padrao, minimo, maximo,
+        entidades, as somas enriquecidas (soma_real...) quando a visão as tem
+        e, opcionalmente, funcoes e mediana
+    """
+    por = list(por)
+    onde, parametros = _condicoes(municipio, anos, funcoes)
+    grupos = ', '.join(por)
+    medidas = [
+        'count(*) AS contagem',
+        'sum(vl_pago) AS soma',
+        'avg(vl_pago) AS media',
+        'stddev_samp(vl_pago) AS desvio_padrao',
+        'min(vl_pago) AS minimo',
+        'max(vl_pago) AS maximo',
+        'count(DISTINCT entidade) AS entidades'
+    ]
+    adicionais = [nome for nome, coluna in _SOMAS_ENRIQUECIDAS.items() if coluna in banco.colunas]
+    medidas += [f"sum({_SOMAS_ENRIQUECIDAS[nome]}) AS {nome}" for nome in adicionais]
+    if com_mediana:
+        medidas.append('median(vl_pago) AS mediana')
+    sql = f"SELECT {grupos + ', ' if por else ''}{', '.join(medidas)} FROM repasses WHERE {onde}"
+    if por:
+        sql += f" GROUP BY {grupos}"
+    resultado = aplicar_esquema(banco.consultar(sql, parametros))
+
+    if por:
+        # Ordem dos índices igual à do cubo (códigos das categorias)
+        resultado = resultado.set_index(por).sort_index()
+    if com_funcoes:
+        pares = banco.consultar(
+            f"SELECT DISTINCT {grupos + ', ' if por else ''}funcao_de_governo FROM repasses WHERE {onde}",
+            parametros
+        )
+        pares = aplicar_esquema(pares)
+        if por:
+            resultado['funcoes'] = funcoes_por_grupo(pares, por)
+        else:
+            resultado['funcoes'] = funcoes_por_grupo(pares.assign(total=0), ['total']).to_numpy()
+
+    colunas = ['contagem', 'soma', 'media', 'desvio_padrao', 'minimo', 'maximo', 'entidades'] + adicionais
+    if com_funcoes:
+        colunas.append('funcoes')
+    if com_mediana:
+        colunas.append('mediana')
+    return resultado[colunas]
+
+
+def estatisticas(banco, municipio, anos=None, funcoes=None, exato=False):
+    """
+    Mesmas estatísticas de `utils.esbocos.estatisticas_exatas`, em SQL.
+    A mediana e as entidades distintas são sempre exatas: o DuckDB as
+    calcula sem trazer as linhas ao Python, e as aproximações dele (t-digest
+    e HyperLogLog) erravam bem mais que os esboços de utils.esbocos. `exato` é mantido
+    pela assinatura comum com `estatisticas_exatas`.
+    Returns:
+        Series: contagem, soma, media, mediana, desvio_padrao, minimo, maximo,
+        assimetria, curtose e entidades
+    """
+    onde, parametros = _condicoes(municipio, anos, funcoes)
+    sql = (
+        "SELECT count(*) AS contagem, sum(vl_pago) AS soma, avg(vl_pago) AS media, "
+        "median(vl_pago) AS mediana, stddev_samp(vl_pago) AS desvio_padrao, "
+        "min(vl_pago) AS minimo, max(vl_pago) AS maximo, skewness(vl_pago) AS assimetria, "
+        f"kurtosis(vl_pago) AS curtose, count(DISTINCT entidade) AS entidades FROM repasses WHERE {onde}"
+    )
+    return banco.consultar(sql, parametros).iloc[0]
+
+
+def linhas(banco, municipio, anos=None, funcoes=None, valor_min=None, valor_max=None,
+           ordem=None, ascendente=True, limite=None, deslocamento=0, busca=None):
+    """
+    Linhas do município que atendem aos filtros (e à busca de texto),
+    opcionalmente ordenadas por uma coluna da visão e paginadas.
+    Returns:
+        DataFrame: Repasses com o esquema de tipos compactos
+    """
+    onde, parametros = _condicoes(municipio, anos, funcoes, valor_min, valor_max, busca)
+    sql = f"SELECT * EXCLUDE (_arquivo, _linha) FROM repasses WHERE {onde} ORDER BY "
+    if ordem is not None:
+        if ordem not in banco.colunas:
+            raise ValueError(f"Ordenação não suportada: {ordem}")
+        sql += f"{ordem} {'ASC' if ascendente else 'DESC'}, "
+    sql += "_arquivo, _linha"
+    if limite is not None:
+        sql += " LIMIT ? OFFSET ?"
+        parametros += [int(limite), int(deslocamento)]
+    return aplicar_esquema(banco.consultar(sql, parametros))
+
+
+def valores(banco, municipio, anos=None, funcoes=None):
+    """Só a coluna `vl_pago` das linhas do filtro, como array (para os resumos de distribuição)."""
+    onde, parametros = _condicoes(municipio, anos, funcoes)
+    return banco.consultar(f"SELECT vl_pago FROM repasses WHERE {onde}", parametros)['vl_pago'].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def contar_linhas(banco, municipio, anos=None, funcoes=None, valor_min=None, valor_max=None, busca=None):
+    """
+    Quantidade de linhas que `linhas` devolveria sem paginação, e a soma de `vl_pago` delas.
+    Returns:
+        tuple: (linhas, soma)
+    """
+    onde, parametros = _condicoes(municipio, anos, funcoes, valor_min, valor_max, busca)
+    quantidade, soma = banco.cursor().execute(
+        f"SELECT count(*), coalesce(sum(vl_pago), 0) FROM repasses WHERE {onde}", parametros
+    ).fetchone()
+    return int(quantidade), float(soma)
@@ -0,0 +1,183 @@
+"""
+Cubo de agregações pré-calculadas dos repasses.
+
+Cada célula do cubo corresponde a uma combinação de município, exercício,
+função de governo e entidade, e guarda contagem, soma, média, M2 (soma dos
+quadrados dos desvios em relação à média da célula), mínimo e máximo de
+`vl_pago`. Qualquer agregação usada pelas páginas (por ano, por função, por
+entidade, por município...) é obtida mesclando células, sem voltar às
+linhas originais.
+"""
+import numpy as np
+import pandas as pd
+
+DIMENSOES = ['municipio', 'exercicio', 'funcao_de_governo', 'entidade']
+
+# Somas adicionais, calculadas quando o DataFrame tem as colunas enriquecidas
+# (valores reais e por habitante, ver utils.referencia)
+SOMAS_ADICIONAIS = {
+    'soma_real': 'vl_pago_real',
+    'soma_per_capita': 'vl_pago_per_capita',
+    'soma_real_per_capita': 'vl_pago_real_per_capita'
+}
+
+
+def construir_cubo(df):
+    """
+    Constrói o cubo a partir dos repasses linha a linha.
+    Args:
+        df (DataFrame): Repasses com as colunas de DIMENSOES e `vl_pago`
+    Returns:
+        DataFrame: Uma linha por célula, com as dimensões e as medidas
+    """
+    adicionais = {nome: coluna for nome, coluna in SOMAS_ADICIONAIS.items() if coluna in df}
+    grupos = df[DIMENSOES + ['vl_pago'] + list(adicionais.values())].groupby(DIMENSOES, observed=True, sort=True)
+    cubo = grupos.agg(
+        contagem=('vl_pago', 'size'),
+        soma=('vl_pago', 'sum'),
+        media=('vl_pago', 'mean'),
+        minimo=('vl_pago', 'min'),
+        maximo=('vl_pago', 'max')
+    )
+    # Desvios em relação à média da própria célula: sem o cancelamento de soma dos quadrados - soma²/n
+    cubo['m2'] = grupos['vl_pago'].var(ddof=0) * cubo['contagem']
+    for nome, coluna in adicionais.items():
+        # min_count=1: célula sem população/IPCA fica NaN, e não zero
+        cubo[nome] = grupos[coluna].sum(min_count=1)
+    return cubo.reset_index()
+
+
+def filtrar_cubo(cubo, filtros=None):
+    """Restringe o cubo às células cujas dimensões estão nos valores pedidos."""
+    if not filtros:
+        return cubo
+    mascara = np.ones(len(cubo), dtype=bool)
+    for coluna, valores in filtros.items():
+        if valores is not None and len(valores) > 0:
+            mascara &= cubo[coluna].isin(valores).to_numpy()
+    return cubo[mascara]
+
+
+def _codificar(serie):
+    """Retorna os códigos inteiros (-1 para nulos) e os valores distintos de uma coluna."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy().astype(np.int64), serie.cat.categories
+    codigos, valores = pd.factorize(serie, sort=True)
+    return codigos.astype(np.int64), valores
+
+
+def funcoes_por_grupo(df, por):
+    """
+    Lista, sem repetição e na ordem das categorias, as funções de governo de cada grupo.
+
+    Cada função vira um bit (pelo código categórico) e a máscara de cada
+    grupo é o OR dos bits dos seus pares (grupo, função) distintos. Há
+    poucas máscaras distintas, então só elas são convertidas em texto.
+    Args:
+        df (DataFrame): Linhas (ou células do cubo) com `funcao_de_governo`
+        por (list): Colunas que definem os grupos
+    Returns:
+        Series: Texto "Função A, Função B" indexado pelos grupos
+    """
+    codigos, categorias = _codificar(df['funcao_de_governo'])
+
+    if len(categorias) > 62:
+        # Não cabe em uma máscara de 64 bits: concatenação agrupada dos pares únicos
+        pares = df[por].assign(funcao=df['funcao_de_governo']).dropna().drop_duplicates()
+        pares = pares.sort_values(por + ['funcao']).astype({'funcao': object})
+        return pares.groupby(por, observed=True, sort=True)['funcao'].agg(', '.join).rename('funcoes')
+
+    codificadas = [_codificar(df[coluna]) for coluna in por]
+    dimensoes = tuple(max(len(valores), 1) for _, valores in codificadas)
+    validos = codigos >= 0
+    for codigo, _ in codificadas:
+        validos &= codigo >= 0
+    numero_grupo = np.ravel_multi_index([codigo[validos] for codigo, _ in codificadas], dimensoes)
+
+    # Pares (grupo, função) distintos, empacotados em um inteiro: grupo * 64 + função
+    pares = np.sort(pd.unique(numero_grupo * 64 + codigos[validos]))
+    grupo_par, bits = pares >> 6, np.left_shift(np.int64(1), pares & 63)
+
+    # Com os pares ordenados por grupo, a máscara é o OR de cada trecho contíguo
+    inicios = np.flatnonzero(np.diff(grupo_par, prepend=-1))
+    grupos = grupo_par[inicios]
+    mascaras = np.bitwise_or.reduceat(bits, inicios) if len(pares) else bits
+
+    niveis = [
+        pd.Categorical.from_codes(codigo, valores) if isinstance(df[coluna].dtype, pd.CategoricalDtype)
+        else np.asarray(valores)[codigo]
+        for coluna, codigo, (_, valores) in zip(por, np.unravel_index(grupos, dimensoes), codificadas)
+    ]
+    indice = pd.MultiIndex.from_arrays(niveis, names=por) if len(por) > 1 else pd.Index(niveis[0], name=por[0])
+
+    unicas, inversa = np.unique(mascaras, return_inverse=True)
+    nomes = np.asarray(categorias, dtype=object)
+    posicoes = np.arange(len(categorias), dtype=np.int64)
+    textos = np.array(
+        [', '.join(nomes[(mascara >> posicoes) & 1 == 1]) for mascara in unicas],
+        dtype=object
+    )
+    return pd.Series(textos[inversa.ravel()], index=indice, name='funcoes')
+
+
+def top_n_por_grupo(df, grupo, coluna, n=10):
+    """
+    As `n` linhas de maior `coluna` em cada grupo, numa única ordenação.
+    Args:
+        df (DataFrame): Linhas já agregadas (ex.: município x entidade)
+        grupo (str): Coluna que define os grupos
+        coluna (str): Coluna usada no ranking
+        n (int): Linhas por grupo
+    Returns:
+        DataFrame: Linhas agrupadas na ordem de `grupo`, decrescentes em `coluna`
+    """
+    ordenado = df.sort_values(coluna, ascending=False, kind='stable')
+    top = ordenado.groupby(grupo, observed=True, sort=False).head(n)
+    # Ordenação estável pelo grupo: mantém o ranking dentro de cada grupo
+    return top.sort_values(grupo, kind='stable')
+
+
+def agregar_cubo(cubo, por=(), filtros=None, com_funcoes=False):
+    """
+    Consolida (roll-up) as células do cubo pelas dimensões pedidas.
+    Args:
+        cubo (DataFrame): Resultado de `construir_cubo`
+        por (list): Dimensões do resultado (vazio para o total geral)
+        filtros (dict): Valores aceitos por dimensão, ex.: {'exercicio': [2023]}
+        com_funcoes (bool): Inclui a lista de funções de governo de cada grupo
+    Returns:
+        DataFrame: contagem, soma, media, desvio_padrao, minimo, maximo,
+        entidades (distintas), as somas adicionais presentes no cubo e,
+        opcionalmente, funcoes
+    """
+    cubo = filtrar_cubo(cubo, filtros)
+    por = list(por)
+    chave = por if por else np.zeros(len(cubo), dtype=np.int8)
+    grupos = cubo.groupby(chave, observed=True, sort=True)
+
+    adicionais = [nome for nome in SOMAS_ADICIONAIS if nome in cubo]
+    resultado = grupos[['contagem', 'soma'] + adicionais].sum(min_count=1)
+    resultado['minimo'] = grupos['minimo'].min()
+    resultado['maximo'] = grupos['maximo'].max()
+    resultado['entidades'] = grupos['entidade'].nunique()
+    if com_funcoes:
+        if por:
+            resultado['funcoes'] = funcoes_por_grupo(cubo, por)
+        else:
+            resultado['funcoes'] = funcoes_por_grupo(cubo.assign(total=0), ['total']).to_numpy()
+
+    # M2 do grupo pela fórmula de Chan/Pébay (utils.esbocos.Momentos.mesclar)
+    # para k células de uma vez: M2 = soma(M2_i) + soma(n_i * (media_i - media)^2)
+    n = resultado['contagem']
+    resultado['media'] = resultado['soma'] / n
+    media_grupo = grupos['soma'].transform('sum') / grupos['contagem'].transform('sum')
+    desvios = cubo['media'] - media_grupo
+    parcelas = cubo['m2'] + cubo['contagem'] * desvios * desvios
+    m2 = cubo.assign(m2=parcelas).groupby(chave, observed=True, sort=True)['m2'].sum()
+    resultado['desvio_padrao'] = np.sqrt((m2 / (n - 1)).where(n > 1))
+
+    colunas = ['contagem', 'soma', 'media', 'desvio_padrao', 'minimo', 'maximo', 'entidades'] + adicionais
+    if com_funcoes:
+        colunas.append('funcoes')
+    resultado = resultado[colunas]
+    return resultado if por else resultado.reset_index(drop=True)
@@ -1,135 +1,628 @@
+import logging
+import math
+import threading
+from io import StringIO
+
+import numpy as np
 import pandas as pd
 import streamlit as st
+from utils import consultas
+from utils.armazenamento import (
+    abrir_tabela_mestre,
+    exportar_tabela_mestre,
+    garantir_cache,
+    impressao_digital,
+    ler_repasses,
+    marca_cache
+)
+from utils.anomalias import GRUPOS_ANOMALIA, concentracao_entidades, pontuar_anomalias
+from utils.cubo import agregar_cubo, construir_cubo, filtrar_cubo
+from utils.distribuicao import resumir_distribuicao
+from utils.entidades import aplicar_entidades, assinatura_entidades
+from utils.esbocos import combinar, construir_esbocos, estatisticas_exatas, resumo_vazio
+from utils.esquema import aplicar_esquema, relatorio_memoria, uso_memoria
+from utils.figuras import CacheFiguras, chave_figura
+from utils.filtros import MotorFiltros
+from utils.grade import buscar_texto, ordem_linhas
+from utils.municipios import MUNICIPIOS_COMPARACAO
+from utils.referencia import assinatura_referencias, carregar_ipca, enriquecer
+
+logger = logging.getLogger(__name__)
+
+_SEPARADORES_BR = str.maketrans(',.', '.,')
 
 def formatar_valor_reais(valor):
     """
     Formata um valor numérico para o formato de moeda brasileira.
+    Mesmo texto de formatar_valores_reais (arredondamento de `format()`),
+    sem o custo de montar arrays para um único valor.
     Exemplos:
     1234.56 -> R$ 1.234,56
     1234567.89 -> R$ 1,23M
     1234567890.12 -> R$ 1,23B
     """
-    if valor is None:
-        return "R$ 0,00"
-        
     try:
-        if abs(valor) >= 1_000_000_000:  # Bilhões
-            return f"R$ {valor/1_000_000_000:,.2f}B"
-        elif abs(valor) >= 1_000_000:  # Milhões
-            return f"R$ {valor/1_000_000:,.2f}M"
-        else:  # Valores normais
-            return f"R$ {valor:,.2f}"
-    except:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return "R$ 0,00"
+    if not math.isfinite(valor):
         return "R$ 0,00"
 
-@st.cache_data
+    if abs(valor) >= 1_000_000_000:  # Bilhões
+        texto, sufixo = f"{valor / 1_000_000_000:,.2f}", "B"
+    elif abs(valor) >= 1_000_000:  # Milhões
+        texto, sufixo = f"{valor / 1_000_000:,.2f}", "M"
+    else:  # Valores normais
+        texto, sufixo = f"{valor:,.2f}", ""
+    # Negativos que arredondam a zero não levam sinal
+    if texto == '-0.00':
+        texto = texto[1:]
+    return f"R$ {texto.translate(_SEPARADORES_BR)}{sufixo}"
+
+def _centavos(valores):
+    """
+    Arredonda `valores` (não negativos) a centavos, inteiros, pelo valor exato
+    de cada double e metade para o par, como `format(valor, '.2f')`.
+    Multiplicar por 100 arredonda o produto; o erro desse arredondamento é
+    recuperado sem perdas (produto de Dekker) e decide os casos limítrofes.
+    """
+    produto = valores * 100
+    # 100 cabe em 27 bits, então só `valores` precisa ser partido
+    partido = valores * 134217729.0
+    alto = partido - (partido - valores)
+    baixo = valores - alto
+    erro = ((alto * 100 - produto) + baixo * 100)
+
+    inteiros = np.floor(produto)
+    # Sinal de (valor exato * 100) - (inteiros + 0,5); as duas subtrações são exatas perto da metade
+    diferenca = ((produto - inteiros) - 0.5) + erro
+    acima = (diferenca > 0) | ((diferenca == 0) & (inteiros % 2 == 1))
+    return (inteiros + acima).astype(np.int64)
+
+def formatar_valores_reais(valores, nulo="R$ 0,00"):
+    """
+    Versão vetorizada de formatar_valor_reais, para colunas inteiras.
+    Usa os mesmos limites de milhões (M) e bilhões (B) e separadores brasileiros.
+    Args:
+        valores (array-like): Valores numéricos (Series, ndarray ou lista)
+        nulo (str): Texto usado para valores nulos ou não numéricos
+    Returns:
+        ndarray: Textos formatados, na mesma ordem dos valores
+    """
+    if isinstance(valores, np.ndarray) and valores.dtype == np.float64:
+        numeros = valores
+    else:
+        numeros = pd.to_numeric(pd.Series(valores), errors='coerce').astype('float64').to_numpy()
+    nulos = ~np.isfinite(numeros)
+    numeros = np.where(nulos, 0.0, numeros)
+    absolutos = np.abs(numeros)
+
+    bilhoes = absolutos >= 1_000_000_000
+    milhoes = ~bilhoes & (absolutos >= 1_000_000)
+    divisor = np.select([bilhoes, milhoes], [1_000_000_000, 1_000_000], 1)
+
+    centavos = _centavos(absolutos / divisor)
+    inteiros, fracao = np.divmod(centavos, 100)
+    negativos = (numeros < 0) & (centavos > 0)
+
+    # Monta os textos como uma matriz de bytes ASCII, alinhada à direita:
+    # [sinal][dígitos com pontos de milhar][,][centavos][sufixo]
+    n_digitos = max(len(str(int(inteiros.max()))) if len(inteiros) else 1, 1)
+    largura = 1 + n_digitos + (n_digitos - 1) // 3
+    matriz = np.zeros((len(numeros), largura + 4), dtype=np.uint8)
+    coluna = largura - 1
+    digitos_usados = np.ones(len(numeros), dtype=np.int64)
+    quociente = inteiros
+    for posicao in range(n_digitos):
+        if posicao and posicao % 3 == 0:
+            matriz[:, coluna] = ord('.')
+            coluna -= 1
+        if posicao:
+            digitos_usados += quociente > 0
+        quociente, digito = np.divmod(quociente, 10)
+        matriz[:, coluna] = digito + ord('0')
+        coluna -= 1
+    matriz[:, largura] = ord(',')
+    matriz[:, largura + 1] = fracao // 10 + ord('0')
+    matriz[:, largura + 2] = fracao % 10 + ord('0')
+    matriz[:, largura + 3] = np.select([bilhoes, milhoes], [ord('B'), ord('M')], 0)
+
+    # Descarta zeros à esquerda deslocando cada linha; o sinal ocupa a posição anterior aos dígitos
+    ocupados = digitos_usados + (digitos_usados - 1) // 3
+    deslocamento = largura - ocupados - negativos
+    matriz[np.flatnonzero(negativos), (largura - ocupados - 1)[negativos]] = ord('-')
+    indices = np.arange(largura + 4) + deslocamento[:, None]
+    matriz = np.where(indices < largura + 4, np.take_along_axis(matriz, np.minimum(indices, largura + 3), axis=1), 0)
+
+    prefixo = np.broadcast_to(np.frombuffer(b'R$ ', dtype=np.uint8), (len(numeros), 3))
+    matriz = np.ascontiguousarray(np.hstack([prefixo, matriz]), dtype=np.uint8)
+    texto = matriz.view(f'S{matriz.shape[1]}').ravel().astype(str).astype(object)
+    texto[nulos] = nulo
+    return texto
+
+def formatar_colunas_reais(df, colunas, nulo="R$ 0,00"):
+    """Retorna uma cópia do DataFrame com as colunas monetárias já formatadas em texto."""
+    return df.assign(**{coluna: formatar_valores_reais(df[coluna], nulo) for coluna in colunas})
+
+# As sessões e o aquecimento (utils.aquecimento) rodam em threads do mesmo
+# processo: só uma por vez verifica e, se preciso, reconstrói o cache em disco
+_trava_cache = threading.Lock()
+
+# (marca_cache, manifesto, impressão digital) da última verificação: enquanto
+# o manifesto e a origem não mudam, nada é relido nem espera pela trava
+_manifesto_lido = None
+
+def _manifesto_atual():
+    global _manifesto_lido
+    lido = _manifesto_lido
+    if lido is not None and marca_cache(lido[1]) == lido[0]:
+        return lido
+    with _trava_cache:
+        lido = _manifesto_lido
+        if lido is None or marca_cache(lido[1]) != lido[0]:
+            manifesto = garantir_cache()
+            _manifesto_lido = lido = (marca_cache(manifesto), manifesto, impressao_digital(manifesto))
+        return lido
+
+def _manifesto():
+    return _manifesto_atual()[1]
+
+def versao_dados():
+    """Retorna a impressão digital da versão atual do cache de dados e das tabelas de referência."""
+    return f"{_manifesto_atual()[2]}-{assinatura_referencias()}"
+
+# Formato da tabela mestre exportada: mude quando as colunas derivadas ou
+# os metadados gravados mudarem, para não abrir arquivos de versões antigas
+# (3: um único lote por arquivo)
+_FORMATO_MESTRE = 3
+
+def _memoria_bruta(df):
+    """
+    Memória por coluna dos repasses como lidos da origem (read_csv ou
+    planilha, antes de qualquer conversão de tipos), registrada na ingestão.
+    Deltas mudam a quantidade de linhas desde então: os bytes são escalados
+    para as linhas atuais. Sem o registro (caches antigos), mede as linhas
+    do cache sem o esquema, cujas numéricas já vêm tipadas.
+    """
+    bruta = _manifesto().get('memoria_bruta') or {}
+    atual = uso_memoria(df)
+    if not bruta.get('linhas'):
+        return atual
+    escala = len(df) / bruta['linhas']
+    return pd.Series(bruta['bytes'], dtype='float64').mul(escala).round().reindex(atual.index).fillna(atual)
+
+@st.cache_resource(max_entries=1)
+def _tabela_mestre(versao):
+    """
+    Tabela normalizada de todos os municípios, compartilhada pelo processo.
+    Como vem ordenada por município, cada município ocupa um intervalo
+    contínuo de linhas, guardado em `limites`.
+
+    Na primeira carga de cada versão a tabela é tipada, enriquecida com os
+    valores reais e por habitante (utils.referencia) e com a entidade
+    resolvida de cada repasse (utils.entidades), pontuada quanto a valores
+    atípicos (utils.anomalias) e gravada em Arrow IPC, com os resumos por
+    grupo e a concentração por entidade nos metadados; os demais processos
+    (e reinícios) só abrem esse arquivo mapeado em memória, sem reprocessar
+    as partições.
+    """
+    arquivo = f"{versao}-{_FORMATO_MESTRE}"
+    aberta = abrir_tabela_mestre(arquivo)
+    if aberta is None:
+        df = ler_repasses(tipar=False).reset_index(drop=True)
+        antes = _memoria_bruta(df)
+        df = aplicar_esquema(df)
+        relatorio = relatorio_memoria(antes, uso_memoria(df))
+        logger.info("Memória da tabela mestre:\n%s", relatorio)
+        try:
+            df = enriquecer(df)
+        except FileNotFoundError as e:
+            logger.warning("Tabelas de referência não encontradas; valores reais e per capita indisponíveis: %s", e)
+        df = aplicar_entidades(df)
+        df, caixas = pontuar_anomalias(df)
+        exportar_tabela_mestre(df, arquivo, {
+            'relatorio_memoria': relatorio.to_json(orient='split'),
+            'caixas': caixas.reset_index().to_json(orient='split'),
+            'concentracao': concentracao_entidades(df).reset_index().to_json(orient='split')
+        })
+        # Reabre pelo mapeamento, liberando a cópia do heap
+        aberta = abrir_tabela_mestre(arquivo)
+
+    df, metadados = aberta
+    relatorio = pd.read_json(StringIO(metadados['relatorio_memoria']), orient='split')
+    analises = {
+        'caixas': pd.read_json(StringIO(metadados['caixas']), orient='split').set_index(GRUPOS_ANOMALIA),
+        'concentracao': pd.read_json(StringIO(metadados['concentracao']), orient='split').set_index(['municipio', 'exercicio'])
+    }
+
+    mudancas = df['municipio'].ne(df['municipio'].shift()).to_numpy().nonzero()[0]
+    fins = list(mudancas[1:]) + [len(df)]
+    limites = {df['municipio'].iat[inicio]: (int(inicio), int(fim)) for inicio, fim in zip(mudancas, fins)}
+    return df, limites, relatorio, analises
+
+def carregar_tabela_mestre():
+    """
+    Retorna a tabela mestre e os intervalos de linhas de cada município.
+    A leitura acontece uma única vez por processo (e por versão dos dados);
+    o resultado é compartilhado e não deve ser modificado.
+    """
+    df, limites = _tabela_mestre(versao_dados())[:2]
+    return df, limites
+
+def get_relatorio_memoria():
+    """Retorna o uso de memória por coluna da tabela mestre, antes e depois do esquema."""
+    return _tabela_mestre(versao_dados())[2]
+
+def get_caixas(municipio='cotia', anos=None):
+    """
+    Resumo da distribuição de `vl_pago` por (exercício, função de governo) do
+    município: n, quartis, MAD, cercas, bigodes e quantidade de atípicos,
+    gravados junto com a tabela mestre (ver utils.anomalias).
+    """
+    caixas = _tabela_mestre(versao_dados())[3]['caixas']
+    caixas = caixas[caixas.index.get_level_values('municipio') == municipio.lower()].droplevel('municipio')
+    if anos:
+        caixas = caixas[caixas.index.get_level_values('exercicio').isin(anos)]
+    return caixas
+
+def get_concentracao(municipio='cotia'):
+    """Concentração dos valores por entidade (entidades, hhi, gini, maior_participacao) em cada exercício."""
+    concentracao = _tabela_mestre(versao_dados())[3]['concentracao']
+    return concentracao[concentracao.index.get_level_values('municipio') == municipio.lower()].droplevel('municipio')
+
+def get_atipicos(municipio='cotia', anos=None, funcoes=None, criterio='z'):
+    """
+    Repasses atípicos do município, dos mais extremos aos menos.
+    Args:
+        criterio (str): 'z' (z robusto) ou 'iqr' (fora das cercas do IQR)
+    Returns:
+        DataFrame: Linhas marcadas, com a coluna z_robusto
+    """
+    anos, funcoes = _chave_filtros(anos, funcoes)
+    df = _linhas(municipio, anos, funcoes)
+    marcados = df[df['atipico_z' if criterio == 'z' else 'atipico_iqr'].to_numpy()]
+    return marcados.iloc[np.argsort(-np.abs(marcados['z_robusto'].to_numpy()), kind='stable')]
+
+def _fatiar(df, limites, municipios):
+    """Monta a visão dos municípios pedidos a partir de fatias da tabela mestre."""
+    fatias = [df.iloc[slice(*limites[m])] for m in municipios if m in limites]
+    if not fatias:
+        return df.iloc[0:0]
+    if len(fatias) == 1:
+        return fatias[0]
+    return pd.concat(fatias)
+
 def carregar_dados_base(municipio='cotia'):
     """
     Carrega os dados base do município especificado.
     Args:
         municipio (str): Nome do município (cotia, itapevi ou vargem_grande_paulista)
     Returns:
-        DataFrame: Dados do município
+        DataFrame: Dados do município (fatia somente leitura da tabela mestre)
     """
     try:
-        # Carregar dados do Excel
-        df = pd.read_excel('data/repasses.xlsx')
-        
-        # Converter para minúsculas
-        df['municipio'] = df['municipio'].str.lower()
-        
-        # Padronizar o nome de Vargem Grande Paulista (caso haja variações)
-        df.loc[df['municipio'].str.contains('vargem'), 'municipio'] = 'vargem_grande_paulista'
-        
-        # Filtrar pelo município
-        df = df[df['municipio'] == municipio.lower()]
-        
-        # Otimizar tipos de dados
-        df['exercicio'] = df['exercicio'].astype('int32')
-        df['vl_pago'] = df['vl_pago'].astype('float64')
-        
-        return df
+        df, limites = carregar_tabela_mestre()
+        return _fatiar(df, limites, [municipio.lower()])
     except Exception as e:
         st.error(f"Erro ao carregar dados: {str(e)}")
         return None
 
+def _fatia_particao(municipio, exercicio=None):
+    """Linhas de um município, ou só de uma partição (município, exercício), da tabela mestre."""
+    df, limites = carregar_tabela_mestre()
+    fatia = _fatiar(df, limites, [municipio])
+    if exercicio is None:
+        return fatia
+    inicio, fim = np.searchsorted(fatia['exercicio'].to_numpy(), [exercicio, exercicio + 1])
+    return fatia.iloc[inicio:fim]
+
+@st.cache_data(max_entries=4096)
+def _assinatura_entidades(versao, municipio, exercicio=None):
+    """
+    Atribuição de entidades das linhas de um município (ou de uma partição).
+    A resolução usa a base inteira, então um delta em outro município pode
+    mudar o nome canônico de entidades daqui sem regravar estas partições.
+    """
+    return assinatura_entidades(_fatia_particao(municipio, exercicio))
+
+def _versao_particao(versao, manifesto, referencias, particao):
+    """Chave de cache de uma partição: suas linhas, as tabelas de referência e as entidades das suas linhas."""
+    municipio, exercicio = particao['municipio'], particao['exercicio']
+    return (f"{impressao_digital(manifesto, [municipio], [exercicio])}-{referencias}"
+            f"-{_assinatura_entidades(versao, municipio, exercicio)}")
+
+@st.cache_resource(max_entries=4096)
+def _cubo_particao(versao, municipio, exercicio):
+    """
+    Células do cubo de uma partição (município, exercício). `versao` é a
+    impressão digital só desta partição (e das entidades das suas linhas):
+    um delta que altera outros anos não invalida a peça.
+    """
+    return construir_cubo(_fatia_particao(municipio, exercicio))
+
+@st.cache_resource(max_entries=1)
+def _cubo(versao):
+    """Cubo de agregações de todos os municípios, montado com as peças de cada partição."""
+    manifesto = _manifesto()
+    referencias = assinatura_referencias()
+    pecas = [
+        _cubo_particao(_versao_particao(versao, manifesto, referencias, p), p['municipio'], p['exercicio'])
+        for p in sorted(manifesto['particoes'].values(), key=lambda p: (p['municipio'], p['exercicio']))
+    ]
+    if not pecas:
+        return construir_cubo(_tabela_mestre(versao)[0])
+    # Peças de versões diferentes da tabela mestre podem ter categorias diferentes
+    return aplicar_esquema(pd.concat(pecas, ignore_index=True))
+
+@st.cache_resource(max_entries=4096)
+def _esbocos_particao(versao, municipio, exercicio):
+    """Esboços (utils.esbocos) das células de uma partição; mesma chave de `_cubo_particao`."""
+    return construir_esbocos(_fatia_particao(municipio, exercicio))
+
+def _esbocos(municipio, anos=None):
+    """Esboços das células do município, só dos anos pedidos (se houver), mesclados a partir das partições."""
+    manifesto = _manifesto()
+    referencias = assinatura_referencias()
+    versao = versao_dados()
+    esbocos = {}
+    for p in manifesto['particoes'].values():
+        if p['municipio'] == municipio and (not anos or p['exercicio'] in anos):
+            esbocos.update(_esbocos_particao(_versao_particao(versao, manifesto, referencias, p), municipio, p['exercicio']))
+    return esbocos
+
+def carregar_cubo(municipios=None):
+    """
+    Retorna o cubo de agregações (ver utils.cubo), opcionalmente restrito a municípios.
+    Args:
+        municipios (list): Municípios desejados (None para todos)
+    Returns:
+        DataFrame: Células do cubo
+    """
+    cubo = _cubo(versao_dados())
+    if municipios is None:
+        return cubo
+    return filtrar_cubo(cubo, {'municipio': [m.lower() for m in municipios]})
+
+@st.cache_resource(max_entries=8)
+def _visao_municipios(versao, municipios):
+    df, limites = _tabela_mestre(versao)[:2]
+    return _fatiar(df, limites, municipios)
+
 @st.cache_data
-def carregar_dados_comparacao():
+def _ano_base_ipca(referencias):
+    return int(carregar_ipca()['ano'].max())
+
+def get_ano_base_ipca():
+    """Ano a cujos preços (dezembro) os valores reais estão corrigidos."""
+    return _ano_base_ipca(assinatura_referencias())
+
+def get_municipios():
+    """Municípios disponíveis nos dados, em ordem alfabética."""
+    return sorted(carregar_tabela_mestre()[1])
+
+def carregar_dados_comparacao(municipios=MUNICIPIOS_COMPARACAO):
     """
-    Carrega os dados para comparação entre Cotia, Itapevi, Barueri, Jandira e Taboão da Serra.
+    Carrega os dados para comparação entre municípios.
+    Args:
+        municipios (list): Municípios comparados (padrão: Cotia, Itapevi, Barueri, Jandira e Taboão da Serra)
     Returns:
-        DataFrame: Dados combinados dos cinco municípios
+        DataFrame: Dados combinados dos municípios
     """
     try:
-        # Carregar dados do Excel
-        df = pd.read_excel('data/repasses.xlsx')
-        
-        # Converter para minúsculas
-        df['municipio'] = df['municipio'].str.lower()
-        
-        # Filtrar apenas os municípios de interesse
-        municipios = ['cotia', 'itapevi', 'barueri', 'jandira', 'taboão da serra']
-        df = df[df['municipio'].isin(municipios)]
-        
-        # Otimizar tipos de dados
-        df['exercicio'] = df['exercicio'].astype('int32')
-        df['vl_pago'] = df['vl_pago'].astype('float64')
-        
-        return df
+        return _visao_municipios(versao_dados(), tuple(m.lower() for m in municipios))
     except Exception as e:
         st.error(f"Erro ao carregar dados: {str(e)}")
         return None
 
-@st.cache_data
-def get_agregacoes_principais(_df):
-    """Pré-calcula as principais agregações utilizadas."""
+def versao_municipio(municipio, anos=None):
+    """Impressão digital das partições de um único município (só dos anos pedidos, se houver)."""
+    return impressao_digital(_manifesto(), [municipio.lower()], anos)
+
+def _versao_com_entidades(municipio, anos=None):
+    """Versão do município somada à atribuição de entidades (para agregações que contam ou agrupam entidades)."""
+    return f"{versao_municipio(municipio, anos)}-{_assinatura_entidades(versao_dados(), municipio.lower())}"
+
+def _chave_filtros(anos, funcoes):
+    """Normaliza os filtros em tuplas ordenadas, para compor a chave do cache."""
+    anos = tuple(sorted(int(a) for a in anos)) if anos is not None and len(anos) > 0 else None
+    funcoes = tuple(sorted(funcoes)) if funcoes is not None and len(funcoes) > 0 else None
+    return anos, funcoes
+
+def _chave_selecao(anos, funcoes):
+    """
+    Como `_chave_filtros`, mas uma seleção vazia continua vazia (não
+    seleciona nada, como em MotorFiltros.linhas); só None é "todos".
+    """
+    anos = None if anos is None else tuple(sorted(int(a) for a in anos))
+    funcoes = None if funcoes is None else tuple(sorted(funcoes))
+    return anos, funcoes
+
+@st.cache_resource(max_entries=64)
+def _motor_filtros(versao, municipio):
+    return MotorFiltros(carregar_dados_base(municipio))
+
+def get_motor_filtros(municipio='cotia'):
+    """
+    Retorna o motor de filtros (bitmaps e índice de valores) do município,
+    construído uma vez por versão dos dados e compartilhado entre sessões.
+    """
+    return _motor_filtros(_versao_com_entidades(municipio), municipio.lower())
+
+def _linhas(municipio, anos, funcoes):
+    """Linhas do município restritas aos anos e funções (sem cópia quando não há filtro)."""
+    return get_motor_filtros(municipio).filtrar(anos, funcoes)
+
+# As funções em cache abaixo recebem `versao` apenas para compor a chave:
+# ela muda quando as partições do município (dos anos filtrados, se houver
+# filtro de ano) são regravadas, invalidando o resultado, e diferencia
+# municípios e filtros que antes colidiam em `_df`.
+
+@st.cache_resource(max_entries=1)
+def _banco(versao):
+    """Conexão DuckDB do processo, recriada quando o conjunto de partições muda."""
+    return consultas.BancoConsultas(_manifesto())
+
+def usar_sql():
+    """Indica se as consultas usam o backend SQL (DuckDB) em vez do cubo em pandas."""
+    return consultas.disponivel()
+
+@st.cache_data(max_entries=256)
+def _agregar(versao, municipio, por, anos, funcoes, com_funcoes=False, com_mediana=False, exato=False):
+    if usar_sql():
+        resultado = consultas.agregar(_banco(versao_dados()), municipio, por, anos, funcoes, com_funcoes, com_mediana, exato)
+        return resultado.round(2)
+
+    resultado = agregar_cubo(
+        carregar_cubo([municipio]),
+        por,
+        {'exercicio': anos, 'funcao_de_governo': funcoes},
+        com_funcoes=com_funcoes
+    )
+    if com_mediana and exato:
+        df = _linhas(municipio, anos, funcoes)
+        if por:
+            resultado['mediana'] = df.groupby(list(por), observed=True)['vl_pago'].median()
+        else:
+            resultado['mediana'] = df['vl_pago'].median()
+    elif com_mediana:
+        # Mediana aproximada (erro relativo <= utils.esbocos.ALFA), mesclando os esboços das células
+        grupos = combinar(_esbocos(municipio, anos), por, {'funcao_de_governo': funcoes})
+        chaves = [chave if len(por) > 1 else (chave,) for chave in resultado.index] if por else [()]
+        resultado['mediana'] = [grupos[chave].quantis.quantil(0.5) if chave in grupos else np.nan for chave in chaves]
+    return resultado.round(2)
+
+@st.cache_data(max_entries=64)
+def _agregacoes_principais(versao, municipio, anos, funcoes, exato):
+    totais = _agregar(versao, municipio, (), anos, funcoes, com_mediana=True, exato=exato).iloc[0]
     return {
-        'total_geral': _df['vl_pago'].sum(),
-        'media_geral': _df['vl_pago'].mean(),
-        'mediana_geral': _df['vl_pago'].median(),
-        'desvio_padrao': _df['vl_pago'].std(),
-        'contagem_total': len(_df),
-        'entidades_unicas': _df['razao_social'].nunique(),
-        'anos_unicos': sorted(_df['exercicio'].unique()),
-        'funcoes_unicas': sorted(_df['funcao_de_governo'].unique())
+        'total_geral': totais['soma'],
+        'media_geral': totais['media'],
+        'mediana_geral': totais['mediana'],
+        'desvio_padrao': totais['desvio_padrao'],
+        'minimo': totais['minimo'],
+        'maximo': totais['maximo'],
+        'contagem_total': int(totais['contagem']),
+        'entidades_unicas': int(totais['entidades']),
+        'anos_unicos': sorted(_agregar(versao, municipio, ('exercicio',), anos, funcoes).index),
+        'funcoes_unicas': sorted(_agregar(versao, municipio, ('funcao_de_governo',), anos, funcoes).index)
     }
 
-@st.cache_data
-def get_dados_anuais(_df):
-    """Calcula agregações por ano."""
-    return _df.groupby('exercicio').agg({
-        'vl_pago': ['count', 'sum', 'mean', 'median', 'std'],
-        'razao_social': 'nunique'
-    }).round(2)
+def get_agregacoes_principais(municipio='cotia', anos=None, funcoes=None, exato=False):
+    """Pré-calcula as principais agregações utilizadas (mediana exata só com `exato`)."""
+    anos, funcoes = _chave_filtros(anos, funcoes)
+    return _agregacoes_principais(_versao_com_entidades(municipio, anos), municipio.lower(), anos, funcoes, exato)
 
-@st.cache_data
-def get_dados_funcao(_df):
-    """Calcula agregações por função de governo."""
-    return _df.groupby('funcao_de_governo').agg({
-        'vl_pago': ['count', 'sum', 'mean', 'median', 'std'],
-        'razao_social': 'nunique'
-    }).round(2)
+def get_dados_anuais(municipio='cotia', anos=None, funcoes=None, exato=False):
+    """Calcula agregações por ano (mediana exata só com `exato`)."""
+    anos, funcoes = _chave_filtros(anos, funcoes)
+    return _agregar(_versao_com_entidades(municipio, anos), municipio.lower(), ('exercicio',), anos, funcoes, com_mediana=True, exato=exato)
 
-@st.cache_data
-def get_dados_entidade(_df, top_n=10):
-    """Calcula agregações por entidade."""
-    return _df.groupby('razao_social').agg({
-        'vl_pago': ['count', 'sum', 'mean'],
-        'funcao_de_governo': lambda x: ', '.join(set(x))
-    }).round(2).sort_values(('vl_pago', 'sum'), ascending=False).head(top_n)
+def get_dados_funcao(municipio='cotia', anos=None, funcoes=None, exato=False):
+    """Calcula agregações por função de governo (mediana exata só com `exato`)."""
+    anos, funcoes = _chave_filtros(anos, funcoes)
+    return _agregar(_versao_com_entidades(municipio, anos), municipio.lower(), ('funcao_de_governo',), anos, funcoes, com_mediana=True, exato=exato)
 
-@st.cache_data
-def filtrar_dados(_df, anos=None, funcoes=None, valor_min=None, valor_max=None):
-    """Aplica filtros aos dados."""
-    df_filtrado = _df.copy()
-    
-    if anos is not None and len(anos) > 0:
-        df_filtrado = df_filtrado[df_filtrado['exercicio'].isin(anos)]
-    
-    if funcoes is not None and len(funcoes) > 0:
-        df_filtrado = df_filtrado[df_filtrado['funcao_de_governo'].isin(funcoes)]
-    
-    if valor_min is not None and valor_max is not None:
-        df_filtrado = df_filtrado[df_filtrado['vl_pago'].between(valor_min, valor_max)]
-    
-    return df_filtrado
+@st.cache_data(max_entries=64)
+def _resumo_distribuicao(versao, municipio, anos, funcoes):
+    if usar_sql():
+        valores = consultas.valores(_banco(versao_dados()), municipio, anos, funcoes)
+    else:
+        valores = _linhas(municipio, anos, funcoes)['vl_pago'].to_numpy()
+    return resumir_distribuicao(valores)
+
+def get_resumo_distribuicao(municipio='cotia', anos=None, funcoes=None):
+    """
+    Quartis, bigodes, atípicos e histograma logarítmico de `vl_pago` (ver
+    utils.distribuicao), calculados uma vez por versão dos dados e filtro.
+    """
+    anos, funcoes = _chave_filtros(anos, funcoes)
+    return _resumo_distribuicao(versao_municipio(municipio, anos), municipio.lower(), anos, funcoes)
+
+@st.cache_data(max_entries=64)
+def _estatisticas(versao, municipio, anos, funcoes, exato):
+    if usar_sql():
+        return consultas.estatisticas(_banco(versao_dados()), municipio, anos, funcoes, exato)
+    if exato:
+        return estatisticas_exatas(_linhas(municipio, anos, funcoes))
+    grupos = combinar(_esbocos(municipio, anos), (), {'funcao_de_governo': funcoes})
+    return grupos[()].resumo() if grupos else resumo_vazio()
+
+def get_estatisticas(municipio='cotia', anos=None, funcoes=None, exato=False):
+    """
+    Estatísticas descritivas de `vl_pago`: contagem, soma, media, mediana,
+    desvio_padrao, minimo, maximo, assimetria, curtose e entidades.
+    Por padrão vêm dos esboços mescláveis (mediana e entidades aproximadas);
+    `exato=True` recalcula tudo linha a linha, para auditoria.
+    """
+    anos, funcoes = _chave_filtros(anos, funcoes)
+    versao = _versao_com_entidades(municipio, anos)
+    return _estatisticas(versao, municipio.lower(), anos, funcoes, exato)
+
+def get_dados_entidade(municipio='cotia', top_n=10, anos=None, funcoes=None):
+    """Calcula agregações por entidade (todas, se top_n for None)."""
+    anos, funcoes = _chave_filtros(anos, funcoes)
+    versao = _versao_com_entidades(municipio, anos)
+    df = _agregar(versao, municipio.lower(), ('entidade',), anos, funcoes, com_funcoes=True)
+    df = df.sort_values('soma', ascending=False)
+    return df if top_n is None else df.head(top_n)
+
+def get_arvore_funcoes(municipio='cotia', abertas=(), anos=None):
+    """
+    Totais para utils.hierarquia.figura_treemap: por função de governo e,
+    só para as funções em `abertas`, por entidade dentro da função (os
+    níveis fechados não são agregados).
+    Returns:
+        dict: Série de totais por caminho do nó pai (() é o município)
+    """
+    filhos = {(): get_dados_funcao(municipio, anos)['soma']}
+    for funcao in abertas:
+        filhos[(funcao,)] = get_dados_entidade(municipio, top_n=None, anos=anos, funcoes=[funcao])['soma']
+    return filhos
+
+def get_colunas_repasses():
+    """Colunas das linhas devolvidas por `consultar_linhas` (as que podem ordenar a página)."""
+    if usar_sql():
+        return list(_banco(versao_dados()).colunas)
+    return list(carregar_tabela_mestre()[0].columns)
+
+def consultar_linhas(municipio='cotia', anos=None, funcoes=None, valor_min=None, valor_max=None,
+                     ordem=None, ascendente=True, limite=None, deslocamento=0, busca=None):
+    """
+    Página de linhas filtradas, buscadas (ver utils.grade.buscar_texto) e
+    ordenadas, junto com o total de linhas e a soma de `vl_pago` do filtro.
+    Com o backend SQL só a página é lida do disco; sem ele, usa o motor de filtros.
+    `anos` e `funcoes` None não filtram; uma lista vazia não seleciona nada.
+    Returns:
+        tuple: (DataFrame da página, total de linhas, soma de vl_pago)
+    """
+    anos, funcoes = _chave_selecao(anos, funcoes)
+    if usar_sql():
+        banco = _banco(versao_dados())
+        df = consultas.linhas(banco, municipio, anos, funcoes, valor_min, valor_max, ordem, ascendente, limite, deslocamento, busca)
+        total, soma = consultas.contar_linhas(banco, municipio, anos, funcoes, valor_min, valor_max, busca)
+        return df, total, soma
+
+    motor = get_motor_filtros(municipio)
+    linhas = buscar_texto(motor.df, motor.linhas(anos, funcoes, valor_min, valor_max), busca)
+    posicoes = ordem_linhas(motor.df, linhas, ordem, ascendente)
+    fim = None if limite is None else deslocamento + limite
+    soma = float(motor.df['vl_pago'].to_numpy()[linhas].sum())
+    return motor.df.iloc[posicoes[deslocamento:fim]], len(posicoes), soma
+
+@st.cache_resource
+def _cache_figuras():
+    """Cache de figuras do processo, compartilhado por todas as sessões."""
+    return CacheFiguras()
+
+def figura_em_cache(grafico, construir, **parametros):
+    """
+    Figura do cache de figuras (ver utils.figuras). `construir()` só roda
+    quando a combinação (versão dos dados, gráfico, parâmetros) é nova.
+    Args:
+        grafico (str): Identificador do gráfico, único entre as páginas
+        construir (callable): Função sem argumentos que monta a go.Figure
+        **parametros: Tudo o que muda a figura além dos dados (seleções da página)
+    Returns:
+        go.Figure: Cópia da figura guardada
+    """
+    return _cache_figuras().obter(chave_figura(versao_dados(), grafico, parametros), construir)
@@ -0,0 +1,180 @@
+"""
+Resumos de distribuição para box plots e histogramas sem enviar as linhas.
+
+`resumir_distribuicao` calcula no servidor, em uma passada, os quartis, os
+bigodes (valores extremos dentro de 1,5 IQR), a lista dos pontos atípicos
+(limitada aos MAXIMO_ATIPICOS mais extremos) e um histograma com classes
+logarítmicas. As figuras usam a API de quartis pré-calculados do Plotly
+(`go.Box` com q1/median/q3), então o tamanho do JSON não depende da
+quantidade de repasses.
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+FATOR_BIGODE = 1.5
+MAXIMO_ATIPICOS = 200
+CLASSES_POR_DECADA = 5
+
+
+def resumir_distribuicao(valores, classes_por_decada=CLASSES_POR_DECADA, maximo_atipicos=MAXIMO_ATIPICOS):
+    """
+    Resumo de uma distribuição de valores.
+    Args:
+        valores (array): Valores (NaN são ignorados)
+        classes_por_decada (int): Classes do histograma por potência de 10
+        maximo_atipicos (int): Quantos pontos atípicos guardar (os mais afastados das cercas)
+    Returns:
+        dict: n, media, minimo, q1, mediana, q3, maximo, bigode_inferior,
+        bigode_superior, atipicos (lista), total_atipicos, histograma
+        ({'inicio', 'fim', 'contagem'}) e nao_positivos (fora do histograma)
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    valores = np.sort(valores[~np.isnan(valores)])
+    n = len(valores)
+    if n == 0:
+        return {
+            'n': 0, 'media': None, 'minimo': None, 'q1': None, 'mediana': None, 'q3': None, 'maximo': None,
+            'bigode_inferior': None, 'bigode_superior': None, 'atipicos': [], 'total_atipicos': 0,
+            'histograma': {'inicio': [], 'fim': [], 'contagem': []}, 'nao_positivos': 0
+        }
+
+    q1, mediana, q3 = np.quantile(valores, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    # Valores dentro das cercas ocupam valores[inicio:fim]
+    inicio = np.searchsorted(valores, q1 - FATOR_BIGODE * iqr, side='left')
+    fim = np.searchsorted(valores, q3 + FATOR_BIGODE * iqr, side='right')
+
+    # Atípicos: abaixo e acima dos bigodes, mantendo os mais afastados
+    abaixo, acima = valores[:inicio], valores[fim:]
+    atipicos = np.concatenate([abaixo, acima])
+    if len(atipicos) > maximo_atipicos:
+        distancia = np.concatenate([q1 - abaixo, acima - q3])
+        atipicos = np.sort(atipicos[np.argsort(-distancia, kind='stable')[:maximo_atipicos]])
+
+    positivos = valores[valores > 0]
+    if len(positivos):
+        primeira = np.floor(np.log10(positivos[0]) * classes_por_decada)
+        ultima = np.floor(np.log10(positivos[-1]) * classes_por_decada) + 1
+        limites = 10 ** (np.arange(primeira, ultima + 1) / classes_por_decada)
+        contagem = np.histogram(positivos, bins=limites)[0]
+    else:
+        limites, contagem = np.zeros(1), np.zeros(0, dtype=np.int64)
+
+    return {
+        'n': int(n),
+        'media': float(valores.mean()),
+        'minimo': float(valores[0]),
+        'q1': float(q1),
+        'mediana': float(mediana),
+        'q3': float(q3),
+        'maximo': float(valores[-1]),
+        'bigode_inferior': float(valores[inicio]) if inicio < fim else float(q1),
+        'bigode_superior': float(valores[fim - 1]) if inicio < fim else float(q3),
+        # Centavos bastam para o gráfico e encurtam o JSON
+        'atipicos': np.round(atipicos, 2).tolist(),
+        'total_atipicos': int(len(abaixo) + len(acima)),
+        'histograma': {
+            'inicio': limites[:-1].tolist(),
+            'fim': limites[1:].tolist(),
+            'contagem': contagem.tolist()
+        },
+        'nao_positivos': int(n - len(positivos))
+    }
+
+
+def figura_caixas(caixas, pontos=None, titulo=None, log=False):
+    """
+    Box plot a partir de quartis pré-calculados.
+    Args:
+        caixas (DataFrame): Uma linha por caixa (o índice é o rótulo), com q1,
+            mediana, q3, bigode_inferior, bigode_superior e, opcionalmente, media
+        pontos (DataFrame): Pontos avulsos (atípicos), com rotulo, valor e,
+            opcionalmente, texto (mostrado ao passar o mouse)
+        titulo (str): Título do gráfico
+        log (bool): Eixo dos valores em escala logarítmica
+    Returns:
+        go.Figure: Figura com um traço de caixas e um de pontos
+    """
+    figura = go.Figure()
+    figura.add_trace(go.Box(
+        x=caixas.index.astype(str),
+        q1=caixas['q1'],
+        median=caixas['mediana'],
+        q3=caixas['q3'],
+        lowerfence=caixas['bigode_inferior'],
+        upperfence=caixas['bigode_superior'],
+        mean=caixas['media'] if 'media' in caixas else None,
+        name='Distribuição',
+        boxpoints=False
+    ))
+    if pontos is not None and len(pontos):
+        texto = pontos['texto'] if 'texto' in pontos else None
+        figura.add_trace(go.Scatter(
+            x=pontos['rotulo'].astype(str),
+            y=pontos['valor'],
+            mode='markers',
+            name='Atípicos',
+            text=texto,
+            hovertemplate=("%{text}<br>" if texto is not None else "") + "Valor: R$ %{y:,.2f}<extra></extra>"
+        ))
+    figura.update_layout(
+        title=titulo,
+        yaxis=dict(
+            title='Valor (R$, escala log)' if log else 'Valor (R$)',
+            type='log' if log else 'linear',
+            tickformat=None if log else ',.2f',
+            tickprefix='R$ '
+        )
+    )
+    return figura
+
+
+def figura_resumos(resumos, titulo=None, log=False):
+    """
+    Box plot de um ou mais resumos de `resumir_distribuicao`.
+    Args:
+        resumos (dict): Resumo por rótulo da caixa (resumos vazios são ignorados)
+    """
+    resumos = {rotulo: r for rotulo, r in resumos.items() if r['n']}
+    caixas = pd.DataFrame.from_dict(resumos, orient='index')
+    pontos = pd.DataFrame(
+        [(rotulo, valor) for rotulo, r in resumos.items() for valor in r['atipicos']],
+        columns=['rotulo', 'valor']
+    )
+    figura = figura_caixas(caixas, pontos, titulo, log)
+    omitidos = sum(r['total_atipicos'] - len(r['atipicos']) for r in resumos.values())
+    if omitidos:
+        figura.add_annotation(
+            text=f"{omitidos} pontos atípicos menos extremos omitidos",
+            xref='paper', yref='paper', x=1, y=1.05, showarrow=False
+        )
+    return figura
+
+
+def figura_histograma(resumo, titulo=None):
+    """Histograma com classes logarítmicas (eixo x em escala log) de um resumo."""
+    histograma = resumo['histograma']
+    # Degraus: cada classe vai de `inicio` a `fim`, com a altura da contagem
+    x = histograma['inicio'] + histograma['fim'][-1:]
+    y = histograma['contagem'] + histograma['contagem'][-1:]
+    figura = go.Figure(go.Scatter(
+        x=x,
+        y=y,
+        mode='lines',
+        line_shape='hv',
+        fill='tozeroy',
+        name='Repasses',
+        hovertemplate="A partir de R$ %{x:,.2f}: %{y} repasses<extra></extra>"
+    ))
+    figura.update_layout(
+        title=titulo,
+        xaxis=dict(title='Valor (R$, escala log)', type='log', tickprefix='R$ '),
+        yaxis=dict(title='Quantidade de repasses')
+    )
+    if resumo['nao_positivos']:
+        figura.add_annotation(
+            text=f"{resumo['nao_positivos']} repasses com valor zero ou negativo fora do eixo",
+            xref='paper', yref='paper', x=1, y=1.05, showarrow=False
+        )
+    return figura
@@ -0,0 +1,244 @@
+"""
+Resolução de entidades beneficiadas.
+
+A mesma organização aparece com grafias diferentes de `razao_social`
+(acentos, pontuação, abreviações). Cada par distinto (razao_social, cnpj)
+recebe um identificador de entidade `id_entidade` e um nome canônico
+`entidade`, unindo (union-find) os pares que:
+1. têm a mesma raiz de CNPJ (8 primeiros dígitos: matriz e filiais);
+2. têm o mesmo nome normalizado (sem acentos, pontuação e preposições,
+   com abreviações expandidas);
+3. têm nomes muito parecidos dentro de um mesmo bloco e terminam com o
+   mesmo token: cada nome entra nos blocos dos seus TOKENS_BLOCO tokens
+   mais raros, e só nomes de um mesmo bloco são comparados (custo
+   subquadrático).
+Os critérios 2 e 3 nunca unem grupos com raízes de CNPJ diferentes, então o
+critério 3 só decide quando ao menos um dos lados não tem CNPJ. Nesses
+nomes a última palavra costuma ser o que distingue duas entidades ("EE PROF
+JOAO SILVA" e "EE PROF JOAO SILVEIRA" passam do limiar de similaridade),
+por isso ela precisa coincidir.
+"""
+import hashlib
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+from utils.cubo import _codificar
+
+# Similaridade mínima (SequenceMatcher) entre nomes normalizados do mesmo bloco
+LIMIAR_SIMILARIDADE = 0.93
+
+# Quantidade de tokens (os mais raros) que definem os blocos de cada nome
+TOKENS_BLOCO = 2
+
+_ABREVIACOES = {
+    'ASSOC': 'ASSOCIACAO',
+    'ASSOCIACOES': 'ASSOCIACAO',
+    'INST': 'INSTITUTO',
+    'SOC': 'SOCIEDADE',
+    'FUND': 'FUNDACAO',
+    'BENEF': 'BENEFICENTE',
+    'ESC': 'ESCOLA',
+    'EST': 'ESTADUAL',
+    'PROF': 'PROFESSOR',
+    'PROFA': 'PROFESSORA',
+    'DR': 'DOUTOR',
+    'STA': 'SANTA',
+    'STO': 'SANTO',
+    'N': 'NOSSA',
+    'SRA': 'SENHORA'
+}
+_IRRELEVANTES = {'A', 'O', 'AS', 'OS', 'DA', 'DE', 'DO', 'DAS', 'DOS', 'E', 'LTDA', 'ME', 'EPP', 'EIRELI'}
+
+
+def normalizar_nome(nome):
+    """
+    Chave de comparação do nome de uma entidade.
+    Exemplos:
+    'A.P.M. da E.E. Prof. José' -> 'APM EE PROFESSOR JOSE'
+    'Assoc. Beneficente São Camilo' -> 'ASSOCIACAO BENEFICENTE SAO CAMILO'
+    """
+    if nome is None or (isinstance(nome, float) and np.isnan(nome)):
+        return ''
+    texto = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode('ascii').upper()
+    # Siglas com pontos ("A.P.M.") viram um token só; os demais pontos separam palavras
+    texto = re.sub(r'(?<=\b[A-Z])\.(?=[A-Z]\b)', '', texto)
+    tokens = _juntar_letras(re.sub(r'[^A-Z0-9]+', ' ', texto).split())
+    return ' '.join(_ABREVIACOES.get(t, t) for t in tokens if t not in _IRRELEVANTES)
+
+
+def _juntar_letras(tokens):
+    """Junta sequências de duas ou mais letras soltas ("A P M" -> "APM")."""
+    resultado, sigla = [], []
+    for token in tokens + ['']:
+        if len(token) == 1 and token.isalpha():
+            sigla.append(token)
+            continue
+        if len(sigla) > 1:
+            resultado.append(''.join(sigla))
+        else:
+            resultado.extend(sigla)
+        sigla = []
+        if token:
+            resultado.append(token)
+    return resultado
+
+
+def raiz_cnpj(cnpj):
+    """Oito primeiros dígitos do CNPJ (identificam a organização), ou None."""
+    if cnpj is None or (isinstance(cnpj, float) and np.isnan(cnpj)):
+        return None
+    digitos = re.sub(r'\D', '', str(cnpj))
+    return digitos[:8] if len(digitos) >= 8 else None
+
+
+class _UniaoBusca:
+    """Union-find que recusa unir grupos com raízes de CNPJ diferentes."""
+
+    def __init__(self, raizes):
+        self.pai = list(range(len(raizes)))
+        self.raiz_grupo = list(raizes)
+
+    def encontrar(self, i):
+        while self.pai[i] != i:
+            self.pai[i] = self.pai[self.pai[i]]
+            i = self.pai[i]
+        return i
+
+    def unir(self, a, b):
+        a, b = self.encontrar(a), self.encontrar(b)
+        if a == b:
+            return
+        raiz_a, raiz_b = self.raiz_grupo[a], self.raiz_grupo[b]
+        if raiz_a is not None and raiz_b is not None and raiz_a != raiz_b:
+            return
+        a, b = min(a, b), max(a, b)
+        self.pai[b] = a
+        self.raiz_grupo[a] = raiz_a if raiz_a is not None else raiz_b
+
+
+def resolver_entidades(pares):
+    """
+    Agrupa os pares (razao_social, cnpj) em entidades.
+    Args:
+        pares (DataFrame): razao_social, cnpj e linhas (quantidade de repasses
+            de cada par, usada para escolher o nome canônico), sem repetição
+    Returns:
+        tuple: (ids, nomes) - `ids` alinhado às linhas de `pares` e `nomes`
+        com o nome canônico de cada id, em ordem alfabética (nomes[id])
+    """
+    n = len(pares)
+    if n == 0:
+        return np.zeros(0, dtype=np.int32), pd.Index([], dtype=object)
+
+    # Ordem determinística, independente da ordem de entrada
+    ordem = np.lexsort((pares['cnpj'].astype('string').fillna('').to_numpy(),
+                        pares['razao_social'].astype('string').fillna('').to_numpy()))
+    razoes = pares['razao_social'].to_numpy(dtype=object)[ordem]
+    linhas = pares['linhas'].to_numpy()[ordem]
+    chaves = [normalizar_nome(r) for r in razoes]
+    raizes = [raiz_cnpj(c) for c in pares['cnpj'].to_numpy(dtype=object)[ordem]]
+    uniao = _UniaoBusca(raizes)
+
+    # 1 e 2: mesma raiz de CNPJ ou mesmo nome normalizado
+    for valores in (raizes, chaves):
+        primeiro = {}
+        for i, valor in enumerate(valores):
+            if valor:
+                uniao.unir(primeiro.setdefault(valor, i), i)
+
+    # 3: nomes parecidos que compartilham um dos tokens mais raros
+    frequencia = {}
+    for chave in set(chaves):
+        for token in set(chave.split()):
+            frequencia[token] = frequencia.get(token, 0) + 1
+    blocos = {}
+    for chave in sorted(set(chaves)):
+        for token in sorted(set(chave.split()), key=lambda t: (frequencia[t], t))[:TOKENS_BLOCO]:
+            blocos.setdefault(token, []).append(chave)
+    indice_chave = {}
+    for i, chave in enumerate(chaves):
+        indice_chave.setdefault(chave, i)
+    comparados = set()
+    for bloco in blocos.values():
+        for posicao, a in enumerate(bloco):
+            for b in bloco[posicao + 1:]:
+                if (a, b) in comparados:
+                    continue
+                comparados.add((a, b))
+                if a.rsplit(' ', 1)[-1] != b.rsplit(' ', 1)[-1]:
+                    continue
+                if SequenceMatcher(None, a, b, autojunk=False).ratio() >= LIMIAR_SIMILARIDADE:
+                    uniao.unir(indice_chave[a], indice_chave[b])
+
+    grupos = np.array([uniao.encontrar(i) for i in range(n)])
+
+    # Nome canônico: a grafia preenchida com mais repasses no grupo (empate: a mais longa, depois alfabética)
+    tabela = pd.DataFrame({
+        'grupo': grupos,
+        'razao_social': pd.Series(razoes, dtype=object).fillna('').astype(str),
+        'linhas': linhas
+    })
+    tabela['tamanho'] = tabela['razao_social'].str.len()
+    tabela['vazio'] = tabela['tamanho'] == 0
+    canonicos = (
+        tabela.sort_values(['grupo', 'vazio', 'linhas', 'tamanho', 'razao_social'],
+                           ascending=[True, True, False, False, True])
+        .drop_duplicates('grupo')
+        .set_index('grupo')['razao_social']
+    )
+    # Grupos sem nome algum ficam sem entidade (id -1, categoria nula)
+    canonicos = canonicos[canonicos != '']
+
+    # Grupos distintos com o mesmo nome canônico são diferenciados pela raiz do CNPJ
+    repetidos = canonicos.duplicated(keep=False)
+    if repetidos.any():
+        sufixos = pd.Series([uniao.raiz_grupo[g] or str(g) for g in canonicos.index], index=canonicos.index)
+        canonicos[repetidos] = canonicos[repetidos] + ' (' + sufixos[repetidos] + ')'
+
+    nomes = pd.Index(canonicos.sort_values().to_numpy(), dtype=object)
+    id_grupo = pd.Series(nomes.get_indexer(canonicos.to_numpy()), index=canonicos.index)
+
+    ids = np.empty(n, dtype=np.int32)
+    ids[ordem] = id_grupo.reindex(grupos, fill_value=-1).to_numpy()
+    return ids, nomes
+
+
+def aplicar_entidades(df):
+    """
+    Acrescenta `id_entidade` (int32, -1 sem nome) e `entidade` (categórica, com código igual ao id).
+    Args:
+        df (DataFrame): Repasses com razao_social e cnpj
+    Returns:
+        DataFrame: O mesmo DataFrame com as novas colunas
+    """
+    codigos_razao, razoes = _codificar(df['razao_social'])
+    codigos_cnpj, cnpjs = _codificar(df['cnpj'])
+
+    # Par (razão, CNPJ) como um inteiro; o código -1 (nulo) passa a 0, que é None
+    base = len(cnpjs) + 1
+    codigos_par = (codigos_razao.astype(np.int64) + 1) * base + (codigos_cnpj.astype(np.int64) + 1)
+    unicos, inversa = np.unique(codigos_par, return_inverse=True)
+    inversa = inversa.ravel()
+    razoes = np.concatenate([[None], np.asarray(razoes, dtype=object)])
+    cnpjs = np.concatenate([[None], np.asarray(cnpjs, dtype=object)])
+    pares = pd.DataFrame({
+        'razao_social': razoes[unicos // base],
+        'cnpj': cnpjs[unicos % base],
+        'linhas': np.bincount(inversa, minlength=len(unicos))
+    })
+
+    ids, nomes = resolver_entidades(pares)
+    df['id_entidade'] = ids[inversa]
+    df['entidade'] = pd.Categorical.from_codes(ids[inversa], nomes)
+    return df
+
+
+def assinatura_entidades(df):
+    """Identificador da atribuição de entidades das linhas (muda quando algum par muda de entidade ou de nome)."""
+    trincas = df[['razao_social', 'cnpj', 'entidade']].drop_duplicates()
+    hashes = np.sort(pd.util.hash_pandas_object(trincas, index=False).to_numpy())
+    return hashlib.sha1(hashes.tobytes()).hexdigest()[:8]
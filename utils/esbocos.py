@@ -0,0 +1,296 @@
+"""
+Esboços (sketches) mescláveis das estatísticas de `vl_pago`.
+
+Cada célula (município, exercício, função de governo) guarda um resumo de
+tamanho limitado, calculado uma vez por partição:
+- HyperLogLog das entidades distintas (erro relativo ~1,6% com 2^12 registradores,
+  quase exato para poucas entidades);
+- histograma logarítmico de `vl_pago` (como no DDSketch) para quantis, com
+  erro relativo de no máximo ALFA;
+- contagem, soma, mínimo, máximo e momentos centrais até a quarta ordem,
+  para média, desvio padrão, assimetria e curtose (exatos, a menos de
+  arredondamento).
+Qualquer combinação de filtros sobre essas dimensões é respondida mesclando
+as células, sem voltar às linhas.
+"""
+import numpy as np
+import pandas as pd
+
+DIMENSOES_ESBOCO = ['municipio', 'exercicio', 'funcao_de_governo']
+
+# Erro relativo máximo dos quantis
+ALFA = 0.005
+
+# Registradores do HyperLogLog: 2^PRECISAO_HLL
+PRECISAO_HLL = 12
+
+_GAMA = (1 + ALFA) / (1 - ALFA)
+_LOG_GAMA = np.log(_GAMA)
+
+
+class HyperLogLog:
+    """Contagem aproximada de distintos a partir de hashes de 64 bits."""
+
+    def __init__(self, registradores=None):
+        self.registradores = (
+            np.zeros(1 << PRECISAO_HLL, dtype=np.uint8) if registradores is None else registradores
+        )
+
+    @classmethod
+    def de_hashes(cls, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        esboco = cls()
+        if len(hashes) == 0:
+            return esboco
+        bits_restantes = 64 - PRECISAO_HLL
+        indices = (hashes >> np.uint64(bits_restantes)).astype(np.int64)
+        resto = hashes & np.uint64((1 << bits_restantes) - 1)
+        # Posição do primeiro bit 1 (1 = bit mais significativo do resto); frexp dá o bit_length
+        _, tamanho_bits = np.frexp(resto.astype(np.float64))
+        posicoes = (bits_restantes - tamanho_bits + 1).astype(np.uint8)
+        np.maximum.at(esboco.registradores, indices, posicoes)
+        return esboco
+
+    def mesclar(self, outro):
+        return HyperLogLog(np.maximum(self.registradores, outro.registradores))
+
+    def estimar(self):
+        m = len(self.registradores)
+        estimativa = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registradores.astype(np.int64)))
+        vazios = int(np.count_nonzero(self.registradores == 0))
+        if estimativa <= 2.5 * m and vazios:
+            # Contagem linear, mais precisa para cardinalidades pequenas
+            estimativa = m * np.log(m / vazios)
+        return float(estimativa)
+
+
+class EsbocoQuantis:
+    """Histograma com baldes de largura logarítmica; quantis com erro relativo ALFA."""
+
+    def __init__(self, positivos=None, negativos=None, zeros=0):
+        vazio = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        self.positivos = vazio if positivos is None else positivos
+        self.negativos = vazio if negativos is None else negativos
+        self.zeros = zeros
+
+    @staticmethod
+    def _baldes(valores):
+        indices = np.ceil(np.log(valores) / _LOG_GAMA).astype(np.int64)
+        return tuple(np.unique(indices, return_counts=True))
+
+    @staticmethod
+    def _somar(a, b):
+        indices, inversa = np.unique(np.concatenate([a[0], b[0]]), return_inverse=True)
+        contagens = np.bincount(inversa, weights=np.concatenate([a[1], b[1]]), minlength=len(indices))
+        return indices, contagens.astype(np.int64)
+
+    @classmethod
+    def de_valores(cls, valores):
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        return cls(
+            cls._baldes(valores[valores > 0]),
+            cls._baldes(-valores[valores < 0]),
+            int(np.count_nonzero(valores == 0))
+        )
+
+    def mesclar(self, outro):
+        return EsbocoQuantis(
+            self._somar(self.positivos, outro.positivos),
+            self._somar(self.negativos, outro.negativos),
+            self.zeros + outro.zeros
+        )
+
+    def quantil(self, q):
+        """
+        Quantil q (0 a 1), interpolando entre os postos vizinhos como a
+        interpolação 'linear' do pandas (a mediana de uma quantidade par de
+        valores é a média dos dois centrais, como em Series.median()).
+        """
+        total = int(self.negativos[1].sum() + self.zeros + self.positivos[1].sum())
+        if total == 0:
+            return np.nan
+        posicao = q * (total - 1)
+        postos = np.array([np.floor(posicao), np.ceil(posicao)], dtype=np.int64)
+        representante = lambda indices: 2 * _GAMA ** indices / (_GAMA + 1)
+
+        # Negativos do maior módulo para o menor, depois zeros, depois positivos
+        contagens = np.concatenate([self.negativos[1][::-1], [self.zeros], self.positivos[1]])
+        valores = np.concatenate([-representante(self.negativos[0][::-1]), [0.0], representante(self.positivos[0])])
+        inferior, superior = valores[np.searchsorted(np.cumsum(contagens), postos, side='right')]
+        return float(inferior + (posicao - postos[0]) * (superior - inferior))
+
+
+class Momentos:
+    """Contagem, soma, extremos e momentos centrais (M2 a M4), mescláveis (Pébay, 2008)."""
+
+    def __init__(self, n=0, soma=0.0, media=0.0, m2=0.0, m3=0.0, m4=0.0, minimo=np.nan, maximo=np.nan):
+        self.n, self.soma, self.media = n, soma, media
+        self.m2, self.m3, self.m4 = m2, m3, m4
+        self.minimo, self.maximo = minimo, maximo
+
+    @classmethod
+    def de_valores(cls, valores):
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return cls()
+        media = valores.mean()
+        desvios = valores - media
+        quadrados = desvios * desvios
+        return cls(
+            len(valores), float(valores.sum()), float(media),
+            float(quadrados.sum()), float((quadrados * desvios).sum()), float((quadrados * quadrados).sum()),
+            float(valores.min()), float(valores.max())
+        )
+
+    def mesclar(self, outro):
+        if outro.n == 0:
+            return self
+        if self.n == 0:
+            return outro
+        na, nb = self.n, outro.n
+        n = na + nb
+        d = outro.media - self.media
+        d2 = d * d
+        m2 = self.m2 + outro.m2 + d2 * na * nb / n
+        m3 = (self.m3 + outro.m3 + d * d2 * na * nb * (na - nb) / n ** 2
+              + 3 * d * (na * outro.m2 - nb * self.m2) / n)
+        m4 = (self.m4 + outro.m4 + d2 * d2 * na * nb * (na * na - na * nb + nb * nb) / n ** 3
+              + 6 * d2 * (na * na * outro.m2 + nb * nb * self.m2) / n ** 2
+              + 4 * d * (na * outro.m3 - nb * self.m3) / n)
+        return Momentos(
+            n, self.soma + outro.soma, self.media + d * nb / n, m2, m3, m4,
+            min(self.minimo, outro.minimo), max(self.maximo, outro.maximo)
+        )
+
+    def desvio_padrao(self):
+        return float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else np.nan
+
+    def assimetria(self):
+        """Assimetria amostral ajustada, como `Series.skew()`."""
+        n = self.n
+        if n < 3:
+            return np.nan
+        if self.m2 == 0:
+            return 0.0
+        g1 = np.sqrt(n) * self.m3 / self.m2 ** 1.5
+        return float(g1 * np.sqrt(n * (n - 1)) / (n - 2))
+
+    def curtose(self):
+        """Curtose em excesso, amostral ajustada, como `Series.kurtosis()`."""
+        n = self.n
+        if n < 4:
+            return np.nan
+        if self.m2 == 0:
+            return 0.0
+        return float(
+            (n + 1) * n * (n - 1) * self.m4 / (self.m2 ** 2 * (n - 2) * (n - 3))
+            - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+        )
+
+
+class EsbocoValores:
+    """Esboço completo de uma célula: momentos, quantis e entidades distintas."""
+
+    def __init__(self, momentos, quantis, entidades):
+        self.momentos, self.quantis, self.entidades = momentos, quantis, entidades
+
+    @classmethod
+    def de_linhas(cls, valores, hashes_entidades):
+        return cls(Momentos.de_valores(valores), EsbocoQuantis.de_valores(valores), HyperLogLog.de_hashes(hashes_entidades))
+
+    def mesclar(self, outro):
+        return EsbocoValores(
+            self.momentos.mesclar(outro.momentos),
+            self.quantis.mesclar(outro.quantis),
+            self.entidades.mesclar(outro.entidades)
+        )
+
+    def resumo(self):
+        """Mesmas estatísticas de `estatisticas_exatas`, estimadas pelo esboço."""
+        momentos = self.momentos
+        return pd.Series({
+            'contagem': momentos.n,
+            'soma': momentos.soma,
+            'media': momentos.media if momentos.n else np.nan,
+            'mediana': self.quantis.quantil(0.5),
+            'desvio_padrao': momentos.desvio_padrao(),
+            'minimo': momentos.minimo,
+            'maximo': momentos.maximo,
+            'assimetria': momentos.assimetria(),
+            'curtose': momentos.curtose(),
+            'entidades': round(self.entidades.estimar())
+        })
+
+
+def _hashes_entidades(df):
+    """Hash de 64 bits de cada entidade (pelo nome, estável entre processos); nulos ficam de fora."""
+    entidades = df['entidade']
+    if isinstance(entidades.dtype, pd.CategoricalDtype):
+        codigos = entidades.cat.codes.to_numpy()
+        hashes = pd.util.hash_array(np.asarray(entidades.cat.categories, dtype=object))
+        return np.where(codigos >= 0, hashes[codigos], 0), codigos >= 0
+    validos = entidades.notna().to_numpy()
+    return pd.util.hash_array(entidades.fillna('').to_numpy(dtype=object)), validos
+
+
+def construir_esbocos(df):
+    """
+    Esboços de cada célula (município, exercício, função de governo).
+    Args:
+        df (DataFrame): Repasses com as colunas de DIMENSOES_ESBOCO, `vl_pago` e `entidade`
+    Returns:
+        dict: EsbocoValores por tupla de DIMENSOES_ESBOCO
+    """
+    valores = df['vl_pago'].to_numpy(dtype=np.float64)
+    hashes, validos = _hashes_entidades(df)
+    return {
+        chave: EsbocoValores.de_linhas(valores[posicoes], hashes[posicoes][validos[posicoes]])
+        for chave, posicoes in df.groupby(DIMENSOES_ESBOCO, observed=True, sort=True).indices.items()
+    }
+
+
+def combinar(esbocos, por=(), filtros=None):
+    """
+    Mescla as células pelas dimensões pedidas.
+    Args:
+        esbocos (dict): Resultado de `construir_esbocos` (ou a união de vários)
+        por (tuple): Dimensões de DIMENSOES_ESBOCO do resultado (vazio para o total)
+        filtros (dict): Valores aceitos por dimensão (None ou vazio não filtra)
+    Returns:
+        dict: EsbocoValores por tupla dos valores de `por` (() para o total)
+    """
+    posicoes_por = [DIMENSOES_ESBOCO.index(d) for d in por]
+    aceitos = [
+        (DIMENSOES_ESBOCO.index(d), set(valores))
+        for d, valores in (filtros or {}).items() if valores is not None and len(valores) > 0
+    ]
+    grupos = {}
+    for chave, esboco in esbocos.items():
+        if any(chave[i] not in valores for i, valores in aceitos):
+            continue
+        grupo = tuple(chave[i] for i in posicoes_por)
+        grupos[grupo] = grupos[grupo].mesclar(esboco) if grupo in grupos else esboco
+    return grupos
+
+
+def resumo_vazio():
+    return EsbocoValores(Momentos(), EsbocoQuantis(), HyperLogLog()).resumo()
+
+
+def estatisticas_exatas(df):
+    """Estatísticas de `EsbocoValores.resumo`, calculadas linha a linha (auditoria)."""
+    valores = df['vl_pago']
+    return pd.Series({
+        'contagem': len(valores),
+        'soma': valores.sum(),
+        'media': valores.mean(),
+        'mediana': valores.median(),
+        'desvio_padrao': valores.std(),
+        'minimo': valores.min(),
+        'maximo': valores.max(),
+        'assimetria': valores.skew(),
+        'curtose': valores.kurtosis(),
+        'entidades': df['entidade'].nunique()
+    })
@@ -0,0 +1,125 @@
+"""
+Esquema de tipos compactos da tabela de repasses.
+
+Colunas de texto com poucos valores distintos viram pandas Categorical, de
+modo que groupby e isin operam sobre códigos inteiros. A função de governo
+usa o domínio fixo da Portaria MOG nº 42/1999, garantindo códigos estáveis
+entre partições e sessões.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+# Funções de governo na ordem dos códigos oficiais (01 a 28)
+FUNCOES_DE_GOVERNO = (
+    'Legislativa',
+    'Judiciária',
+    'Essencial à Justiça',
+    'Administração',
+    'Defesa Nacional',
+    'Segurança Pública',
+    'Relações Exteriores',
+    'Assistência Social',
+    'Previdência Social',
+    'Saúde',
+    'Trabalho',
+    'Educação',
+    'Cultura',
+    'Direitos da Cidadania',
+    'Urbanismo',
+    'Habitação',
+    'Saneamento',
+    'Gestão Ambiental',
+    'Ciência e Tecnologia',
+    'Agricultura',
+    'Organização Agrária',
+    'Indústria',
+    'Comércio e Serviços',
+    'Comunicações',
+    'Energia',
+    'Transporte',
+    'Desporto e Lazer',
+    'Encargos Especiais'
+)
+
+TIPOS_NUMERICOS = {
+    'exercicio': 'int16',
+    'codigo_ibge': 'int32',
+    'id_entidade': 'int32',
+    'vl_pago': 'float64'
+}
+
+# 'category' sem domínio fixo: as categorias são os valores observados, ordenados
+TIPOS_CATEGORICOS = {
+    'municipio': 'category',
+    'razao_social': 'category',
+    'entidade': 'category',
+    'cnpj': 'category',
+    'funcao_de_governo': CategoricalDtype(FUNCOES_DE_GOVERNO),
+    'repasse': 'category',
+    'orgao': 'category',
+    'uo': 'category',
+    'ug': 'category',
+    'tipo_de_repasse': 'category',
+    'fonte_de_recursos': 'category',
+    'classificacao': 'category'
+}
+
+
+def aplicar_tipos_numericos(df):
+    """Converte as colunas numéricas para os tipos do esquema, validando a faixa."""
+    for coluna, tipo in TIPOS_NUMERICOS.items():
+        if coluna not in df:
+            continue
+        if np.issubdtype(np.dtype(tipo), np.integer) and len(df):
+            limites = np.iinfo(tipo)
+            if df[coluna].min() < limites.min or df[coluna].max() > limites.max:
+                raise ValueError(f"Valores de '{coluna}' não cabem em {tipo}")
+        df[coluna] = df[coluna].astype(tipo)
+    return df
+
+
+def aplicar_esquema(df):
+    """
+    Aplica o esquema completo (numéricos e categóricos) ao DataFrame.
+    Args:
+        df (DataFrame): Repasses normalizados, com colunas de texto
+    Returns:
+        DataFrame: O mesmo DataFrame com os tipos compactos
+    Raises:
+        ValueError: Se algum valor não pertencer ao domínio de uma coluna categórica
+    """
+    aplicar_tipos_numericos(df)
+    for coluna, tipo in TIPOS_CATEGORICOS.items():
+        if coluna not in df:
+            continue
+        original = df[coluna]
+        convertido = original.astype(tipo)
+        # Valores fora do domínio viram NaN silenciosamente no astype
+        invalidos = original[convertido.isna() & original.notna()]
+        if len(invalidos):
+            raise ValueError(
+                f"Valores fora do domínio em '{coluna}': {', '.join(sorted(map(str, invalidos.unique())))}"
+            )
+        df[coluna] = convertido
+    return df
+
+
+def uso_memoria(df):
+    """Retorna o uso de memória (em bytes) de cada coluna, contando o conteúdo dos textos."""
+    return df.memory_usage(deep=True, index=False)
+
+
+def relatorio_memoria(antes, depois):
+    """
+    Compara o uso de memória por coluna antes e depois da aplicação do esquema.
+    Args:
+        antes (Series): Resultado de `uso_memoria` antes da conversão
+        depois (Series): Resultado de `uso_memoria` depois da conversão
+    Returns:
+        DataFrame: Bytes antes, depois e redução percentual, com linha de total
+    """
+    relatorio = pd.DataFrame({'antes': antes, 'depois': depois})
+    relatorio.loc['total'] = relatorio.sum()
+    relatorio['reducao_%'] = (1 - relatorio['depois'] / relatorio['antes']).mul(100).round(1)
+    return relatorio
@@ -0,0 +1,82 @@
+"""
+Cache LRU de figuras Plotly serializadas.
+
+As páginas montam os gráficos a cada interação, mesmo quando nem os dados
+nem os parâmetros do gráfico mudaram. O cache guarda o JSON de cada figura
+pela chave (versão dos dados, identificador do gráfico, parâmetros) e, num
+acerto, só reconstrói o objeto a partir do JSON, sem validar de novo os
+atributos (a figura já foi validada ao ser montada). O total guardado é
+limitado a `limite_bytes`; as figuras usadas há mais tempo saem primeiro.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+import plotly.graph_objects as go
+
+# Limite padrão do cache (tamanho do JSON das figuras)
+LIMITE_BYTES = 64 * 1024 * 1024
+
+
+def chave_figura(versao, grafico, parametros=None):
+    """Chave do cache: os parâmetros viram um JSON canônico (ordem das chaves fixa)."""
+    return versao, grafico, json.dumps(parametros or {}, sort_keys=True, default=str)
+
+
+class CacheFiguras:
+    """Figuras serializadas por chave, com despejo LRU ao passar de `limite_bytes`."""
+
+    def __init__(self, limite_bytes=LIMITE_BYTES):
+        self.limite_bytes = limite_bytes
+        self.bytes_usados = 0
+        self.acertos = 0
+        self.faltas = 0
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def _buscar(self, chave):
+        with self._trava:
+            texto = self._itens.get(chave)
+            if texto is None:
+                self.faltas += 1
+            else:
+                self.acertos += 1
+                self._itens.move_to_end(chave)
+            return texto
+
+    def _guardar(self, chave, texto):
+        tamanho = len(texto)
+        if tamanho > self.limite_bytes:
+            return
+        with self._trava:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self.bytes_usados -= len(anterior)
+            self._itens[chave] = texto
+            self.bytes_usados += tamanho
+            while self.bytes_usados > self.limite_bytes:
+                _, removido = self._itens.popitem(last=False)
+                self.bytes_usados -= len(removido)
+
+    def obter(self, chave, construir):
+        """
+        Figura da chave, montada com `construir()` só se ainda não estiver no cache.
+        Args:
+            chave (tuple): Resultado de `chave_figura`
+            construir (callable): Função sem argumentos que devolve a go.Figure
+        Returns:
+            go.Figure: Uma cópia independente (pode ser alterada sem afetar o cache)
+        """
+        texto = self._buscar(chave)
+        if texto is None:
+            texto = construir().to_json()
+            self._guardar(chave, texto)
+        return go.Figure(json.loads(texto), _validate=False)
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+            self.bytes_usados = 0
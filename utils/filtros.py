@@ -0,0 +1,93 @@
+"""
+Motor de filtros por ano, função de governo e faixa de valor.
+
+Os índices são calculados uma única vez por conjunto de dados:
+- um bitmap (np.packbits) de linhas para cada ano e para cada função;
+- as posições das linhas ordenadas por `vl_pago`, para buscas de faixa.
+
+Um filtro devolve posições de linhas; o DataFrame só é materializado
+(com `iloc`) para as linhas que forem de fato exibidas.
+"""
+import numpy as np
+import pandas as pd
+
+
+class MotorFiltros:
+    """Índices pré-calculados para filtrar um DataFrame de repasses."""
+
+    def __init__(self, df):
+        self.df = df
+        self.total = len(df)
+
+        self.anos, self._codigo_ano = np.unique(df['exercicio'].to_numpy(), return_inverse=True)
+        funcoes = df['funcao_de_governo']
+        if not isinstance(funcoes.dtype, pd.CategoricalDtype):
+            funcoes = funcoes.astype('category')
+        self.funcoes = funcoes.cat.categories
+        self._codigo_funcao = funcoes.cat.codes.to_numpy()
+
+        self._bitmaps_ano = [np.packbits(self._codigo_ano == i) for i in range(len(self.anos))]
+        self._bitmaps_funcao = [np.packbits(self._codigo_funcao == i) for i in range(len(self.funcoes))]
+
+        valores = df['vl_pago'].to_numpy()
+        self._ordem_valor = np.argsort(valores, kind='stable')
+        self._valores_ordenados = valores[self._ordem_valor]
+
+    def _permitidos(self, dominio, selecao):
+        """Máscara booleana sobre o domínio, ou None se a seleção não restringe nada."""
+        if selecao is None:
+            return None
+        permitidos = pd.Index(dominio).isin(list(selecao))
+        return None if permitidos.all() else permitidos
+
+    def _bitmap(self, anos_permitidos, funcoes_permitidas):
+        """Interseção (AND) das uniões (OR) de bitmaps de anos e de funções."""
+        resultado = None
+        for permitidos, bitmaps in ((anos_permitidos, self._bitmaps_ano), (funcoes_permitidas, self._bitmaps_funcao)):
+            if permitidos is None:
+                continue
+            uniao = np.zeros((self.total + 7) // 8, dtype=np.uint8)
+            for indice in np.flatnonzero(permitidos):
+                uniao |= bitmaps[indice]
+            resultado = uniao if resultado is None else resultado & uniao
+        return resultado
+
+    def linhas(self, anos=None, funcoes=None, valor_min=None, valor_max=None):
+        """
+        Posições (em ordem crescente) das linhas que atendem a todos os filtros.
+        Args:
+            anos (list): Anos aceitos (None para todos; vazio para nenhum)
+            funcoes (list): Funções de governo aceitas (None para todas; vazio para nenhuma)
+            valor_min (float): Limite inferior de `vl_pago`, inclusivo
+            valor_max (float): Limite superior de `vl_pago`, inclusivo
+        Returns:
+            ndarray: Posições das linhas no DataFrame original
+        """
+        anos_permitidos = self._permitidos(self.anos, anos)
+        funcoes_permitidas = self._permitidos(self.funcoes, funcoes)
+
+        inicio = 0 if valor_min is None else np.searchsorted(self._valores_ordenados, valor_min, side='left')
+        fim = self.total if valor_max is None else np.searchsorted(self._valores_ordenados, valor_max, side='right')
+
+        if inicio == 0 and fim == self.total:
+            bitmap = self._bitmap(anos_permitidos, funcoes_permitidas)
+            if bitmap is None:
+                return np.arange(self.total)
+            return np.flatnonzero(np.unpackbits(bitmap, count=self.total))
+
+        # Faixa de valor: parte das linhas da faixa (O(linhas na faixa)) e
+        # confere ano e função pelos códigos de cada uma
+        candidatas = self._ordem_valor[inicio:fim]
+        if anos_permitidos is not None:
+            candidatas = candidatas[anos_permitidos[self._codigo_ano[candidatas]]]
+        if funcoes_permitidas is not None:
+            codigos = self._codigo_funcao[candidatas]
+            candidatas = candidatas[(codigos >= 0) & funcoes_permitidas[codigos]]
+        return np.sort(candidatas)
+
+    def filtrar(self, anos=None, funcoes=None, valor_min=None, valor_max=None):
+        """Aplica os filtros e devolve o DataFrame (o próprio, sem cópia, se nada for filtrado)."""
+        linhas = self.linhas(anos, funcoes, valor_min, valor_max)
+        if len(linhas) == self.total:
+            return self.df
+        return self.df.iloc[linhas]
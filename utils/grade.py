@@ -0,0 +1,71 @@
+"""
+Grade paginada para a visualização de dados brutos.
+
+Busca e ordenação acontecem no servidor sobre posições de linhas (como as
+devolvidas por MotorFiltros.linhas); apenas as linhas da página visível são
+copiadas, formatadas e enviadas ao navegador (ver
+utils.data_manager.consultar_linhas).
+"""
+import numpy as np
+import pandas as pd
+
+COLUNAS_BUSCA = ('razao_social', 'cnpj', 'funcao_de_governo', 'descricao')
+
+
+def buscar_texto(df, linhas, termo, colunas=COLUNAS_BUSCA):
+    """
+    Mantém as linhas em que alguma das colunas contém o termo (sem diferenciar maiúsculas).
+    Em colunas categóricas a busca é feita nas categorias e aplicada pelos códigos.
+    Args:
+        df (DataFrame): Dados completos
+        linhas (ndarray): Posições candidatas
+        termo (str): Texto buscado
+    Returns:
+        ndarray: Posições que contêm o termo
+    """
+    termo = (termo or '').strip()
+    if not termo:
+        return linhas
+
+    mascara = np.zeros(len(linhas), dtype=bool)
+    for coluna in colunas:
+        if coluna not in df:
+            continue
+        serie = df[coluna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            categorias = serie.cat.categories
+            encontrados = np.flatnonzero(categorias.str.contains(termo, case=False, regex=False))
+            mascara |= np.isin(serie.cat.codes.to_numpy()[linhas], encontrados)
+        else:
+            contem = serie.iloc[linhas].astype('string').str.contains(termo, case=False, regex=False)
+            mascara |= contem.fillna(False).to_numpy(dtype=bool)
+    return linhas[mascara]
+
+
+def ordem_linhas(df, linhas, coluna=None, ascendente=True):
+    """
+    Ordena as posições pela coluna pedida (ordenação estável).
+    Textos, categóricos ou não, seguem a ordem alfabética dos valores (e não
+    a ordem das categorias), com os nulos por último nos dois sentidos, como
+    o ORDER BY do backend SQL (utils.consultas.linhas).
+    """
+    if coluna is None:
+        return linhas
+    serie = df[coluna]
+    if pd.api.types.is_numeric_dtype(serie) and not isinstance(serie.dtype, pd.CategoricalDtype):
+        valores = serie.to_numpy()[linhas]
+        return linhas[np.argsort(valores if ascendente else -valores, kind='stable')]
+
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Posto alfabético de cada categoria, aplicado pelos códigos
+        postos = np.argsort(np.argsort(serie.cat.categories.astype(str).to_numpy(), kind='stable'))
+        codigos = serie.cat.codes.to_numpy()[linhas]
+        valores = np.where(codigos >= 0, postos[np.maximum(codigos, 0)], -1)
+    else:
+        valores = pd.factorize(serie.iloc[linhas], sort=True)[0]
+    chave = np.where(valores < 0, np.iinfo(np.int64).max, valores if ascendente else -valores.astype(np.int64))
+    return linhas[np.argsort(chave, kind='stable')]
+
+
+def total_paginas(total_linhas, tamanho):
+    return max(1, -(-total_linhas // tamanho))
@@ -0,0 +1,81 @@
+"""
+Treemaps a partir de totais pré-agregados.
+
+`px.treemap` recebe as linhas, agrupa no Python e embute os dados de cada
+linha na figura. Aqui cada nível chega já somado (um total por município,
+função ou entidade) e só os nós que a página decidiu abrir ganham filhos,
+então o custo de montar a figura e o tamanho do JSON dependem da
+quantidade de nós mostrados, e não da quantidade de repasses. Nós com
+muitos filhos mostram os MAXIMO_FILHOS maiores e um nó "Demais" com o
+restante.
+"""
+import pandas as pd
+import plotly.graph_objects as go
+
+MAXIMO_FILHOS = 20
+
+_SEPARADOR = '\x1f'
+
+
+def nos_treemap(filhos, raiz, maximo_filhos=MAXIMO_FILHOS):
+    """
+    Nós (id, rótulo, pai, valor) de um treemap com valores totais por ramo.
+    Filhos com total zero ou negativo (estornos) ficam de fora.
+    Args:
+        filhos (dict): Série de totais dos filhos (índice = rótulo) por
+            caminho do nó pai, em tupla: () são os filhos da raiz,
+            ('Saúde',) os de 'Saúde' e assim por diante. Nós sem entrada
+            ficam fechados (folhas)
+        raiz (str): Rótulo do nó raiz
+        maximo_filhos (int): Filhos mostrados por nó aberto
+    Returns:
+        DataFrame: id, rotulo, pai e valor, com a raiz na primeira linha
+    """
+    nos = []
+    identificador = lambda caminho: _SEPARADOR.join((raiz,) + caminho)
+
+    def abrir(caminho, total_pai):
+        totais = filhos[caminho].sort_values(ascending=False, kind='stable')
+        totais = totais[totais > 0]
+        mostrados = totais.iloc[:maximo_filhos]
+        restante = float(totais.iloc[maximo_filhos:].sum())
+        soma = 0.0
+        for rotulo, valor in mostrados.items():
+            filho = caminho + (str(rotulo),)
+            valor = abrir(filho, float(valor)) if filho in filhos else float(valor)
+            nos.append((identificador(filho), str(rotulo), identificador(caminho), valor))
+            soma += valor
+        if restante > 0:
+            rotulo = f"Demais ({len(totais) - maximo_filhos})"
+            nos.append((identificador(caminho + (rotulo,)), rotulo, identificador(caminho), restante))
+            soma += restante
+        # O valor do pai é a soma dos filhos, como exige branchvalues='total'
+        return soma if total_pai is None else max(soma, total_pai)
+
+    total = abrir((), None) if () in filhos else 0.0
+    nos.insert(0, (raiz, raiz, '', total))
+    return pd.DataFrame(nos, columns=['id', 'rotulo', 'pai', 'valor'])
+
+
+def figura_treemap(filhos, raiz, titulo=None, maximo_filhos=MAXIMO_FILHOS):
+    """
+    Treemap dos totais de `nos_treemap`, com valor e participação no total.
+    Args:
+        filhos (dict): Ver `nos_treemap`
+        raiz (str): Rótulo do nó raiz
+        titulo (str): Título do gráfico
+    Returns:
+        go.Figure: Figura com um único traço go.Treemap
+    """
+    nos = nos_treemap(filhos, raiz, maximo_filhos)
+    figura = go.Figure(go.Treemap(
+        ids=nos['id'],
+        labels=nos['rotulo'],
+        parents=nos['pai'],
+        values=nos['valor'],
+        branchvalues='total',
+        texttemplate="%{label}<br>R$ %{value:,.2f}",
+        hovertemplate="%{label}<br>Total: R$ %{value:,.2f}<br>%{percentRoot:.1%} do total<extra></extra>"
+    ))
+    figura.update_layout(title=titulo)
+    return figura
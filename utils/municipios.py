@@ -0,0 +1,55 @@
+"""
+Nomes de exibição e cores dos municípios.
+
+No cache os municípios ficam em minúsculas ('taboão da serra',
+'vargem_grande_paulista'); as páginas mostram o nome próprio, e cada
+município tem sempre a mesma cor em todos os gráficos.
+"""
+import zlib
+
+# Seleção padrão da página de comparação
+MUNICIPIOS_COMPARACAO = ('cotia', 'itapevi', 'barueri', 'jandira', 'taboão da serra')
+
+_PREPOSICOES = {'da', 'das', 'de', 'do', 'dos', 'e'}
+
+
+def nome_exibicao(municipio):
+    """
+    Nome do município para exibição.
+    Exemplos:
+    'taboão da serra' -> 'Taboão da Serra'
+    'vargem_grande_paulista' -> 'Vargem Grande Paulista'
+    """
+    palavras = municipio.replace('_', ' ').split()
+    return ' '.join(
+        palavra if i > 0 and palavra in _PREPOSICOES else palavra.capitalize()
+        for i, palavra in enumerate(palavras)
+    )
+
+
+# Cor de cada município, a mesma em todos os gráficos
+CORES_MUNICIPIOS = {
+    'cotia': 'blue',
+    'itapevi': 'red',
+    'barueri': 'yellow',
+    'jandira': 'green',
+    'taboão da serra': 'purple'
+}
+
+# Demais municípios: cor fixa escolhida pelo nome, independente da seleção
+_PALETA = (
+    '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f',
+    '#bcbd22', '#17becf', '#393b79', '#637939', '#8c6d31', '#843c39', '#7b4173', '#3182bd'
+)
+
+
+def cor_municipio(municipio):
+    """Cor do município nos gráficos."""
+    if municipio in CORES_MUNICIPIOS:
+        return CORES_MUNICIPIOS[municipio]
+    return _PALETA[zlib.crc32(municipio.encode('utf-8')) % len(_PALETA)]
+
+
+def mapa_cores(municipios):
+    """`color_discrete_map` do Plotly, pelos nomes de exibição."""
+    return {nome_exibicao(m): cor_municipio(m) for m in municipios}
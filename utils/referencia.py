@@ -0,0 +1,108 @@
+"""
+Tabelas de referência locais: população municipal (IBGE) e IPCA.
+
+Os arquivos CSV em data/referencia/ acompanham o projeto, sem acesso à rede:
+- populacao.csv: população dos Censos 2010 e 2022 por código IBGE; os
+  anos intermediários são interpolados linearmente e os posteriores ao
+  último censo repetem o último valor;
+- ipca.csv: variação anual do IPCA (dezembro a dezembro, em %).
+
+`enriquecer` acrescenta aos repasses os valores reais (a preços de
+dezembro do último ano do IPCA), por habitante e reais por habitante.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+ARQUIVO_POPULACAO = 'data/referencia/populacao.csv'
+ARQUIVO_IPCA = 'data/referencia/ipca.csv'
+
+COLUNAS_ENRIQUECIDAS = ('vl_pago_real', 'vl_pago_per_capita', 'vl_pago_real_per_capita')
+
+
+def assinatura_referencias(caminhos=(ARQUIVO_POPULACAO, ARQUIVO_IPCA)):
+    """Identificador do conteúdo das tabelas de referência (muda quando algum arquivo muda)."""
+    sha = hashlib.sha1()
+    for caminho in caminhos:
+        try:
+            with open(caminho, 'rb') as arquivo:
+                sha.update(arquivo.read())
+        except FileNotFoundError:
+            sha.update(b'ausente')
+    return sha.hexdigest()[:8]
+
+
+def carregar_populacao(caminho=ARQUIVO_POPULACAO):
+    return pd.read_csv(caminho, dtype={'codigo_ibge': 'int64', 'ano': 'int64', 'populacao': 'float64'})
+
+
+def carregar_ipca(caminho=ARQUIVO_IPCA):
+    return pd.read_csv(caminho, dtype={'ano': 'int64', 'variacao_pct': 'float64'})
+
+
+def populacao_por_ano(populacao, anos):
+    """
+    População estimada de cada município em cada ano pedido.
+    Args:
+        populacao (DataFrame): codigo_ibge, ano e populacao (anos de censo)
+        anos (list): Anos desejados
+    Returns:
+        Series: População indexada por (codigo_ibge, ano)
+    """
+    anos = np.asarray(sorted(set(int(a) for a in anos)), dtype=np.int64)
+    partes = []
+    for codigo, grupo in populacao.sort_values('ano').groupby('codigo_ibge', sort=True):
+        # np.interp mantém o primeiro/último valor fora do intervalo dos censos
+        valores = np.interp(anos, grupo['ano'].to_numpy(), grupo['populacao'].to_numpy())
+        partes.append(pd.DataFrame({'codigo_ibge': codigo, 'ano': anos, 'populacao': np.round(valores)}))
+    if not partes:
+        return pd.Series(dtype='float64', index=pd.MultiIndex.from_arrays([[], []], names=['codigo_ibge', 'ano']))
+    return pd.concat(partes).set_index(['codigo_ibge', 'ano'])['populacao']
+
+
+def fatores_ipca(ipca, ano_base=None):
+    """
+    Fator que leva valores de cada ano a preços de dezembro de `ano_base`.
+    Args:
+        ipca (DataFrame): ano e variacao_pct (dezembro a dezembro)
+        ano_base (int): Ano de referência (padrão: último ano da tabela)
+    Returns:
+        Series: Fator multiplicativo indexado pelo ano
+    """
+    variacao = ipca.set_index('ano')['variacao_pct'].sort_index()
+    indice = (1 + variacao / 100).cumprod()
+    ano_base = int(variacao.index.max()) if ano_base is None else int(ano_base)
+    return (indice[ano_base] / indice).rename('fator')
+
+
+def enriquecer(df, populacao=None, ipca=None, ano_base=None):
+    """
+    Acrescenta as colunas de COLUNAS_ENRIQUECIDAS, calculadas de forma vetorizada.
+    Anos sem IPCA ou municípios sem população ficam com NaN.
+    Args:
+        df (DataFrame): Repasses com codigo_ibge, exercicio e vl_pago
+        populacao (DataFrame): Tabela de população (padrão: ARQUIVO_POPULACAO)
+        ipca (DataFrame): Tabela do IPCA (padrão: ARQUIVO_IPCA)
+        ano_base (int): Ano de referência dos valores reais
+    Returns:
+        DataFrame: O mesmo DataFrame com as novas colunas
+    """
+    populacao = carregar_populacao() if populacao is None else populacao
+    ipca = carregar_ipca() if ipca is None else ipca
+
+    exercicio = df['exercicio'].to_numpy().astype(np.int64)
+    anos, posicao = np.unique(exercicio, return_inverse=True)
+
+    fator = fatores_ipca(ipca, ano_base).reindex(anos).to_numpy()[posicao]
+
+    # Consulta a população só dos pares (município, ano) distintos
+    codigos = df['codigo_ibge'].to_numpy().astype(np.int64)
+    pares, inversa = np.unique(np.stack([codigos, exercicio]), axis=1, return_inverse=True)
+    habitantes = populacao_por_ano(populacao, anos).reindex(pd.MultiIndex.from_arrays(pares)).to_numpy()[inversa.ravel()]
+
+    valores = df['vl_pago'].to_numpy()
+    df['vl_pago_real'] = valores * fator
+    df['vl_pago_per_capita'] = valores / habitantes
+    df['vl_pago_real_per_capita'] = df['vl_pago_real'].to_numpy() / habitantes
+    return df